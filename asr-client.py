@@ -0,0 +1,123 @@
+"""
+asr-server.py 用のテストクライアント
+
+ローカルの WAV ファイルを実時間（または最大速度）で再生するようにサーバへ送り、
+複数のセッションを同時に張って負荷試験を行う。
+
+使い方:
+    python asr-client.py a.wav b.wav [--sessions 8] [--fast]
+"""
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+import audio_io
+import stream_protocol as proto
+from resampler import StreamingResampler, TARGET_SAMPLE_RATE
+from metrics import percentile
+
+HOST = '127.0.0.1'
+PORT = 8765
+# 1回に送るサンプル数（16kHz で 0.128 秒）
+CHUNK = 2048
+
+
+def pcm_chunks(wavfile, chunk_size):
+    """
+    WAV ファイルを 16kHz・モノラル・16ビット PCM のチャンクにして返す
+    """
+    with audio_io.open_wav(wavfile) as wav:
+        chunks = wav.chunks(chunk_size)
+        if wav.rate != TARGET_SAMPLE_RATE or wav.channels > 1:
+            chunks = StreamingResampler(wav.rate, TARGET_SAMPLE_RATE).resample_chunks(chunks, chunk_size)
+        for _, chunk in chunks:
+            yield np.clip(chunk * 32768.0, -32768, 32767).astype('<i2').tobytes()
+
+
+async def run_session(index, wavfile, host, port, realtime, chunk_size):
+    """1セッション分の送受信を行い、結果を辞書で返す"""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(proto.pack_json(proto.START, {'rate': TARGET_SAMPLE_RATE}))
+    latencies = []
+    result = {'client': index, 'file': wavfile}
+
+    async def receive():
+        while True:
+            kind, payload = await proto.read_frame(reader)
+            if kind is None:
+                result.setdefault('error', 'connection closed')
+                return
+            message = json.loads(payload)
+            if kind == proto.PARTIAL:
+                latencies.append(message['latency_ms'])
+            elif kind == proto.FINAL:
+                result['text'] = message['text']
+                result['server_metrics'] = message['metrics']
+                return
+            elif kind == proto.ERROR:
+                result['error'] = message['error']
+                return
+
+    receiver = asyncio.create_task(receive())
+    start = time.monotonic()
+    sent = 0
+    for pcm in pcm_chunks(wavfile, chunk_size):
+        if receiver.done():
+            break
+        if realtime:
+            # 実時間で再生した場合の送信時刻まで待つ
+            delay = start + sent / TARGET_SAMPLE_RATE - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        writer.write(proto.pack_frame(proto.AUDIO, pcm))
+        # サーバが背圧をかけている間はここで待たされる
+        await writer.drain()
+        sent += len(pcm) // 2
+    if not receiver.done():
+        writer.write(proto.pack_frame(proto.END))
+        await writer.drain()
+    await receiver
+    writer.close()
+
+    elapsed = time.monotonic() - start
+    result['audio_seconds'] = round(sent / TARGET_SAMPLE_RATE, 3)
+    result['elapsed'] = round(elapsed, 3)
+    result['latency_p50_ms'] = percentile(latencies, 50)
+    result['latency_p95_ms'] = percentile(latencies, 95)
+    return result
+
+
+async def run(files, sessions, host, port, realtime, chunk_size):
+    tasks = [run_session(i, files[i % len(files)], host, port, realtime, chunk_size) for i in range(sessions)]
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="音声認識サーバのテストクライアント")
+    parser.add_argument('files', nargs='+', help="送信する WAV ファイル（セッションに順番に割り当てる）")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('-n', '--sessions', type=int, default=1, help="同時に張るセッション数")
+    parser.add_argument('--fast', action='store_true', help="実時間で待たずに最大速度で送信する")
+    parser.add_argument('--chunk', type=int, default=CHUNK, help="1回に送るサンプル数")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.files, args.sessions, args.host, args.port, not args.fast, args.chunk))
+    p95 = []
+    errors = 0
+    for result in results:
+        if isinstance(result, Exception):
+            errors += 1
+            print(json.dumps({'error': f"{type(result).__name__}: {result}"}, ensure_ascii=False))
+            continue
+        if 'error' in result:
+            errors += 1
+        else:
+            p95.append(result['latency_p95_ms'])
+        print(json.dumps(result, ensure_ascii=False))
+    print(f"セッション数: {len(results)}, エラー: {errors}, 遅延 p95 の最大: {max(p95, default=0.0):.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
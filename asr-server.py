@@ -0,0 +1,210 @@
+"""
+複数の音声ストリームを1つのモデルで同時に文字起こしする asyncio サーバ
+
+プロトコルは stream_protocol.py を参照。テスト用のクライアントは asr-client.py。
+
+使い方:
+    python asr-server.py [--host 127.0.0.1] [--port 8765] [--max-sessions 8]
+"""
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import numpy as np
+import asr_config
+import stream_protocol as proto
+from audio_io import PCMConverter
+from asr_session import StreamSession, fork_speech2text
+from inference_thread import InferenceThread, MAX_GROUP, MAX_WAIT
+from metrics import percentile
+
+HOST = '127.0.0.1'
+PORT = 8765
+RATE = 16000
+# 同時に受け付けるセッション数の上限
+MAX_SESSIONS = 8
+# セッションごとに溜めておける未処理のチャンク数（超えると受信を止めてクライアントを待たせる）
+QUEUE_CHUNKS = 32
+# デコードが遅れているときに1回にまとめて処理するチャンク数の上限
+MAX_MERGE_CHUNKS = 8
+# 全体の統計を表示する間隔（秒）
+STATS_INTERVAL = 30
+
+
+class ASRServer:
+    """
+    セッションごとにデコーダの状態を持ち、モデルの重みは全セッションで共有する
+    ・推論は専用のスレッドで実行し、イベントループを止めない
+    ・複数セッションのデコード要求は InferenceThread でまとめて受け取り、1件ずつ順に実行する
+    ・セッションの受信キューが満杯になると、そのセッションのソケットからの読み込みを止める（背圧）
+    """
+
+    def __init__(self, speech2text, max_sessions=MAX_SESSIONS, queue_chunks=QUEUE_CHUNKS,
+                 max_group=MAX_GROUP, max_wait=MAX_WAIT):
+        self.base = speech2text
+        self.max_sessions = max_sessions
+        self.queue_chunks = queue_chunks
+        self.inference = InferenceThread(max_group=max_group, max_wait=max_wait)
+        self.sessions = {}
+        self._ids = itertools.count(1)
+        self.rejected = 0
+        self.completed = 0
+
+    async def handle(self, reader, writer):
+        """1接続 = 1セッションとして処理する"""
+        peer = writer.get_extra_info('peername')
+        if len(self.sessions) >= self.max_sessions:
+            self.rejected += 1
+            print(f"セッション数の上限 ({self.max_sessions}) に達したため接続を拒否しました: {peer}")
+            writer.write(proto.pack_json(proto.ERROR, {'error': 'too many sessions'}))
+            await writer.drain()
+            writer.close()
+            return
+
+        session = StreamSession(next(self._ids), fork_speech2text(self.base), rate=RATE)
+        self.sessions[session.id] = session
+        print(f"セッション {session.id} を開始しました: {peer} (同時接続数 {len(self.sessions)})")
+        queue = asyncio.Queue(maxsize=self.queue_chunks)
+        decoder = asyncio.create_task(self._decode_loop(session, queue, writer))
+        try:
+            while not decoder.done():
+                kind, payload = await proto.read_frame(reader)
+                if kind is None or kind == proto.END:
+                    break
+                if kind == proto.START:
+                    options = json.loads(payload) if payload else {}
+                    if options.get('rate', RATE) != RATE:
+                        raise proto.ProtocolError(f"サンプリングレートは {RATE}Hz のみ対応しています")
+                elif kind == proto.AUDIO:
+                    if len(payload) % 2:
+                        raise proto.ProtocolError("PCM データの長さが奇数です")
+                    # キューが満杯の間はここで待つため、ソケットからの読み込みも止まる
+                    await self._put(queue, (time.monotonic(), payload), decoder)
+                else:
+                    raise proto.ProtocolError(f"不明なフレーム種別です: {kind!r}")
+            await self._put(queue, None, decoder)
+            # デコードが例外で終わっていればここで送出される
+            await decoder
+        except (proto.ProtocolError, ValueError) as e:
+            print(f"セッション {session.id} でプロトコルエラーが発生しました: {e}")
+            self._send_error(writer, str(e))
+        except ConnectionError as e:
+            print(f"セッション {session.id} の接続が切れました: {e}")
+        except Exception as e:
+            print(f"セッション {session.id} のデコード中にエラーが発生しました: {type(e).__name__}: {e}")
+            self._send_error(writer, f"decode failed: {type(e).__name__}: {e}")
+        finally:
+            decoder.cancel()
+            self.sessions.pop(session.id, None)
+            self.completed += 1
+            print(f"セッション {session.id} を終了しました: {json.dumps(session.metrics(), ensure_ascii=False)}")
+            writer.close()
+
+    @staticmethod
+    async def _put(queue, item, decoder):
+        """
+        キューに入れる（満杯なら空くまで待つ）
+        ・待っている間にデコードのタスクが終わった場合（例外を含む）は入れずに戻る。
+          キューを読む側がいないまま待ち続けて、セッションが残り続けないようにする
+        """
+        if decoder.done():
+            return False
+        put = asyncio.ensure_future(queue.put(item))
+        await asyncio.wait({put, decoder}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            return False
+        return True
+
+    @staticmethod
+    def _send_error(writer, message):
+        """エラーのフレームを送る（接続が切れていれば何もしない）"""
+        try:
+            writer.write(proto.pack_json(proto.ERROR, {'error': message}))
+        except (ConnectionError, RuntimeError):
+            pass
+
+    async def _decode_loop(self, session, queue, writer):
+        """受信したチャンクを順にデコードして結果を返す"""
+        # float32 への変換バッファはセッションごとに一度だけ確保して使い回す
+        # （次のチャンクの変換はデコードの完了を待ってから行うので、上書きされることはない）
+        converter = PCMConverter()
+        while True:
+            item = await queue.get()
+            if item is None:
+                text = await self.inference.decode(session, np.zeros(0, dtype=np.float32), True)
+                writer.write(proto.pack_json(proto.FINAL, {'text': text, 'metrics': session.metrics()}))
+                await writer.drain()
+                return
+
+            # デコードが遅れて溜まっている分はまとめて1回で処理する
+            received, payload = item
+            payloads = [payload]
+            end = False
+            while not queue.empty() and len(payloads) < MAX_MERGE_CHUNKS:
+                nxt = queue.get_nowait()
+                if nxt is None:
+                    end = True
+                    break
+                payloads.append(nxt[1])
+            speech = converter.convert_bytes(payloads[0] if len(payloads) == 1 else b''.join(payloads))
+
+            text = await self.inference.decode(session, speech, end)
+            latency = time.monotonic() - received
+            session.record_latency(latency)
+            if end:
+                writer.write(proto.pack_json(proto.FINAL, {'text': text, 'metrics': session.metrics()}))
+                await writer.drain()
+                return
+            writer.write(proto.pack_json(proto.PARTIAL, {'text': text, 'latency_ms': round(latency * 1000, 2)}))
+            await writer.drain()
+
+    async def report_loop(self, interval=STATS_INTERVAL):
+        """全体の統計を定期的に表示する"""
+        while True:
+            await asyncio.sleep(interval)
+            latencies = [x for s in self.sessions.values() for x in s.latencies]
+            print(f"[統計] 同時接続 {len(self.sessions)}, 完了 {self.completed}, 拒否 {self.rejected},"
+                  f" 遅延 p50={percentile(latencies, 50) * 1000:.1f}ms p95={percentile(latencies, 95) * 1000:.1f}ms,"
+                  f" {self.inference.report()}")
+
+
+async def serve(host, port, max_sessions, queue_chunks, max_group, max_wait, config=None):
+    print("ASRモデルをロード中...")
+    speech2text = asr_config.load_speech2text(config)
+    server = ASRServer(speech2text, max_sessions=max_sessions, queue_chunks=queue_chunks,
+                       max_group=max_group, max_wait=max_wait)
+    tcp = await asyncio.start_server(server.handle, host, port)
+    print(f"音声認識サーバを起動しました: {host}:{port} (最大 {max_sessions} セッション)")
+    reporter = asyncio.create_task(server.report_loop())
+    try:
+        async with tcp:
+            await tcp.serve_forever()
+    finally:
+        reporter.cancel()
+        server.inference.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="複数ストリーム対応の音声認識サーバ")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--max-sessions', type=int, default=MAX_SESSIONS, help="同時セッション数の上限")
+    parser.add_argument('--queue-chunks', type=int, default=QUEUE_CHUNKS,
+                        help="セッションごとの未処理チャンク数の上限（背圧の閾値）")
+    parser.add_argument('--max-group', type=int, default=MAX_GROUP,
+                        help="推論スレッドが1ステップでまとめて受け取るデコード要求数の上限")
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT * 1000,
+                        help="まとめて受け取るために他のセッションの要求を待つ最大時間（ミリ秒）")
+    asr_config.add_arguments(parser)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_sessions, args.queue_chunks,
+                          args.max_group, args.max_wait_ms / 1000, asr_config.from_args(args)))
+    except KeyboardInterrupt:
+        print("\n音声認識サーバを終了しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,20 @@
-import sys
-import wave
+import json
+import argparse
 import numpy as np
 import time
 import os
-from espnet_model_zoo.downloader import ModelDownloader
-from espnet2.bin.asr_inference_streaming import Speech2TextStreaming
+import asr_config
+import chunking
+import instrumentation
 from transformers import pipeline
+import audio_io
+from audio_io import PCMConverter
+from renderer import TranscriptRenderer, QUIET
+from resampler import StreamingResampler, TARGET_SAMPLE_RATE
+from transcript import TranscriptState, format_time
+from chunked_summary import ChunkedSummarizer
+from vad import EnergyVAD, Endpointer
+import result_cache
 
 # ASRモデルのタグ
 tag = 'eml914/streaming_conformer_asr_csj'
@@ -13,45 +22,57 @@ tag = 'eml914/streaming_conformer_asr_csj'
 audio_file = "./output.wav"
 # 要約する間隔（秒）
 SUMMARY_INTERVAL = 30  # 30秒ごとに要約
+# 要約モデル
+SUMMARY_MODEL = "sshleifer/distilbart-cnn-6-6"
 # 要約の最大長と最小長
 MAX_SUMMARY_LENGTH = 100
 MIN_SUMMARY_LENGTH = 30
-# 処理する最大時間（秒）- テスト用
-MAX_DURATION = 60  # 60秒間だけ処理する
-
-# モデルのセットアップ
-print("ASRモデルをロード中...")
-d = ModelDownloader()
-speech2text = Speech2TextStreaming(
-    **d.download_and_unpack(tag),
-    token_type=None,
-    bpemodel=None,
-    maxlenratio=0.0,
-    minlenratio=0.0,
-    beam_size=20,
-    ctc_weight=0.5,
-    lm_weight=0.0,
-    penalty=0.0,
-    nbest=1,
-    device="cuda",  # CPUを使用
-    disable_repetition_detection=True,
-    decoder_text_length_limit=0,
-    encoded_feat_length_limit=0
-)
-print(f"デバイスを CPU に設定しました")
-
-# 要約モデルのセットアップ
-print("要約モデルをロード中...")
-try:
-    # より小さいモデルを使用
-    summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-6-6")
-    print("要約モデルのロードが完了しました")
-except Exception as e:
-    print(f"要約モデルのロード中にエラーが発生しました: {e}")
-    raise
-
-# 出力用の変数
-prev_lines = 0
+# 要約に失敗した場合に表示する文
+SUMMARY_ERROR = "要約中にエラーが発生しました。"
+# 要約モデルに一度に渡すウィンドウの数
+SUMMARY_BATCH_SIZE = 4
+# 処理する最大時間（秒）- None の場合は最後まで処理する
+MAX_DURATION = None
+# チェックポイントを保存する間隔（音声の秒数）
+CHECKPOINT_INTERVAL = 300
+# 無音のチャンクをデコードせずに読み飛ばすかどうか
+USE_VAD = True
+
+# ASRモデル（起動時に推論の設定に従ってロードする）
+speech2text = None
+
+# 要約モデル（load_summarizer() でロードする）
+chunked_summarizer = None
+
+
+def load_summarizer():
+    """
+    要約モデルをロードする（ロード済みの場合はそれを返す）
+    ・結果のキャッシュに要約まである場合はロードしないで済むよう、起動時ではなく必要になってからロードする
+    """
+    global chunked_summarizer
+    if chunked_summarizer is not None:
+        return chunked_summarizer
+    print("要約モデルをロード中...")
+    try:
+        # より小さいモデルを使用
+        summarizer = pipeline("summarization", model=SUMMARY_MODEL)
+        # 長い文字起こしはモデルの入力長に収まるウィンドウに分けて要約し、要約どうしをさらに要約する
+        chunked_summarizer = ChunkedSummarizer(summarizer, max_length=MAX_SUMMARY_LENGTH,
+                                               min_length=MIN_SUMMARY_LENGTH, batch_size=SUMMARY_BATCH_SIZE)
+        print("要約モデルのロードが完了しました")
+    except Exception as e:
+        print(f"要約モデルのロード中にエラーが発生しました: {e}")
+        raise
+    return chunked_summarizer
+
+
+def summary_options():
+    """
+    結果のキャッシュに要約と一緒に保存する要約の設定（変わっていたら要約し直す）
+    """
+    return {'model': SUMMARY_MODEL, 'max_length': MAX_SUMMARY_LENGTH, 'min_length': MIN_SUMMARY_LENGTH}
+
 # 要約用のバッファ
 transcript_buffer = ""
 # 最後に要約した時間
@@ -59,203 +80,343 @@ last_summary_time = time.time()
 # 要約結果
 current_summary = "まだ要約はありません。"
 
-def progress_output(text, is_summary=False):
+def summary_units(transcript):
     """
-    推論中の進捗を表示する
-    ・50文字ごとに改行を挿入
-    ・進捗を表示するために、前の行を上書きする
+    要約に渡す文字起こし（確定した発話ごとのテキストと、現在の発話の途中結果）
     """
-    global prev_lines
-
-    # 要約の場合は特別な表示
-    if is_summary:
-        sys.stderr.write("\n\n=== 要約 ===\n")
-        lines = ['']
-        for i in text:
-            if len(lines[-1]) > 50:
-                lines.append('')
-            lines[-1] += i
-        for line in lines:
-            sys.stderr.write(line + "\n")
-        sys.stderr.write("===========\n\n")
-        sys.stderr.flush()
-        return
-
-    # 通常の文字起こし表示
-    lines = ['']
-    for i in text:
-        if len(lines[-1]) > 50:
-            lines.append('')
-        lines[-1] += i
-    for i, line in enumerate(lines):
-        if i == prev_lines:
-            sys.stderr.write('\n\r')
-        else:
-            sys.stderr.write('\r\033[B\033[K')
-        sys.stderr.write(line)
+    return [segment.text for segment in transcript.segments] + [transcript.partial]
 
-    prev_lines = len(lines)
-    sys.stderr.flush()
-
-def summarize_text(text):
+def summarize_text(units):
     """
-    テキストを要約する
+    文字起こし全体を要約する
+    ・units は発話ごとのテキストのリスト（前回までに要約したウィンドウはキャッシュから使う）
+    ・要約に失敗した場合は None を返す（前回の要約を残し、エラーの表示を結果として保存しないため）
     """
-    if len(text.strip()) < 50:  # テキストが短すぎる場合は要約しない
+    if len("".join(units).strip()) < 50:  # テキストが短すぎる場合は要約しない
         return "テキストが短すぎるため、要約できません。"
 
+    load_summarizer()
     try:
         # テキストを要約（英語で出力されます）
-        summary = summarizer(text, max_length=MAX_SUMMARY_LENGTH, min_length=MIN_SUMMARY_LENGTH, do_sample=False)
-        return f"※英語での要約結果:\n{summary[0]['summary_text']}"
+        return f"※英語での要約結果:\n{chunked_summarizer.summarize(units)}"
     except Exception as e:
         print(f"要約中にエラーが発生しました: {e}")
 
-def recognize_and_summarize(wavfile):
+def load_checkpoint(path, wavfile, nframes):
+    """
+    チェックポイントを読み込む
+    ・別のファイル（パスまたはフレーム数が異なる）のチェックポイントは無視する
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            ckpt = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"チェックポイントの読み込みに失敗したため最初から処理します: {e}")
+        return None
+    if ckpt.get('file') != os.path.abspath(wavfile) or ckpt.get('nframes') != nframes:
+        print("チェックポイントが別の音声ファイルのものなので無視します")
+        return None
+    return ckpt
+
+
+def save_checkpoint(path, state):
+    """
+    チェックポイントを保存する
+    ・一時ファイルに書き込んでから置き換えるため、書き込み中に落ちても壊れない
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def recognize_and_summarize(wavfile, max_duration=MAX_DURATION, checkpoint_path=None,
+                            checkpoint_interval=CHECKPOINT_INTERVAL, resume=True, use_vad=USE_VAD,
+                            chunk=None, quiet=QUIET, cache=None, cache_key=None):
     """
     音声ファイルを読み込んで、ASR推論と要約を行う
+    ・音声はファイルからチャンク単位で読み込むため、長さに上限はない
+    ・checkpoint_interval 秒が過ぎた後の最初の発話の切れ目（デコーダがリセットされた位置）で、
+      処理済みのサンプル位置と確定済みの文字起こしをチェックポイントに保存する
+    ・中断後に再実行すると、最後のチェックポイントの位置から再開する
+    ・use_vad=True の場合は無音のチャンクをデコードせず、発話の終わりごとに確定させる
+      （False の場合もすべてのチャンクをデコードしたうえで、Endpointer で発話の長さの上限ごとに確定させる）
+    ・chunk はチャンクの指定（'model' またはサンプル数。省略時は環境変数 ASR_CHUNK）
+    ・quiet=True の場合は文字起こしの途中経過を表示しない（要約は表示する）
+    ・cache（result_cache.ResultCache）と cache_key を渡すと、最後まで処理した場合に
+      文字起こしと要約を保存する
     """
     global transcript_buffer, last_summary_time, current_summary
 
+    # 途中結果は変わった部分だけを書き直して表示する
+    renderer = TranscriptRenderer(quiet=quiet)
+    instrumentation.wrap_method(renderer, 'update', 'render')
+    instrumentation.wrap_method(renderer, 'commit', 'render')
+
     print(f"音声ファイル '{wavfile}' を処理します...")
     print(f"現在の作業ディレクトリ: {os.getcwd()}")
     print(f"ファイルが存在するか確認: {os.path.exists(wavfile)}")
 
-    # 音声ファイルの読み込み
+    if checkpoint_path is None:
+        checkpoint_path = wavfile + '.ckpt.json'
+
+    # チャンクサイズの設定（エンコーダのブロック設定に合わせ、1回の呼び出しで1ブロック進める）
+    sim_chunk_length = chunking.resolve_chunk_size(speech2text, chunk)
+    print(f"チャンクサイズ: {sim_chunk_length}サンプル ({sim_chunk_length / TARGET_SAMPLE_RATE:.3f}秒)")
+
+    # 音声ファイルを開く（PCM データはメモリマップし、チャンクごとに読み込む）
     try:
-        with wave.open(wavfile, 'rb') as wavfile:
-            ch = wavfile.getnchannels()
-            bits = wavfile.getsampwidth()
-            rate = wavfile.getframerate()
-            nframes = wavfile.getnframes()
-            buf = wavfile.readframes(-1)
-            data = np.frombuffer(buf, dtype='int16')
-        print(f"音声ファイルを読み込みました: チャンネル数={ch}, ビット数={bits}, サンプリングレート={rate}, フレーム数={nframes}")
+        w = audio_io.open_wav(wavfile)
+        ch = w.channels
+        bits = w.sampwidth * 8
+        rate = w.rate
+        nframes = w.nframes
+        print(f"音声ファイルを開きました: チャンネル数={ch}, ビット数={bits}, サンプリングレート={rate}, フレーム数={nframes}")
     except Exception as e:
         print(f"音声ファイルの読み込み中にエラーが発生しました: {e}")
         raise
 
-    # 音声データの正規化
-    speech = data.astype(np.float16) / 32767.0
-
-    # 音声の長さ（秒）を計算
-    audio_duration = nframes / rate
-    print(f"音声ファイルの長さ: {audio_duration:.2f}秒")
-
-    # チャンクサイズの設定（16kHzの場合、640サンプルは0.04秒に相当）
-    sim_chunk_length = 640
-
-    # 音声の総サンプル数
-    total_samples = len(speech)
-
-    # 現在の処理位置（サンプル数）
-    current_position = 0
+    with w:
+        # 音声の長さ（秒）を計算
+        audio_duration = nframes / rate
+        print(f"音声ファイルの長さ: {audio_duration:.2f}秒")
 
-    # 現在の処理位置（秒）
-    current_time = 0
-
-    print("\n音声認識と要約を開始します...")
-    print("=" * 50)
-
-    # 処理する最大サンプル数を計算（MAX_DURATION秒分）
-    max_samples = min(total_samples, int(MAX_DURATION * rate))
-    print(f"処理する最大時間: {MAX_DURATION}秒 ({max_samples}サンプル)")
-
-    # チャンクごとに処理
-    if sim_chunk_length > 0:
-        for i in range(min(max_samples // sim_chunk_length, total_samples // sim_chunk_length)):
-            # 現在の時間を更新
-            current_time = (i * sim_chunk_length) / rate
-
-            # 最大処理時間に達したら終了
-            if current_time >= MAX_DURATION:
-                print(f"最大処理時間 {MAX_DURATION}秒 に達したため、処理を終了します")
-                break
+        # 処理する最大サンプル数を計算
+        if max_duration is None:
+            max_samples = nframes
+            print(f"処理する時間: 全体 ({max_samples}サンプル)")
+        else:
+            max_samples = min(nframes, int(max_duration * rate))
+            print(f"処理する最大時間: {max_duration}秒 ({max_samples}サンプル)")
+
+        # 文字起こしの状態（途中結果の重複を除き、確定した区間を管理する）
+        transcript = TranscriptState()
+
+        # チェックポイントから再開
+        ckpt = load_checkpoint(checkpoint_path, wavfile, nframes) if resume else None
+        if ckpt is not None:
+            position = ckpt['offset']
+            segments = ckpt.get('segments')
+            if segments is None:
+                # 区間情報のない古いチェックポイントは全体を1区間として扱う
+                segments = [(0.0, position / rate, ckpt['transcript'])] if ckpt['transcript'] else []
+            transcript.restore(segments, position / rate)
+            transcript_buffer = ckpt.get('pending', '')
+            current_summary = ckpt.get('summary', current_summary)
+            print(f"チェックポイントから再開します: {position / rate:.2f}秒 ({position}サンプル)")
+            if transcript.segments:
+                renderer.update(transcript.finalized_text, force=True)
+                renderer.commit()
+        else:
+            position = 0
+
+        def checkpoint_state():
+            return {
+                'file': os.path.abspath(wavfile),
+                'nframes': nframes,
+                'offset': position,
+                'transcript': transcript.finalized_text,
+                'segments': [list(segment) for segment in transcript.segments],
+                'pending': transcript_buffer,
+                'summary': current_summary,
+                'completed': position >= max_samples,
+                'updated': time.time(),
+            }
+
+        # 16kHz・モノラル以外の入力はチャンクごとにダウンミックスとリサンプリングを行う
+        # （位置とチェックポイントは入力ファイルのフレーム数で数える）
+        resampler = None
+        read_chunk_length = sim_chunk_length
+        if rate != TARGET_SAMPLE_RATE or ch > 1:
+            resampler = StreamingResampler(rate, TARGET_SAMPLE_RATE)
+            read_chunk_length = max(1, sim_chunk_length * rate // TARGET_SAMPLE_RATE)
+            print(f"{rate}Hz・{ch}チャンネルの入力を {TARGET_SAMPLE_RATE}Hz・モノラルに変換して処理します")
+
+        # 無音区間を読み飛ばすための VAD（発話の終わりでデコーダをリセットする）
+        # VAD を使わない場合も Endpointer で発話を区切る（チェックポイントは発話の切れ目で保存する）
+        vad = EnergyVAD(rate=TARGET_SAMPLE_RATE) if use_vad else Endpointer(rate=TARGET_SAMPLE_RATE)
+
+        checkpoint_samples = max(read_chunk_length, int(checkpoint_interval * rate))
+        next_checkpoint = position + checkpoint_samples
+        total_chunks = -(-max_samples // read_chunk_length)
+
+        print("\n音声認識と要約を開始します...")
+        print("=" * 50)
+
+        # メモリマップしたファイルから、正規化済みのチャンクを必要な分だけ読み込む
+        # （float32 への変換は事前確保したバッファ上で行い、チャンクごとに配列を作らない）
+        converter = instrumentation.wrap_method(PCMConverter(read_chunk_length * w.channels), 'convert', 'normalize')
+        chunks = w.chunks(read_chunk_length, start=position, end=max_samples, converter=converter)
+        for offset, chunk in instrumentation.timed_iter(chunks, 'read'):
+            position = offset + len(chunk)
+            instrumentation.count('chunks')
+
+            # ファイル末尾では発話を確定させる
+            end = position >= max_samples
+
+            if resampler is not None:
+                with instrumentation.stage('resample'):
+                    chunk = resampler.process(chunk)
+                    if end:
+                        # 末尾ではリサンプラの残りも流し込む
+                        chunk = np.concatenate([chunk, resampler.flush()])
+
+            # 無音のチャンクはデコードを省略する（発話中でなければデコーダはリセット済み）
+            with instrumentation.stage('vad'):
+                chunk, is_final = vad.gate(chunk, is_last=end)
 
             # ASR処理
-            chunk = speech[i * sim_chunk_length:(i + 1) * sim_chunk_length]
-            print(f"チャンク処理中: {i+1}/{total_samples // sim_chunk_length}, サイズ: {len(chunk)}")
-            try:
-                results = speech2text(speech=chunk, is_final=False)
-                print(f"チャンク {i+1} の処理が完了しました")
-            except Exception as e:
-                print(f"チャンク {i+1} の処理中にエラーが発生しました: {e}")
-                print(f"チャンクの形状: {chunk.shape}, データ型: {chunk.dtype}")
-                print(f"チャンクの最小値: {chunk.min()}, 最大値: {chunk.max()}")
-                raise
-
-            if results is not None and len(results) > 0:
-                nbests = [text for text, token, token_int, hyp in results]
-                text = nbests[0] if nbests is not None and len(nbests) > 0 else ""
-                progress_output(text)
-
-                # 文字起こし結果をバッファに追加
-                transcript_buffer += text
-            else:
-                progress_output("")
+            i = -(-position // read_chunk_length)
+            if chunk is not None:
+                try:
+                    with instrumentation.stage('decode'):
+                        results = speech2text(speech=chunk, is_final=is_final)
+                except Exception as e:
+                    print(f"チャンク {i}/{total_chunks} の処理中にエラーが発生しました: {e}")
+                    print(f"チャンクの形状: {chunk.shape}, データ型: {chunk.dtype}")
+                    print(f"チャンクの最小値: {chunk.min()}, 最大値: {chunk.max()}")
+                    raise
+
+                text = ""
+                if results is not None and len(results) > 0:
+                    nbests = [text for text, token, token_int, hyp in results]
+                    text = nbests[0] if nbests is not None and len(nbests) > 0 else ""
+                    renderer.update(text)
+
+                # 途中結果は発話の先頭からの仮説全体なので、新しく確定した部分だけをバッファに追加する
+                if is_final:
+                    transcript.finalize(text, position / rate)
+                    # 確定した行は残して、次の発話は新しい行に表示する
+                    renderer.commit()
+                else:
+                    transcript.update(text, position / rate)
+                transcript_buffer += transcript.take_new()
 
             # 一定間隔で要約
             if time.time() - last_summary_time > SUMMARY_INTERVAL:
+                # 前回の要約以降に確定したテキストがあれば、文字起こし全体を要約し直す
                 if transcript_buffer.strip():
                     print("\n\n要約中...")
-                    current_summary = summarize_text(transcript_buffer)
-                    progress_output(current_summary, is_summary=True)
+                    with instrumentation.stage('summarize'):
+                        summary = summarize_text(summary_units(transcript))
+                    if summary is not None:
+                        current_summary = summary
+                    renderer.print_block("要約", summary if summary is not None else SUMMARY_ERROR)
                     last_summary_time = time.time()
-
-                    # バッファをクリアするか、一部を保持するかの選択
-                    # ここでは簡単のためにクリア
                     transcript_buffer = ""
 
-        # 残りのサンプルを処理（最大時間内のみ）
-        last_processed_sample = min((i + 1) * sim_chunk_length, max_samples)
-        remaining_chunk = speech[last_processed_sample:min(max_samples, total_samples)]
-        if len(remaining_chunk) > 0:
-            print(f"残りのチャンクを処理中: サイズ: {len(remaining_chunk)}")
-            try:
-                results = speech2text(speech=remaining_chunk, is_final=True)
-                print("残りのチャンクの処理が完了しました")
-            except Exception as e:
-                print(f"残りのチャンクの処理中にエラーが発生しました: {e}")
-                print(f"チャンクの形状: {remaining_chunk.shape}, データ型: {remaining_chunk.dtype}")
-                print(f"チャンクの最小値: {remaining_chunk.min()}, 最大値: {remaining_chunk.max()}")
-                raise
-            if results is not None and len(results) > 0:
-                nbests = [text for text, token, token_int, hyp in results]
-                text = nbests[0] if nbests is not None and len(nbests) > 0 else ""
-                progress_output(text)
-                transcript_buffer += text
-    else:
-        # 一度に全体を処理（非ストリーミングモード）- 最大時間内のみ
-        print("非ストリーミングモードで全体を処理中...")
-        try:
-            # 最大時間分のサンプルだけを処理
-            speech_to_process = speech[:max_samples]
-            print(f"処理するサンプル数: {len(speech_to_process)}/{len(speech)}")
-            results = speech2text(speech=speech_to_process, is_final=True)
-            print("全体の処理が完了しました")
-        except Exception as e:
-            print(f"全体の処理中にエラーが発生しました: {e}")
-            print(f"音声データの形状: {speech.shape}, データ型: {speech.dtype}")
-            print(f"音声データの最小値: {speech.min()}, 最大値: {speech.max()}")
-            raise
-        if results is not None and len(results) > 0:
-            nbests = [text for text, token, token_int, hyp in results]
-            text = nbests[0] if nbests is not None and len(nbests) > 0 else ""
-            progress_output(text)
-            transcript_buffer += text
+            # 間隔が過ぎたら、発話の外（確定した直後か無音の途中）に来たところでチェックポイントに保存する
+            # （発話の途中で確定させると単語が切れるため、デコーダがリセットされている位置まで待つ）
+            if end or (position >= next_checkpoint and not vad.in_speech):
+                with instrumentation.stage('checkpoint'):
+                    save_checkpoint(checkpoint_path, checkpoint_state())
+                next_checkpoint = position + checkpoint_samples
+
+        renderer.close()
+        print(renderer.report())
+        print(vad.report())
+        if position >= max_samples:
+            print(f"\n全体の処理が完了しました（チェックポイント: {checkpoint_path}）")
 
     # 最終的な要約
     if transcript_buffer.strip():
         print("\n\n最終要約を生成中...")
-        final_summary = summarize_text(transcript_buffer)
-        progress_output(final_summary, is_summary=True)
+        with instrumentation.stage('summarize'):
+            final_summary = summarize_text(summary_units(transcript))
+        renderer.print_block("要約", final_summary if final_summary is not None else SUMMARY_ERROR)
+        print(chunked_summarizer.report())
+        if final_summary is not None:
+            current_summary = final_summary
+
+    # 最後まで処理した結果だけを保存する（途中までの結果を別の実行で返さないため）
+    if cache is not None and max_duration is None and position >= max_samples:
+        cache.put(cache_key, {
+            'text': transcript.finalized_text,
+            'duration': round(audio_duration, 3),
+            'segments': [{'start': round(s, 3), 'end': round(e, 3), 'text': t} for s, e, t in transcript.segments],
+            'summary': current_summary,
+            'summary_options': summary_options(),
+        })
+
+    print(instrumentation.report())
+    print("\n処理が完了しました。")
+    return transcript.finalized_text
 
+def show_cached(cache, key, record):
+    """
+    結果のキャッシュにある文字起こしと要約を表示する（ASRモデルはロードしない）
+    ・要約の設定が保存したときと違う場合は、保存されている文字起こしから要約だけをやり直す
+    """
+    print("結果のキャッシュにある文字起こしと要約を表示します（ASRモデルはロードしません）")
+    print("=" * 50)
+    for segment in record['segments']:
+        print(f"[{format_time(segment['start'])} - {format_time(segment['end'])}] {segment['text']}")
+    summary = record.get('summary')
+    if record.get('summary_options') != summary_options():
+        print("\n\n最終要約を生成中...")
+        with instrumentation.stage('summarize'):
+            summary = summarize_text([segment['text'] for segment in record['segments']])
+        if summary is not None:
+            cache.update(key, summary=summary, summary_options=summary_options())
+    TranscriptRenderer().print_block("要約", summary or "")
     print("\n処理が完了しました。")
+    return record['text']
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="音声ファイルの文字起こしと要約を行う")
     # コマンドライン引数から音声ファイルを取得（指定がなければデフォルト値を使用）
-    if len(sys.argv) > 1:
-        audio_file = sys.argv[1]
+    parser.add_argument('audio_file', nargs='?', default=audio_file, help="処理する音声ファイル")
+    parser.add_argument('--max-duration', type=float, default=MAX_DURATION,
+                        help="処理する最大時間（秒）。省略時は最後まで処理する")
+    parser.add_argument('--checkpoint', help="チェックポイントファイル（既定: <音声ファイル>.ckpt.json）")
+    parser.add_argument('--checkpoint-interval', type=float, default=CHECKPOINT_INTERVAL,
+                        help="チェックポイントを保存する間隔（音声の秒数）")
+    parser.add_argument('--no-resume', action='store_true',
+                        help="チェックポイントがあっても最初から処理する")
+    parser.add_argument('--no-vad', action='store_true',
+                        help="VAD を使わず、無音のチャンクもすべてデコードする")
+    parser.add_argument('--chunk', default=chunking.CHUNK_MODE,
+                        help="デコードのチャンク長（サンプル数。'model' でエンコーダのブロック設定に合わせる）")
+    parser.add_argument('--quiet', action='store_true', default=QUIET,
+                        help="文字起こしの途中経過を表示しない（要約と結果だけを表示する）")
+    asr_config.add_arguments(parser)
+    instrumentation.add_arguments(parser)
+    result_cache.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.setup_from_args(args)
+    config = asr_config.from_args(args)
+    use_vad = USE_VAD and not args.no_vad
+
+    # 同じ内容の音声を同じ設定で最後まで処理した結果があれば、モデルをロードせずに表示する
+    cache = result_cache.from_args(args)
+    key = None
+    if cache.enabled and args.max_duration is None:
+        options = result_cache.decoding_options(config, vad=use_vad, chunk=str(args.chunk))
+        with audio_io.open_wav(args.audio_file) as wav:
+            key = cache.key(wav, tag, options)
+    cached = cache.get(key)
+
+    print(f"処理する音声ファイル: {args.audio_file}")
+    if cached is not None:
+        show_cached(cache, key, cached)
+    else:
+        load_summarizer()
+        print("ASRモデルをロード中...")
+        speech2text = asr_config.load_speech2text(config, tag=tag)
+        # フロントエンド・エンコーダ・ビームサーチの時間を段階ごとに記録する
+        speech2text = instrumentation.instrument_speech2text(speech2text)
+
+        recognize_and_summarize(args.audio_file, max_duration=args.max_duration,
+                                checkpoint_path=args.checkpoint,
+                                checkpoint_interval=args.checkpoint_interval,
+                                resume=not args.no_resume,
+                                use_vad=use_vad,
+                                chunk=args.chunk, quiet=args.quiet,
+                                cache=cache, cache_key=key)
+    print(cache.report())
 
-    print(f"処理する音声ファイル: {audio_file}")
-    recognize_and_summarize(audio_file)
@@ -1,64 +1,52 @@
-import sys
-import pyaudio
+import time
 import numpy as np
 import signal
-from espnet_model_zoo.downloader import ModelDownloader
-from espnet2.bin.asr_inference_streaming import Speech2TextStreaming
+import audio_source
+from vad import EnergyVAD, Endpointer
+import asr_config
+import chunking
+import instrumentation
+from audio_io import PCMConverter
+from renderer import TranscriptRenderer
 
 # マイク入力のパラメータ設定
-CHUNK=2048          # 一度に読み込むサンプル数
-FORMAT=pyaudio.paInt16  # 16ビット整数で音声を取得
+CHUNK=2048          # PyAudio のコールバック1回あたりのサンプル数（デコードのチャンク長はモデルから決める）
 CHANNELS=1          # モノラル入力
 RATE=16000         # サンプリングレート
+USE_VAD=True        # 無音のチャンクをデコードせずに読み飛ばすかどうか
+MAX_CHUNKS=4        # 推論が遅れている場合に1回でまとめて読み出すチャンク数の上限
 
 tag = 'eml914/streaming_conformer_asr_csj'
 
 # モデルのセットアップ
-d=ModelDownloader()
-speech2text = Speech2TextStreaming(
-    **d.download_and_unpack(tag),
-    token_type=None,
-    bpemodel=None,
-    maxlenratio=0.0,
-    minlenratio=0.0,
-    beam_size=20,
-    ctc_weight=0.5,
-    lm_weight=0.0,
-    penalty=0.0,
-    nbest=1,
-    device = "cuda",
-    disable_repetition_detection=True,
-    decoder_text_length_limit=0,
-    encoded_feat_length_limit=0
-)
-
-
-prev_lines = 0
-def progress_output(text):
-    """
-    推論中の進捗を表示する
-    ・50文字ごとに改行を挿入
-    ・進捗を表示するために、前の行を上書きする
-    """
-    global prev_lines
-    lines=['']
-    for i in text:
-        if len(lines[-1]) > 50:
-            lines.append('')
-        lines[-1] += i
-    for i,line in enumerate(lines):
-        if i == prev_lines:
-            sys.stderr.write('\n\r')
-        else:
-            sys.stderr.write('\r\033[B\033[K')
-        sys.stderr.write(line)
-
-    prev_lines = len(lines)
-    sys.stderr.flush()
-
-
-p=pyaudio.PyAudio()
-stream = p.open(format=FORMAT,channels=CHANNELS,rate=RATE,input=True,frames_per_buffer=CHUNK)
+# デバイス・スレッド数・int8 量子化は環境変数 ASR_DEVICE などで指定する（asr_config.py を参照）
+speech2text = asr_config.load_speech2text(tag=tag)
+# 段階ごとの時間を記録する（出力先は環境変数 ASR_METRICS_PORT などで指定する。instrumentation.py を参照）
+speech2text = instrumentation.instrument_speech2text(speech2text)
+instrumentation.setup()
+# デコードのチャンク長はエンコーダのブロック設定から決める（環境変数 ASR_CHUNK=adaptive で自動調整）
+chunker = chunking.make_chunker(speech2text, rate=RATE)
+print(chunking.describe(speech2text, RATE))
+
+
+# 途中結果は変わった部分だけを書き直して表示する（環境変数 ASR_RENDER_FPS / ASR_QUIET で調整）
+renderer = TranscriptRenderer()
+instrumentation.wrap_method(renderer, 'update', 'render')
+instrumentation.wrap_method(renderer, 'commit', 'render')
+
+
+# マイク入力は別スレッド（PyAudioのコールバック）でリングバッファに取り込む
+# 環境変数 ASR_SOURCE で WAV の実時間再生・標準入力・合成音声などに差し替えられる（audio_source.py を参照）
+capture = audio_source.open_source(rate=RATE, channels=CHANNELS, frames_per_buffer=CHUNK)
+capture.start()
+# 読み出し用の int16 バッファと float32 への変換バッファはループの外で一度だけ確保する
+pcm_buffer = np.empty(chunker.max_chunk * MAX_CHUNKS, dtype=np.int16)
+converter = instrumentation.wrap_method(PCMConverter(chunker.max_chunk * MAX_CHUNKS), 'convert', 'normalize')
+
+# 無音区間を読み飛ばすための VAD（発話の終わりでデコーダをリセットする）
+# 話し続けても発話の長さは ASR_MAX_UTTERANCE 秒程度で区切り、デコーダの状態が伸び続けないようにする
+# VAD を使わない場合も Endpointer で発話を区切る（長時間の会議でも遅延とメモリを一定に保つ）
+vad = EnergyVAD(rate=RATE) if USE_VAD else Endpointer(rate=RATE)
 
 # Ctrl+Cで終了するためのフラグ
 running = True
@@ -77,32 +65,57 @@ print("終了するには Ctrl+C を押してください")
 print("=" * 50)
 
 try:
-    while running:
-        data = stream.read(CHUNK, exception_on_overflow=False)
-        data = np.frombuffer(data, dtype='int16')
-        # 32767は16ビットのバイナリ数の上限値であり、intをfloatに変換するための正規化に使用される
-        data = data.astype(np.float16)/32767.0
-
-        results = speech2text(speech=data, is_final=False)
+    # マイク以外の入力は終わりに達したら止める
+    while running and not capture.exhausted:
+        # 推論が遅れている場合は溜まった分をまとめて受け取る
+        with instrumentation.stage('capture_wait'):
+            data = capture.read(chunker.chunk, max_chunks=MAX_CHUNKS, out=pcm_buffer)
+        if data is None:
+            continue
+        instrumentation.count('chunks')
+        instrumentation.gauge('capture_backlog_samples', len(capture.ring))
+        # int16 を事前確保した float32 のバッファに変換する（[-1.0, 1.0) に正規化）
+        data = converter.convert(data)
+
+        start = time.perf_counter()
+        nsamples = len(data)
+        # 無音のチャンクはデコードしない。発話の終わりでは is_final=True でデコーダをリセットする
+        with instrumentation.stage('vad'):
+            data, is_final = vad.gate(data)
+        if data is None:
+            capture.record_inference(nsamples, time.perf_counter() - start)
+            instrumentation.count('vad_skipped_chunks')
+            continue
+        with instrumentation.stage('decode'):
+            results = speech2text(speech=data, is_final=is_final)
+        elapsed = time.perf_counter() - start
+        capture.record_inference(nsamples, elapsed)
+        # 遅延と RTF を記録し、デコードが遅れていればチャンクを大きくする（adaptive の場合）
+        chunker.record(nsamples, elapsed, backlog=len(capture.ring))
         if results is not None and len(results) > 0:
             nbests = [text for text, token, token_int, hyp in results]
-            text = nbests[0] if nbests is not None and len(nbests) > 0 else ""
-            progress_output(nbests[0])
-        else:
-            progress_output("")
-
-    # 最終結果を取得
-    results = speech2text(speech=np.array([], dtype=np.float16), is_final=True)
-    if results is not None and len(results) > 0:
-        nbests = [text for text, token, token_int, hyp in results]
-        progress_output(nbests[0])
+            renderer.update(nbests[0])
+        if is_final:
+            # 確定した発話は残して、次の発話は新しい行に表示する
+            renderer.commit()
+
+    # 最終結果を取得（発話の途中で終了した場合のみ）
+    if vad.in_speech:
+        results = speech2text(speech=np.zeros(0, dtype=np.float32), is_final=True)
+        if results is not None and len(results) > 0:
+            nbests = [text for text, token, token_int, hyp in results]
+            renderer.update(nbests[0], force=True)
 
 except KeyboardInterrupt:
     print("\n\n音声認識を終了します...")
 
 finally:
     # リソースの解放
-    stream.stop_stream()
-    stream.close()
-    p.terminate()
+    renderer.close()
+    capture.close()
+    print("\n" + capture.report())
+    print(renderer.report())
+    print(chunker.report())
+    print(vad.report())
+    print(instrumentation.report())
     print("\n音声認識を終了しました")
@@ -0,0 +1,177 @@
+"""
+エンジンを選んで音声ファイルを文字起こしする（asr_backend の共通インターフェースを使う）
+
+・既定（バッチ）: 複数のファイルを --files-per-batch 件ずつまとめて transcribe_batch() に渡し、
+  1ファイル1行の JSONL を -o のファイル（省略時は標準出力）に書き出す。大量のファイル向け
+・--stream: ファイルをマイク入力と同じようにチャンクごとに feed() し、VAD で区切った発話ごとに
+  finalize() する。途中結果を表示するため、ライブ用途での遅延を確かめられる
+
+エンジンは --engine（または環境変数 ASR_ENGINE）で選ぶ。
+・espnet: ストリーミング Conformer。チャンクごとに途中結果を返す（低遅延）
+・k2: ReazonSpeech の k2 モデル。発話の終わりにまとめて認識し、バッチで速く処理できる（高スループット）
+・fake: モデルを読み込まない擬似的な認識器（動作確認用）
+
+使い方:
+    python asr-transcribe.py --engine k2 corpus/ -o results.jsonl
+    python asr-transcribe.py --engine espnet --stream meeting.wav
+"""
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import asr_backend
+import asr_config
+import instrumentation
+from audio_io import load_speech
+from file_inputs import collect_inputs, load_finished, open_output
+from renderer import TranscriptRenderer, QUIET
+from resampler import TARGET_SAMPLE_RATE
+from vad import EnergyVAD
+
+# バッチモードで1回の transcribe_batch() に渡すファイル数
+FILES_PER_BATCH = 8
+
+
+def log(message):
+    """進捗を標準エラー出力に表示する（標準出力は JSONL の結果に使う）"""
+    print(message, file=sys.stderr, flush=True)
+
+
+def transcribe_files(backend, paths, out, files_per_batch=FILES_PER_BATCH):
+    """
+    ファイルを files_per_batch 件ずつ読み込んでまとめて文字起こしし、JSONL を書き出す
+    ・読み込めないファイルはエラーとして記録し、残りのファイルの処理を続ける
+    ・バッチの文字起こしに失敗した場合は、そのバッチのファイルをすべてエラーとして記録して次に進む
+    """
+    start = time.time()
+    done = 0
+    audio = 0.0
+    for i in range(0, len(paths), files_per_batch):
+        batch = []
+        for path in paths[i:i + files_per_batch]:
+            try:
+                with instrumentation.stage('read'):
+                    batch.append((path, load_speech(path)))
+            except Exception as e:
+                out.write(json.dumps({'file': path, 'engine': backend.name, 'error': f"{type(e).__name__}: {e}"},
+                                     ensure_ascii=False) + '\n')
+        if not batch:
+            continue
+        batch_start = time.perf_counter()
+        try:
+            with instrumentation.stage('decode'):
+                texts = backend.transcribe_batch([speech for _, speech in batch])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            for path, _ in batch:
+                out.write(json.dumps({'file': path, 'engine': backend.name, 'error': error},
+                                     ensure_ascii=False) + '\n')
+            out.flush()
+            log(f"{len(batch)}ファイルの文字起こしに失敗しました: {error}")
+            continue
+        elapsed = time.perf_counter() - batch_start
+        batch_audio = sum(len(speech) for _, speech in batch) / TARGET_SAMPLE_RATE
+        for (path, speech), text in zip(batch, texts):
+            duration = len(speech) / TARGET_SAMPLE_RATE
+            record = {
+                'file': path,
+                'engine': backend.name,
+                'text': text,
+                'duration': round(duration, 3),
+                # バッチでまとめて処理するため、処理時間はバッチ全体を音声の長さで按分する
+                'elapsed': round(elapsed * duration / batch_audio, 3) if batch_audio else 0.0,
+            }
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        out.flush()
+        done += len(batch)
+        audio += batch_audio
+        wall = time.time() - start
+        log(f"[{done}/{len(paths)}] 音声 {audio:.1f}秒, 経過時間 {wall:.1f}秒,"
+            f" RTF={wall / audio if audio else 0.0:.4f}, {done / wall * 60 if wall else 0.0:.1f}ファイル/分")
+
+
+def stream_file(backend, path, renderer, vad=None):
+    """
+    ファイルをチャンクごとに feed() し、発話の終わりで finalize() する（ライブ入力と同じ流れ)
+    ・発話の終わりから確定した結果が出るまでの時間のリストを返す
+    """
+    speech = load_speech(path)
+    finalize_latencies = []
+    size = backend.chunk_size
+    for offset in range(0, len(speech), size):
+        chunk = speech[offset:offset + size]
+        is_last = offset + size >= len(speech)
+        if vad is not None:
+            with instrumentation.stage('vad'):
+                chunk, is_final = vad.gate(chunk, is_last=is_last)
+            if chunk is None:
+                continue
+        else:
+            is_final = is_last
+        with instrumentation.stage('decode'):
+            text = backend.feed(chunk)
+        if text:
+            renderer.update(text)
+        if is_final:
+            start = time.perf_counter()
+            with instrumentation.stage('decode'):
+                text = backend.finalize()
+            finalize_latencies.append(time.perf_counter() - start)
+            renderer.update(text, force=True)
+            renderer.commit()
+    return finalize_latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="エンジンを選んで音声ファイルを文字起こしする")
+    parser.add_argument('inputs', nargs='+',
+                        help="音声ファイル、ディレクトリ、globパターン、またはマニフェスト(.txt/.list/.scp)")
+    parser.add_argument('-o', '--output', help="バッチモードの結果を追記する JSONL ファイル（既定: 標準出力）")
+    parser.add_argument('--stream', action='store_true',
+                        help="チャンクごとに入力して途中結果を表示する（ライブ入力と同じ流れ）")
+    parser.add_argument('--no-vad', action='store_true', help="--stream で VAD を使わず、ファイル全体を1つの発話にする")
+    parser.add_argument('--files-per-batch', type=int, default=FILES_PER_BATCH,
+                        help="バッチモードで1回にまとめて処理するファイル数")
+    parser.add_argument('--quiet', action='store_true', default=QUIET, help="--stream で途中経過を表示しない")
+    asr_backend.add_arguments(parser)
+    asr_config.add_arguments(parser)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.setup_from_args(args)
+
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        parser.error("入力に一致する音声ファイルがありません")
+
+    backend = asr_backend.from_args(args)
+    log(f"モデルのロード時間: {backend.load():.1f}秒")
+    log(backend.describe())
+
+    if args.stream:
+        if not backend.streaming:
+            log(f"{backend.name} は途中結果を返さないため、発話の終わりごとに結果を表示します")
+        latencies = []
+        renderer = TranscriptRenderer(quiet=args.quiet)
+        for path in paths:
+            renderer.print_block(path, "")
+            vad = None if args.no_vad else EnergyVAD(rate=TARGET_SAMPLE_RATE)
+            latencies += stream_file(backend, path, renderer, vad)
+        renderer.close()
+        if latencies:
+            log(f"発話の終わりから確定までの時間: 平均 {np.mean(latencies) * 1000:.1f}ms,"
+                f" 最大 {max(latencies) * 1000:.1f}ms ({len(latencies)}発話)")
+    else:
+        finished = load_finished(args.output) if args.output else set()
+        todo = [path for path in paths if path not in finished]
+        out = open_output(args.output) if args.output else sys.stdout
+        try:
+            transcribe_files(backend, todo, out, max(1, args.files_per_batch))
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    log(instrumentation.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+音声認識エンジンの共通インターフェース
+
+ESPnet のストリーミング Conformer（Speech2TextStreaming）と ReazonSpeech の k2 モデルを
+同じ呼び出し方で使えるようにし、用途ごとにエンジンを選べるようにする。
+
+・load(): モデルを読み込む（読み込みの時間を返す）
+・feed(chunk): 16kHz・モノラルの float32 のチャンクを渡し、現在の発話の途中結果を返す
+・finalize(): 現在の発話を確定させて結果を返し、発話の状態を初期化する
+・transcribe_batch(speeches): 複数の音声をまとめて文字起こしし、テキストのリストを返す
+
+ESPnet はチャンクごとに途中結果を返すストリーミングのエンジンで、ライブ字幕のような低遅延の
+用途に向く。k2 はオフラインのモデルのため feed() は音声を溜めるだけで、finalize() でまとめて
+認識する。その代わり、長い音声を無音の位置でウィンドウに分けてバッチで認識できるため、
+大量のファイルを処理する用途で速い。
+
+エンジンは BACKENDS に名前で登録し、create_backend() / from_args() で作る。
+'fake' はモデルを読み込まない fake_asr.FakeSpeech2TextStreaming を使う（動作確認用）。
+"""
+import os
+import time
+import numpy as np
+import asr_config
+import audio_io
+import chunking
+from resampler import TARGET_SAMPLE_RATE
+from segmenter import split_at_silence
+
+# k2 のウィンドウのおよその長さ（秒）。無音の位置で区切るため、最大でその 1.5 倍になる
+K2_WINDOW_SECONDS = 20.0
+# k2 の1回のバッチで認識するウィンドウ数
+K2_BATCH_SIZE = 8
+# k2 のウィンドウの前後に加える無音（秒）。先頭と末尾の発話が欠けないようにする
+K2_PAD_SECONDS = 0.9
+# k2 の精度（ASR_INT8=1 で int8）
+K2_PRECISION = 'int8' if os.environ.get('ASR_INT8', '') not in ('', '0') else 'fp32'
+
+
+class ASRBackend:
+    """
+    音声認識エンジンの共通インターフェース（各エンジンはこれを継承する）
+    ・streaming: feed() が途中結果を返すかどうか
+    ・chunk_size: feed() に渡すのに適したチャンクのサンプル数
+    """
+    name = None
+    streaming = False
+    rate = TARGET_SAMPLE_RATE
+    chunk_size = 2048
+
+    def load(self):
+        """モデルを読み込み、読み込みにかかった時間（秒）を返す"""
+        raise NotImplementedError
+
+    def feed(self, chunk):
+        """チャンクを入力し、現在の発話の途中結果を返す"""
+        raise NotImplementedError
+
+    def finalize(self):
+        """現在の発話を確定させて結果を返す（発話の状態は初期化する）"""
+        raise NotImplementedError
+
+    def transcribe_batch(self, speeches):
+        """
+        複数の音声を文字起こしする（既定ではチャンクに分けて feed() と finalize() で1件ずつ処理する）
+        """
+        texts = []
+        for speech in speeches:
+            for offset in range(0, len(speech), self.chunk_size):
+                self.feed(speech[offset:offset + self.chunk_size])
+            texts.append(self.finalize())
+        return texts
+
+    def describe(self):
+        """エンジンの設定を表示用の文字列にする"""
+        return f"エンジン: {self.name}"
+
+
+class ESPnetBackend(ASRBackend):
+    """
+    ESPnet の Speech2TextStreaming（asr_config の設定でモデルキャッシュから読み込む）
+    ・speech2text を渡すと読み込まずにそれを使う（fake_asr や、読み込み済みのモデルの共有用）
+    ・チャンク長はエンコーダのブロック設定から決める（chunk で 'model' / サンプル数を指定できる）
+    """
+    name = 'espnet'
+    streaming = True
+
+    def __init__(self, config=None, tag=asr_config.TAG, chunk=None, speech2text=None):
+        self.config = config
+        self.tag = tag
+        self.chunk = chunk
+        self.speech2text = speech2text
+        self.text = ""
+        if speech2text is not None:
+            self.chunk_size = chunking.resolve_chunk_size(speech2text, chunk)
+
+    def load(self):
+        start = time.perf_counter()
+        if self.speech2text is None:
+            self.speech2text = asr_config.load_speech2text(self.config, tag=self.tag, verbose=False)
+        self.chunk_size = chunking.resolve_chunk_size(self.speech2text, self.chunk)
+        return time.perf_counter() - start
+
+    def _decode(self, speech, is_final):
+        results = self.speech2text(speech=speech, is_final=is_final)
+        if results:
+            self.text = results[0][0] or ""
+        return self.text
+
+    def feed(self, chunk):
+        return self._decode(chunk, False)
+
+    def finalize(self):
+        text = self._decode(np.zeros(0, dtype=np.float32), True)
+        self.text = ""
+        return text
+
+    def describe(self):
+        return f"エンジン: {self.name} ({chunking.describe(self.speech2text, self.rate)})"
+
+
+class FakeBackend(ESPnetBackend):
+    """モデルを読み込まない擬似的な認識器（fake_asr.FakeSpeech2TextStreaming）を使う"""
+    name = 'fake'
+
+    def __init__(self, config=None, chunk=None, rtf=0.05, **options):
+        from fake_asr import FakeSpeech2TextStreaming
+        super().__init__(config, chunk=chunk, speech2text=FakeSpeech2TextStreaming(rtf=rtf))
+
+
+class K2Backend(ASRBackend):
+    """
+    ReazonSpeech の k2 モデル（sherpa-onnx の OfflineRecognizer）
+    ・feed() は音声を溜めるだけで途中結果は返さない。finalize() で溜めた発話を認識する
+    ・長い音声は無音の位置で window_seconds 秒程度のウィンドウに分け、batch_size 件ずつまとめて認識する
+    """
+    name = 'k2'
+    streaming = False
+
+    def __init__(self, config=None, device=None, precision=K2_PRECISION,
+                 window_seconds=K2_WINDOW_SECONDS, batch_size=K2_BATCH_SIZE, **options):
+        self.device = device or (config.device if config is not None else None) or os.environ.get('ASR_DEVICE', 'cpu')
+        self.precision = precision
+        self.window_seconds = window_seconds
+        self.batch_size = max(1, batch_size)
+        self.model = None
+        self._buffer = []
+
+    def load(self):
+        # reazonspeech は k2 エンジンを使う場合だけ必要
+        from reazonspeech.k2.asr import load_model
+        start = time.perf_counter()
+        self.model = load_model(device=self.device, precision=self.precision)
+        return time.perf_counter() - start
+
+    def feed(self, chunk):
+        # 呼び出し側がバッファを使い回しても壊れないようにコピーして溜める
+        self._buffer.append(np.array(chunk, dtype=np.float32))
+        return ""
+
+    def finalize(self):
+        speech = np.concatenate(self._buffer) if self._buffer else np.zeros(0, dtype=np.float32)
+        self._buffer = []
+        return self.transcribe_batch([speech])[0]
+
+    def split_windows(self, speech, rate=TARGET_SAMPLE_RATE):
+        """音声を無音の位置で区切り、(開始秒, 終了秒, 音声) のリストにする"""
+        wav = audio_io.ArrayWav(speech, rate)
+        return [(span.start / rate, span.end / rate, wav.read(span.start, span.end))
+                for span in split_at_silence(wav, self.window_seconds)]
+
+    def decode_windows(self, windows):
+        """
+        16kHz・モノラルのウィンドウの音声をバッチで認識し、(テキスト, 最初のトークンの時刻) のリストを返す
+        ・最初のトークンの時刻はウィンドウの先頭からの秒数（トークンがなければ None）
+        """
+        pad = np.zeros(int(K2_PAD_SECONDS * TARGET_SAMPLE_RATE), dtype=np.float32)
+        results = []
+        for i in range(0, len(windows), self.batch_size):
+            streams = []
+            for speech in windows[i:i + self.batch_size]:
+                stream = self.model.create_stream()
+                stream.accept_waveform(TARGET_SAMPLE_RATE, np.concatenate([pad, speech, pad]))
+                streams.append(stream)
+            self.model.decode_streams(streams)
+            for stream in streams:
+                result = stream.result
+                first = max(0.0, result.timestamps[0] - K2_PAD_SECONDS) if len(result.timestamps) else None
+                results.append((result.text, first))
+        return results
+
+    def transcribe_batch(self, speeches):
+        # すべての音声のウィンドウをまとめてバッチにし、音声ごとに連結し直す
+        owners = []
+        windows = []
+        for index, speech in enumerate(speeches):
+            for _, _, window in self.split_windows(speech):
+                owners.append(index)
+                windows.append(window)
+        texts = [""] * len(speeches)
+        for index, (text, _) in zip(owners, self.decode_windows(windows)):
+            texts[index] += text
+        return texts
+
+    def describe(self):
+        return (f"エンジン: {self.name} (デバイス: {self.device}, 精度: {self.precision},"
+                f" ウィンドウ 約{self.window_seconds:g}秒, バッチ {self.batch_size})")
+
+
+# 名前で選べるエンジン
+BACKENDS = {
+    'espnet': ESPnetBackend,
+    'k2': K2Backend,
+    'fake': FakeBackend,
+}
+
+
+def create_backend(name, config=None, **options):
+    """名前からエンジンを作る（モデルはまだ読み込まない）"""
+    if name not in BACKENDS:
+        raise ValueError(f"不明なエンジンです: {name}（{', '.join(BACKENDS)} から選んでください）")
+    return BACKENDS[name](config, **options)
+
+
+def add_arguments(parser, default='espnet', select=True):
+    """
+    エンジンの選択とエンジン固有のコマンドライン引数を追加する
+    ・select=False の場合は --engine を追加しない（複数のエンジンを比べるスクリプト用）
+    """
+    group = parser.add_argument_group("エンジン")
+    if select:
+        group.add_argument('--engine', default=os.environ.get('ASR_ENGINE', default), choices=list(BACKENDS),
+                           help=f"音声認識エンジン（既定: {default}。環境変数 ASR_ENGINE でも指定できる）")
+    group.add_argument('--chunk', default=chunking.CHUNK_MODE,
+                       help="espnet に渡すチャンク長（'model' / サンプル数）")
+    group.add_argument('--precision', default=K2_PRECISION, choices=('fp32', 'int8'), help="k2 のモデルの精度")
+    group.add_argument('--window-seconds', type=float, default=K2_WINDOW_SECONDS,
+                       help="k2 で長い音声を区切るウィンドウのおよその長さ（秒）")
+    group.add_argument('--batch-size', type=int, default=K2_BATCH_SIZE, help="k2 の1回のバッチで認識するウィンドウ数")
+    return group
+
+
+def options_from_args(args, engine=None):
+    """add_arguments() で追加した引数のうち、engine に渡す構築オプション"""
+    engine = engine or args.engine
+    if engine == 'k2':
+        return dict(device=args.device, precision=args.precision,
+                    window_seconds=args.window_seconds, batch_size=args.batch_size)
+    return dict(chunk=args.chunk)
+
+
+def from_args(args, engine=None):
+    """コマンドライン引数からエンジンを作る（asr_config.add_arguments() の引数も使う）"""
+    engine = engine or args.engine
+    return create_backend(engine, asr_config.from_args(args), **options_from_args(args, engine))
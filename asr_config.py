@@ -0,0 +1,196 @@
+"""
+推論の設定（デバイス・スレッド数・int8 量子化・デコード方法）と Speech2TextStreaming の読み込み
+
+各スクリプトで共通の構築オプションもここにまとめる。コマンドライン引数を持たないスクリプトでも
+次の環境変数で設定できる（引数を持つスクリプトでは、これらが各オプションの既定値になる）。
+
+・ASR_DEVICE: 推論に使うデバイス（'cpu', 'cuda', 'cuda:1' など。既定: CUDA が使えれば cuda、なければ cpu）
+・ASR_THREADS: torch の演算内スレッド数（intra-op。既定: torch の既定値）
+・ASR_INTEROP_THREADS: torch の演算間スレッド数（inter-op。既定: torch の既定値）
+・ASR_INT8=1: CPU 推論時にエンコーダとデコーダの Linear 層を int8 に動的量子化する
+・ASR_BEAM_SIZE / ASR_CTC_WEIGHT / ASR_NBEST: ビームサーチのパラメータ（既定: MODEL_OPTIONS の値）
+・ASR_GREEDY_CTC=1: ビームサーチを使わず CTC の貪欲デコードで文字起こしする（低遅延）
+・ASR_DECODER_TEXT_LIMIT / ASR_ENCODED_FEAT_LIMIT: デコーダが参照する直近のトークン数 / エンコーダ出力の
+  フレーム数の上限（既定: 0 = 制限なし。長時間の発話でもチャンクあたりの計算量を一定に保つ）
+"""
+import os
+import time
+from collections import namedtuple
+import torch
+import model_cache
+import decoding
+
+# ASRモデルのタグ
+TAG = 'eml914/streaming_conformer_asr_csj'
+
+# Speech2TextStreaming の構築オプション（モデルファイルとデバイス以外）
+MODEL_OPTIONS = dict(
+    token_type=None,
+    bpemodel=None,
+    maxlenratio=0.0,
+    minlenratio=0.0,
+    beam_size=20,
+    ctc_weight=0.5,
+    lm_weight=0.0,
+    penalty=0.0,
+    nbest=1,
+    disable_repetition_detection=True,
+    decoder_text_length_limit=0,
+    encoded_feat_length_limit=0
+)
+
+# beam_size / ctc_weight / nbest が None の場合は MODEL_OPTIONS の値を使う
+InferenceConfig = namedtuple('InferenceConfig',
+                             ['device', 'threads', 'interop_threads', 'int8',
+                              'beam_size', 'ctc_weight', 'nbest', 'greedy_ctc',
+                              'decoder_text_length_limit', 'encoded_feat_length_limit'],
+                             defaults=(None, None, None, False, None, None))
+
+
+def default_device():
+    """CUDA が使えれば 'cuda'、なければ 'cpu'"""
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+
+def _env_int(name):
+    value = os.environ.get(name, '')
+    return int(value) if value else None
+
+
+def _env_float(name):
+    value = os.environ.get(name, '')
+    return float(value) if value else None
+
+
+def _env_flag(name):
+    return os.environ.get(name, '') not in ('', '0')
+
+
+def from_env():
+    """環境変数から推論の設定を作る"""
+    return InferenceConfig(
+        device=os.environ.get('ASR_DEVICE') or default_device(),
+        threads=_env_int('ASR_THREADS'),
+        interop_threads=_env_int('ASR_INTEROP_THREADS'),
+        int8=_env_flag('ASR_INT8'),
+        beam_size=_env_int('ASR_BEAM_SIZE'),
+        ctc_weight=_env_float('ASR_CTC_WEIGHT'),
+        nbest=_env_int('ASR_NBEST'),
+        greedy_ctc=_env_flag('ASR_GREEDY_CTC'),
+        decoder_text_length_limit=_env_int('ASR_DECODER_TEXT_LIMIT'),
+        encoded_feat_length_limit=_env_int('ASR_ENCODED_FEAT_LIMIT'),
+    )
+
+
+def add_arguments(parser):
+    """推論の設定用のコマンドライン引数を追加する（既定値は環境変数から取る）"""
+    env = from_env()
+    group = parser.add_argument_group("推論の設定")
+    group.add_argument('--device', default=env.device,
+                       help=f"推論に使うデバイス（既定: {env.device}）")
+    group.add_argument('--threads', type=int, default=env.threads,
+                       help="torch の演算内スレッド数（intra-op）")
+    group.add_argument('--interop-threads', type=int, default=env.interop_threads,
+                       help="torch の演算間スレッド数（inter-op）")
+    group.add_argument('--int8', action='store_true', default=env.int8,
+                       help="エンコーダとデコーダの Linear 層を int8 に動的量子化する（CPU のみ）")
+    decode = parser.add_argument_group("デコードの設定")
+    decode.add_argument('--beam-size', type=int, default=env.beam_size,
+                        help=f"ビーム幅（既定: {MODEL_OPTIONS['beam_size']}）")
+    decode.add_argument('--ctc-weight', type=float, default=env.ctc_weight,
+                        help=f"CTC スコアの重み。デコーダの重みは 1 - ctc_weight（既定: {MODEL_OPTIONS['ctc_weight']}）")
+    decode.add_argument('--nbest', type=int, default=env.nbest,
+                        help=f"返す仮説の数（既定: {MODEL_OPTIONS['nbest']}）")
+    decode.add_argument('--greedy-ctc', action='store_true', default=env.greedy_ctc,
+                        help="ビームサーチを使わず CTC の貪欲デコードで文字起こしする（低遅延・精度は下がる）")
+    decode.add_argument('--decoder-text-length-limit', type=int, default=env.decoder_text_length_limit,
+                        help="デコーダが参照する直近のトークン数の上限（既定: 0 = 制限なし）")
+    decode.add_argument('--encoded-feat-length-limit', type=int, default=env.encoded_feat_length_limit,
+                        help="デコーダが参照する直近のエンコーダ出力のフレーム数の上限（既定: 0 = 制限なし）")
+    return group
+
+
+def from_args(args):
+    """add_arguments() で追加した引数から推論の設定を作る"""
+    return InferenceConfig(args.device, args.threads, args.interop_threads, args.int8,
+                           args.beam_size, args.ctc_weight, args.nbest, args.greedy_ctc,
+                           args.decoder_text_length_limit, args.encoded_feat_length_limit)
+
+
+def model_options(config, **overrides):
+    """Speech2TextStreaming に渡す構築オプション（モデルファイル以外）"""
+    options = dict(MODEL_OPTIONS, device=config.device)
+    options.update(overrides)
+    return options
+
+
+def apply_threads(config):
+    """
+    torch のスレッド数を設定する
+    ・演算間スレッド数は並列処理が始まった後では変更できないため、その場合は警告だけ出す
+    """
+    if config.threads:
+        torch.set_num_threads(config.threads)
+    if config.interop_threads:
+        try:
+            torch.set_num_interop_threads(config.interop_threads)
+        except RuntimeError as e:
+            print(f"演算間スレッド数を変更できませんでした: {e}")
+
+
+def quantize_int8(speech2text):
+    """
+    エンコーダとデコーダの Linear 層を int8 に動的量子化する（モジュールをその場で置き換える）
+    ・ビームサーチのスコアラはデコーダのモジュールを直接参照しているため、置き換え後もそのまま使える
+    """
+    model = speech2text.asr_model
+    for name in ('encoder', 'decoder'):
+        module = getattr(model, name, None)
+        if module is not None:
+            torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return speech2text
+
+
+def apply_decoding(speech2text, config):
+    """
+    推論の設定のうちデコード方法に関する項目をロード済みのモデルに適用する
+    ・greedy_ctc の場合は GreedyCTCStreaming でラップしたものを返す
+    """
+    decoding.configure_history(speech2text, config.decoder_text_length_limit, config.encoded_feat_length_limit)
+    if config.greedy_ctc:
+        return decoding.GreedyCTCStreaming(speech2text)
+    return decoding.configure_beam(speech2text, config.beam_size, config.ctc_weight, config.nbest)
+
+
+def describe(config):
+    """推論の設定を表示用の文字列にする"""
+    precision = "int8" if config.int8 else "fp32"
+    return (f"デバイス: {config.device}, スレッド数: {torch.get_num_threads()}"
+            f" (演算間 {torch.get_num_interop_threads()}), 精度: {precision}")
+
+
+def load_speech2text(config=None, tag=TAG, verbose=True, **overrides):
+    """
+    推論の設定に従って Speech2TextStreaming をモデルキャッシュから読み込む
+    ・config を省略した場合は環境変数から設定を作る
+    ・overrides で MODEL_OPTIONS の一部を上書きできる
+    ・ビームサーチのパラメータはロード後に適用する（キャッシュは構築時のオプションごとに作られるため）
+    ・int8 量子化は CPU でのみ有効（他のデバイスでは警告を出して fp32 のまま使う）
+    """
+    config = config or from_env()
+    if config.int8 and config.device != 'cpu':
+        print(f"int8 量子化は CPU でのみ使えるため、{config.device} では fp32 で推論します")
+        config = config._replace(int8=False)
+    apply_threads(config)
+
+    speech2text, timings = model_cache.load_speech2text(tag, **model_options(config, **overrides))
+    if config.int8:
+        start = time.perf_counter()
+        quantize_int8(speech2text)
+        timings['quantize'] = time.perf_counter() - start
+    speech2text = apply_decoding(speech2text, config)
+    if verbose:
+        print(f"モデルのロード時間: {model_cache.format_timings(timings)}")
+        print(describe(config))
+        print(decoding.describe_beam(speech2text))
+    return speech2text
@@ -0,0 +1,88 @@
+"""
+1つのモデルを複数の音声ストリームで共有するためのセッション管理
+
+Speech2TextStreaming はフロントエンド・エンコーダ・ビームサーチの途中状態をインスタンス内に持つ。
+fork_speech2text() はネットワークの重みを共有したまま、状態を持つ部分だけを複製した
+インスタンスを作るため、セッションごとにモデルをロードし直す必要がない。
+"""
+import copy
+import time
+from collections import deque
+import torch
+from metrics import percentile
+
+
+def fork_speech2text(base):
+    """
+    重みを共有し、デコードの状態だけを独立させた Speech2TextStreaming を作る
+    ・nn.Module のスコアラー（アテンションデコーダなど）は共有する
+    ・CTC プレフィックススコアラーのように発話ごとの状態を持つスコアラーは複製する
+    ・fork() を持つラッパー（decoding.GreedyCTCStreaming など）はそれに任せる
+    """
+    if hasattr(base, 'fork'):
+        return base.fork()
+    fork = copy.copy(base)
+    beam_search = copy.copy(base.beam_search)
+    scorers = {
+        name: scorer if isinstance(scorer, torch.nn.Module) else copy.copy(scorer)
+        for name, scorer in base.beam_search.scorers.items()
+    }
+    beam_search.scorers = scorers
+    beam_search.full_scorers = {name: scorers[name] for name in base.beam_search.full_scorers}
+    beam_search.part_scorers = {name: scorers[name] for name in base.beam_search.part_scorers}
+    fork.beam_search = beam_search
+    fork.reset()
+    return fork
+
+
+class StreamSession:
+    """
+    1本の音声ストリームのデコード状態と計測値
+    ・latency はチャンクを受信してから結果を返すまでの時間（キューでの待ち時間を含む）
+    """
+
+    def __init__(self, session_id, speech2text, rate=16000, max_latency_samples=10000):
+        self.id = session_id
+        self.speech2text = speech2text
+        self.rate = rate
+        self.created = time.monotonic()
+        self.latencies = deque(maxlen=max_latency_samples)
+        self.first_result_latency = None
+        self.audio_seconds = 0.0
+        self.compute_seconds = 0.0
+        self.chunks = 0
+        self.text = ""
+
+    def decode(self, speech, is_final=False):
+        """
+        チャンクをデコードし、現在の仮説のテキストを返す（推論スレッドから呼ぶ）
+        """
+        start = time.perf_counter()
+        results = self.speech2text(speech=speech, is_final=is_final)
+        self.compute_seconds += time.perf_counter() - start
+        self.audio_seconds += len(speech) / self.rate
+        self.chunks += 1
+        if results is not None and len(results) > 0:
+            nbests = [text for text, token, token_int, hyp in results]
+            self.text = nbests[0] if nbests[0] is not None else ""
+        return self.text
+
+    def record_latency(self, seconds):
+        """結果を返すまでの時間を記録する"""
+        self.latencies.append(seconds)
+        if self.first_result_latency is None and self.text:
+            self.first_result_latency = time.monotonic() - self.created
+
+    def metrics(self):
+        """セッションの計測値を辞書で返す"""
+        latencies = list(self.latencies)
+        return {
+            'session': self.id,
+            'chunks': self.chunks,
+            'audio_seconds': round(self.audio_seconds, 3),
+            'rtf': round(self.compute_seconds / self.audio_seconds, 4) if self.audio_seconds else 0.0,
+            'latency_p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'latency_p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'latency_max_ms': round(max(latencies, default=0.0) * 1000, 2),
+            'first_result_s': round(self.first_result_latency, 3) if self.first_result_latency else None,
+        }
@@ -1,12 +1,18 @@
-import pyaudio
-import wave
+from mic_capture import input_devices
+from resampler import TARGET_SAMPLE_RATE
 
 def main():
-    audio = pyaudio.PyAudio()
-
-    # 音声デバイス毎のインデックス番号を一覧表示
-    for x in range(0, audio.get_device_count()):
-        print(audio.get_device_info_by_index(x))
+    # 入力に使える音声デバイス毎のインデックス番号を一覧表示
+    # 16kHz・モノラルにそのまま対応しているデバイスを選ぶと、リサンプリングせずに取り込める
+    # （ASR_SOURCE=mic:<インデックス番号> で asr-text.py / mic-asr-summary.py の入力に指定できる）
+    devices = input_devices(rate=TARGET_SAMPLE_RATE, channels=1)
+    for device in devices:
+        native = "対応" if device['native'] else "非対応（変換が必要）"
+        print(f"[{device['index']}] {device['name']} ({device['host_api']}):"
+              f" 最大 {device['max_input_channels']}チャンネル, 既定 {device['default_sample_rate']:g}Hz,"
+              f" 16kHz・モノラル: {native}")
+    native = [device['index'] for device in devices if device['native']]
+    print(f"\n16kHz・モノラルにそのまま対応しているデバイス: {', '.join(map(str, native)) if native else 'なし'}")
 
 if __name__ == '__main__':
     main()
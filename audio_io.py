@@ -0,0 +1,214 @@
+"""
+各スクリプトで共有する音声読み込みモジュール
+
+WAV ファイルの PCM データ部をメモリマップし、ストリーミングデコーダが必要とする
+チャンクサイズで float32 の配列を遅延的に返す。
+ファイル全体をメモリに読み込まないため、ピークメモリはファイル長ではなくチャンク長に比例する。
+
+16ビット PCM から float32 への変換は、マイク入力やサーバも含めてすべて PCMConverter で行う。
+"""
+import struct
+import numpy as np
+from resampler import StreamingResampler, TARGET_SAMPLE_RATE
+
+# 16ビット PCM を [-1.0, 1.0) に正規化するための係数
+INT16_SCALE = 1.0 / 32768.0
+_INT16_SCALE32 = np.float32(INT16_SCALE)
+
+# fmt チャンクのフォーマットコード
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def _parse_wav_header(path):
+    """
+    RIFF ヘッダを解析し、フォーマット情報と data チャンクの位置を返す
+    ・16ビット PCM 以外は ValueError を送出する
+    """
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        file_size = f.tell()
+        f.seek(0)
+
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            raise ValueError(f"WAV ファイルではありません: {path}")
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"data チャンクが見つかりません: {path}")
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                body = f.read(chunk_size)
+                format_tag, channels, rate, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    format_tag = struct.unpack('<H', body[24:26])[0]
+                fmt = (format_tag, channels, rate, bits)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f"fmt チャンクが data チャンクより後にあります: {path}")
+                data_offset = f.tell()
+                # ストリーミング書き出しされた WAV はサイズが未確定のことがあるため、ファイル長で丸める
+                data_size = min(chunk_size, file_size - data_offset)
+                break
+            else:
+                f.seek(chunk_size, 1)
+            # チャンクは2バイト境界に揃えられている
+            if chunk_size % 2:
+                f.seek(1, 1)
+
+    format_tag, channels, rate, bits = fmt
+    if format_tag != WAVE_FORMAT_PCM or bits != 16:
+        raise ValueError(f"16ビット PCM のみ対応しています (format={format_tag:#x}, bits={bits}): {path}")
+    return channels, rate, data_offset, data_size
+
+
+class PCMConverter:
+    """
+    16ビット PCM を事前に確保した float32 のバッファに書き込み、[-1.0, 1.0) に正規化する
+    ・型変換とスケーリングはバッファ上で行い、チャンクごとの一時配列を作らない
+    ・入力がバッファより長い場合だけバッファを確保し直す
+    ・返す配列はバッファへのビューなので、次に convert() を呼ぶまでに使い終わること
+    """
+
+    def __init__(self, capacity=0):
+        self.buf = np.empty(capacity, dtype=np.float32)
+
+    def convert(self, pcm):
+        """int16 の配列（形状は任意）を float32 に変換する"""
+        pcm = np.asarray(pcm)
+        if pcm.size > self.buf.size:
+            self.buf = np.empty(pcm.size, dtype=np.float32)
+        out = self.buf[:pcm.size].reshape(pcm.shape)
+        np.copyto(out, pcm, casting='safe')
+        np.multiply(out, _INT16_SCALE32, out=out)
+        return out
+
+    def convert_bytes(self, data):
+        """リトルエンディアンの 16ビット PCM のバイト列を float32 に変換する"""
+        return self.convert(np.frombuffer(data, dtype='<i2'))
+
+
+class MappedWav:
+    """
+    PCM データ部をメモリマップした WAV ファイル
+    ・pcm は (フレーム数, チャンネル数) の int16 配列（ファイルへのビューでありコピーではない）
+    ・with 文で使うと終了時にマップを解放する
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.channels, self.rate, data_offset, data_size = _parse_wav_header(path)
+        self.sampwidth = 2
+        self.nframes = data_size // (self.sampwidth * self.channels)
+        if self.nframes > 0:
+            self.pcm = np.memmap(path, dtype='<i2', mode='r', offset=data_offset,
+                                 shape=(self.nframes, self.channels))
+        else:
+            self.pcm = np.zeros((0, self.channels), dtype='<i2')
+
+    @property
+    def duration(self):
+        """音声の長さ（秒）"""
+        return self.nframes / self.rate
+
+    def chunks(self, chunk_size, start=0, end=None, converter=None):
+        """
+        (先頭フレーム位置, float32 のチャンク) を順に返す
+        ・モノラルの場合は1次元、複数チャンネルの場合は (フレーム数, チャンネル数) の配列
+        ・最後のチャンクは chunk_size より短いことがある
+        ・converter（PCMConverter）を渡すとそのバッファに変換する。この場合チャンクは次のチャンクを
+          取り出すまでしか有効でないため、リストに溜めるような使い方では渡さないこと
+        """
+        end = self.nframes if end is None else min(end, self.nframes)
+        for offset in range(start, end, chunk_size):
+            block = self.pcm[offset:min(offset + chunk_size, end)]
+            if self.channels == 1:
+                block = block[:, 0]
+            if converter is not None:
+                chunk = converter.convert(block)
+            else:
+                chunk = block.astype(np.float32)
+                chunk *= _INT16_SCALE32
+            yield offset, chunk
+
+    def read(self, start=0, end=None):
+        """
+        指定範囲をまとめて float32 で読み込む（全体が必要な処理用）
+        """
+        end = self.nframes if end is None else min(end, self.nframes)
+        for _, chunk in self.chunks(max(end - start, 1), start, end):
+            return chunk
+        return np.zeros((0,) if self.channels == 1 else (0, self.channels), dtype=np.float32)
+
+    def close(self):
+        """メモリマップを解放する"""
+        self.pcm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ArrayWav:
+    """
+    メモリ上の float32 の音声を MappedWav と同じ形で扱う（WAV 以外の形式を読み込んだ場合など）
+    ・pcm は (フレーム数, チャンネル数) の配列。値の範囲は [-1.0, 1.0) のまま
+    """
+
+    def __init__(self, speech, rate, path=None):
+        speech = np.asarray(speech, dtype=np.float32)
+        self.path = path
+        self.pcm = speech.reshape(len(speech), -1)
+        self.rate = rate
+        self.channels = self.pcm.shape[1]
+        self.nframes = len(self.pcm)
+
+    @property
+    def duration(self):
+        """音声の長さ（秒）"""
+        return self.nframes / self.rate
+
+    def read(self, start=0, end=None):
+        """指定範囲を float32 で返す（モノラルの場合は1次元）"""
+        block = self.pcm[start:self.nframes if end is None else min(end, self.nframes)]
+        return block[:, 0] if self.channels == 1 else block
+
+    def close(self):
+        self.pcm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_wav(path):
+    """
+    WAV ファイルをメモリマップして開く
+    """
+    return MappedWav(path)
+
+
+def load_speech(path):
+    """WAV ファイル全体を 16kHz・モノラルの float32 配列にする"""
+    with open_wav(path) as wav:
+        speech = wav.read()
+        if wav.rate != TARGET_SAMPLE_RATE or wav.channels > 1:
+            resampler = StreamingResampler(wav.rate, TARGET_SAMPLE_RATE)
+            speech = resampler.process(speech)
+            speech = np.concatenate([speech, resampler.flush()])
+    return speech
+
+
+def array_chunks(speech, chunk_size, start=0):
+    """
+    メモリ上の配列を MappedWav.chunks() と同じ形式でチャンクに分割する
+    """
+    for offset in range(start, len(speech), chunk_size):
+        yield offset, speech[offset:offset + chunk_size]
@@ -0,0 +1,307 @@
+"""
+ライブ認識のループに音声を供給する入力（マイク以外も含む）
+
+asr-text.py / mic-asr-summary.py は mic_capture.BufferedCapture の read() で音声を受け取るため、
+同じインターフェースの入力に差し替えれば、マイクのない環境でも同じ流れで動かせる
+（遅延のソークテストや、推論が追いつかない場合の取りこぼしの計測に使う）。
+
+・mic[:<デバイス番号>]: PyAudio のマイク入力（mic_capture.MicCapture）
+・wav:<パス>: WAV ファイルを実時間で再生する（speed で倍速、speed=0 で待たずに流す。loop=1 で繰り返す）
+・stdin: 標準入力の 16 ビット PCM（rate / channels で形式を指定する）
+・unix:<パス>: UNIX ソケットで待ち受け、接続してきた相手から 16 ビット PCM を受け取る
+・synthetic: 発話と無音が交互に続く合成音声を実時間で生成する（seconds で長さ、seed で内容を変える）
+
+入力は "種類[:引数][,キー=値...]" の文字列で指定する（例: "wav:meeting.wav,speed=2"、
+"stdin,rate=48000,channels=2"）。マイク以外の入力は別スレッドで 16kHz・モノラルに変換し、
+frames_per_buffer ごとにリングバッファへ書き込む（マイクのコールバックと同じ粒度）。
+
+・環境変数 ASR_SOURCE: ライブ認識の入力（既定: mic）
+"""
+import os
+import sys
+import stat
+import time
+import socket
+import threading
+import numpy as np
+import audio_io
+from mic_capture import BufferedCapture, MicCapture
+from resampler import StreamingResampler, TARGET_SAMPLE_RATE
+
+SOURCE = os.environ.get('ASR_SOURCE', 'mic')
+# マイク以外の入力が1回に書き込むサンプル数（マイクのコールバックの frames_per_buffer に合わせる）
+FRAMES_PER_BUFFER = 2048
+# 合成音声を生成する単位（秒）
+SYNTHETIC_BLOCK_SECONDS = 60.0
+
+
+def to_pcm16(speech):
+    """[-1.0, 1.0] の float32 を int16 にする"""
+    return np.clip(speech * 32768.0, -32768, 32767).astype(np.int16)
+
+
+def check_socket_path(path):
+    """
+    UNIX ソケットを作るパスを確認し、既にソケットがあれば True を返す
+    ・ソケット以外のファイルがあればパスの指定の誤りとみなし、ValueError を出す（ファイルは消さない）
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return False
+    if not stat.S_ISSOCK(mode):
+        raise ValueError(f"{path} はソケットではないため使えません（既存のファイルは削除しません）")
+    return True
+
+
+def remove_stale_socket(path):
+    """前回の実行で残った UNIX ソケットのファイルを削除する（ソケット以外なら ValueError）"""
+    if check_socket_path(path):
+        os.remove(path)
+
+
+class ThreadedSource(BufferedCapture):
+    """
+    別スレッドで 16kHz・モノラルの音声を生成してリングバッファに書き込む入力
+    ・サブクラスは blocks() で float32 の音声を順に返す
+    ・speed > 0 の場合は音声の長さに合わせて待ち（実時間の speed 倍）、0 の場合は待たずに書き込む
+    ・書き込みが予定より遅れた回数を数える（入力側が実時間を保てていないかの確認用）
+    """
+
+    def __init__(self, speed=1.0, frames_per_buffer=FRAMES_PER_BUFFER, buffer_seconds=30):
+        super().__init__(TARGET_SAMPLE_RATE, 1, buffer_seconds)
+        self.speed = speed
+        self.frames_per_buffer = frames_per_buffer
+        self._stop = threading.Event()
+        self._thread = None
+        self.late_writes = 0
+        self.error = None
+
+    def blocks(self):
+        raise NotImplementedError
+
+    def _run(self):
+        size = self.frames_per_buffer
+        origin = time.monotonic()
+        written = 0
+        try:
+            for speech in self.blocks():
+                for offset in range(0, len(speech), size):
+                    if self._stop.is_set():
+                        return
+                    block = speech[offset:offset + size]
+                    if self.speed > 0:
+                        # 予定の時刻は開始時刻からの累積で決め、待ちの誤差がたまらないようにする
+                        due = origin + (written + len(block)) / (self.rate * self.speed)
+                        delay = due - time.monotonic()
+                        if delay > 0:
+                            self._stop.wait(delay)
+                        elif delay < -size / self.rate:
+                            self.late_writes += 1
+                    self.push(to_pcm16(block))
+                    written += len(block)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            self.finish()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"source-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def report(self):
+        text = super().report() + f", 入力: {self.describe()}"
+        if self.late_writes:
+            text += f" (書き込みの遅れ {self.late_writes}回)"
+        if self.error is not None:
+            text += f"\n入力のエラー: {self.error}"
+        return text
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+
+class WavSource(ThreadedSource):
+    """
+    WAV ファイルを実時間で再生する入力（16kHz・モノラル以外は変換して流す）
+    ・loop=True の場合はファイルの終わりで先頭に戻り、close() まで流し続ける
+    """
+    name = 'wav'
+
+    def __init__(self, path, speed=1.0, loop=False, **options):
+        super().__init__(speed, **options)
+        self.path = path
+        self.loop = loop
+
+    def blocks(self):
+        while True:
+            with audio_io.open_wav(self.path) as wav:
+                chunks = wav.chunks(self.frames_per_buffer)
+                if wav.rate != TARGET_SAMPLE_RATE or wav.channels > 1:
+                    chunks = StreamingResampler(wav.rate, TARGET_SAMPLE_RATE).resample_chunks(
+                        chunks, self.frames_per_buffer)
+                for _, chunk in chunks:
+                    yield chunk
+            if not self.loop:
+                return
+
+    def describe(self):
+        return f"{self.path} ({'待たずに' if self.speed <= 0 else f'{self.speed:g}倍速'}{', 繰り返し' if self.loop else ''})"
+
+
+class PipeSource(ThreadedSource):
+    """
+    16 ビット・リトルエンディアンの PCM を標準入力または UNIX ソケットから受け取る入力
+    ・rate / channels が 16kHz・モノラルでなければ変換する
+    ・送る側が実時間で送ってくるため待たない（speed=0）。相手が閉じたら入力の終わりとする
+    """
+    name = 'pipe'
+
+    def __init__(self, path=None, rate=TARGET_SAMPLE_RATE, channels=1, **options):
+        options.setdefault('speed', 0.0)
+        super().__init__(**options)
+        self.path = path
+        self.input_rate = rate
+        self.input_channels = channels
+        self._listener = None
+        if path is not None:
+            # パスの指定の誤りは、入力を開始する前に知らせる
+            check_socket_path(path)
+
+    def _open(self):
+        """読み込み元のファイルオブジェクト（UNIX ソケットの場合は接続を待つ）"""
+        if self.path is None:
+            return sys.stdin.buffer
+        remove_stale_socket(self.path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.path)
+        self._listener.listen(1)
+        print(f"{self.path} で音声の接続を待っています...", file=sys.stderr, flush=True)
+        conn, _ = self._listener.accept()
+        return conn.makefile('rb')
+
+    def blocks(self):
+        stream = self._open()
+        frame_bytes = 2 * self.input_channels
+        resampler = None
+        if self.input_rate != TARGET_SAMPLE_RATE or self.input_channels > 1:
+            resampler = StreamingResampler(self.input_rate, TARGET_SAMPLE_RATE)
+        converter = audio_io.PCMConverter()
+        pending = b''
+        while True:
+            data = stream.read1(self.frames_per_buffer * frame_bytes) if hasattr(stream, 'read1') \
+                else stream.read(self.frames_per_buffer * frame_bytes)
+            if not data:
+                break
+            # フレームの途中で切れた分は次の読み込みとつなげる
+            data = pending + data
+            usable = len(data) - len(data) % frame_bytes
+            pending = data[usable:]
+            speech = converter.convert_bytes(data[:usable])
+            if self.input_channels > 1:
+                speech = speech.reshape(-1, self.input_channels)
+            # 変換のバッファは次の読み込みで上書きされるが、書き込みはその前に終わる
+            yield resampler.process(speech) if resampler is not None else speech
+        if resampler is not None:
+            yield resampler.flush()
+
+    def describe(self):
+        where = self.path if self.path is not None else "標準入力"
+        return f"{where} ({self.input_rate}Hz, {self.input_channels}チャンネル)"
+
+    def close(self):
+        super().close()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            try:
+                remove_stale_socket(self.path)
+            except ValueError:
+                # 待ち受けの後にソケット以外に置き換わっていれば、そのまま残す
+                pass
+
+
+class SyntheticSource(ThreadedSource):
+    """
+    発話と無音が交互に続く合成音声（bench_common.synthetic_speech）を実時間で生成する入力
+    ・seconds を省略すると close() まで生成し続ける
+    ・seed を変えると別の内容になる（複数の入力を並べる場合に同期しないようにする）
+    """
+    name = 'synthetic'
+
+    def __init__(self, seconds=None, seed=0, pauses=True, **options):
+        super().__init__(**options)
+        self.seconds = seconds
+        self.seed = seed
+        self.pauses = pauses
+
+    def blocks(self):
+        from bench_common import synthetic_speech
+        remaining = self.seconds
+        block = 0
+        while remaining is None or remaining > 0:
+            seconds = SYNTHETIC_BLOCK_SECONDS if remaining is None else min(remaining, SYNTHETIC_BLOCK_SECONDS)
+            yield synthetic_speech(seconds, seed=self.seed * 1000003 + block, pauses=self.pauses)
+            block += 1
+            if remaining is not None:
+                remaining -= seconds
+
+    def describe(self):
+        length = f"{self.seconds:g}秒" if self.seconds is not None else "無制限"
+        return f"合成音声 (seed={self.seed}, {length}, {'待たずに' if self.speed <= 0 else f'{self.speed:g}倍速'})"
+
+
+def parse_source(spec):
+    """
+    "種類[:引数][,キー=値...]" を (種類, 引数, オプションの辞書) にする
+    ・値は数値にできれば数値にする
+    """
+    head, *pairs = spec.split(',')
+    kind, _, arg = head.partition(':')
+    options = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        for convert in (int, float):
+            try:
+                value = convert(value)
+                break
+            except ValueError:
+                continue
+        options[key.strip()] = value
+    return kind.strip(), arg or None, options
+
+
+def open_source(spec=SOURCE, rate=TARGET_SAMPLE_RATE, channels=1, frames_per_buffer=FRAMES_PER_BUFFER,
+                buffer_seconds=30, seed=None):
+    """
+    入力の指定からまだ開始していない入力を作る（start() で開始する）
+    ・マイク以外の入力は常に 16kHz・モノラルで書き込む（rate / channels はマイクの取り込みの形式）
+    ・seed は合成音声の指定に seed がない場合に使う（複数の入力を並べる場合に別々の内容にする）
+    """
+    kind, arg, options = parse_source(spec)
+    options.setdefault('frames_per_buffer', frames_per_buffer)
+    options.setdefault('buffer_seconds', buffer_seconds)
+    if kind == 'mic':
+        if rate != TARGET_SAMPLE_RATE or channels != 1:
+            raise ValueError("マイク入力の形式は 16kHz・モノラルを前提としています")
+        return MicCapture(rate=rate, channels=channels,
+                          input_device_index=int(arg) if arg is not None else None, **options)
+    if kind == 'wav':
+        if arg is None:
+            raise ValueError("wav の入力にはファイルのパスを指定してください（例: wav:meeting.wav）")
+        return WavSource(arg, loop=bool(options.pop('loop', False)), **options)
+    if kind == 'stdin':
+        return PipeSource(None, **options)
+    if kind == 'unix':
+        if arg is None:
+            raise ValueError("unix の入力にはソケットのパスを指定してください（例: unix:/tmp/asr.sock）")
+        return PipeSource(arg, **options)
+    if kind == 'synthetic':
+        if seed is not None:
+            options.setdefault('seed', seed)
+        return SyntheticSource(pauses=bool(options.pop('pauses', True)), **options)
+    raise ValueError(f"不明な入力です: {spec}（mic / wav / stdin / unix / synthetic から選んでください）")
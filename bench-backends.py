@@ -0,0 +1,183 @@
+"""
+音声認識エンジン（asr_backend）を同じ WAV ファイル群で比べ、RTF・遅延・メモリを表示する
+
+エンジンごとに別のプロセスでモデルを読み込み（メモリを互いに含めないため）、次の 2 通りで計測する。
+・ストリーミング: マイク入力と同じようにチャンクごとに feed() し、VAD で区切った発話の終わりで
+  finalize() する（最大速度）。チャンクあたりの処理時間、発話の終わりから確定した結果が出るまでの
+  時間（確定の遅延）、最初の文字が出るまでに流した音声の長さ、全体の RTF を求める
+・バッチ: 全ファイルを --files-per-batch 件ずつ transcribe_batch() に渡し、RTF を求める
+あわせて、読み込みにかかった時間と読み込み後・ピークの RSS を記録する。
+WAV ファイルと同じ名前の .txt があれば、バッチの結果の文字誤り率も表示する。
+
+最後に、確定の遅延が最も小さいエンジン（ライブ向け）とバッチの RTF が最も小さいエンジン
+（大量のファイル向け）を表示する。
+
+使い方:
+    python bench-backends.py corpus/*.wav [--engines espnet k2] [-o result.json]
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import multiprocessing as mp
+import asr_backend
+import asr_config
+from bench_common import load_speech, load_reference, peak_rss_mb, current_rss_mb
+from metrics import percentile, error_rate
+from resampler import TARGET_SAMPLE_RATE
+from vad import EnergyVAD
+
+# バッチで1回の transcribe_batch() に渡すファイル数
+FILES_PER_BATCH = 8
+
+
+def stream_pass(backend, speeches):
+    """ストリーミングの流れで全ファイルを処理し、計測値を辞書で返す"""
+    chunk_latencies = []
+    final_latencies = []
+    first_text = []
+    compute = 0.0
+    size = backend.chunk_size
+    for speech in speeches:
+        vad = EnergyVAD(rate=TARGET_SAMPLE_RATE)
+        first = None
+        for offset in range(0, len(speech), size):
+            chunk, is_final = vad.gate(speech[offset:offset + size], is_last=offset + size >= len(speech))
+            if chunk is None:
+                continue
+            start = time.perf_counter()
+            text = backend.feed(chunk)
+            elapsed = time.perf_counter() - start
+            chunk_latencies.append(elapsed)
+            compute += elapsed
+            if is_final:
+                start = time.perf_counter()
+                text = backend.finalize()
+                elapsed = time.perf_counter() - start
+                final_latencies.append(elapsed)
+                compute += elapsed
+            if text and first is None:
+                first = (offset + len(chunk)) / TARGET_SAMPLE_RATE
+        if first is not None:
+            first_text.append(first)
+    audio = sum(len(speech) for speech in speeches) / TARGET_SAMPLE_RATE
+    return {
+        'stream_rtf': round(compute / audio, 4) if audio else 0.0,
+        'chunk_p50_ms': round(percentile(chunk_latencies, 50) * 1000, 2),
+        'chunk_p95_ms': round(percentile(chunk_latencies, 95) * 1000, 2),
+        'final_p50_ms': round(percentile(final_latencies, 50) * 1000, 2),
+        'final_p95_ms': round(percentile(final_latencies, 95) * 1000, 2),
+        'first_text_audio_s': round(percentile(first_text, 50), 3) if first_text else None,
+        'utterances': len(final_latencies),
+    }
+
+
+def batch_pass(backend, speeches, files_per_batch):
+    """全ファイルを transcribe_batch() で処理し、(計測値, テキストのリスト) を返す"""
+    texts = []
+    start = time.perf_counter()
+    for i in range(0, len(speeches), files_per_batch):
+        texts += backend.transcribe_batch(speeches[i:i + files_per_batch])
+    elapsed = time.perf_counter() - start
+    audio = sum(len(speech) for speech in speeches) / TARGET_SAMPLE_RATE
+    return {
+        'batch_rtf': round(elapsed / audio, 4) if audio else 0.0,
+        'batch_seconds': round(elapsed, 3),
+        'files_per_minute': round(len(speeches) / elapsed * 60, 1) if elapsed else 0.0,
+    }, texts
+
+
+def run_engine(engine, config, options, wavfiles, files_per_batch):
+    """
+    1つのエンジンを読み込んで計測する（エンジンごとに別のプロセスで呼ぶ）
+    """
+    rss_start = current_rss_mb()
+    backend = asr_backend.create_backend(engine, config, **options)
+    load_seconds = backend.load()
+    rss_loaded = current_rss_mb()
+    speeches = [load_speech(f) for f in wavfiles]
+
+    result = {'engine': engine, 'description': backend.describe(), 'load_seconds': round(load_seconds, 3)}
+    # 1回目の呼び出しにかかる初期化の時間を計測から除く
+    backend.transcribe_batch([speeches[0][:TARGET_SAMPLE_RATE]])
+    result.update(stream_pass(backend, speeches))
+    batch, texts = batch_pass(backend, speeches, files_per_batch)
+    result.update(batch)
+
+    errors = []
+    for wavfile, text in zip(wavfiles, texts):
+        reference = load_reference(wavfile)
+        if reference is not None:
+            errors.append(error_rate(reference, text))
+    result['cer'] = round(sum(errors) / len(errors), 4) if errors else None
+    result['rss_start_mb'] = round(rss_start, 1) if rss_start is not None else None
+    result['rss_loaded_mb'] = round(rss_loaded, 1) if rss_loaded is not None else None
+    result['peak_rss_mb'] = round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None
+    result['texts'] = texts
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="音声認識エンジンの RTF・遅延・メモリを比較する")
+    parser.add_argument('wavfiles', nargs='+', help="計測に使う WAV ファイル")
+    parser.add_argument('--engines', nargs='+', default=['espnet', 'k2'], choices=list(asr_backend.BACKENDS),
+                        help="比較するエンジン")
+    parser.add_argument('--files-per-batch', type=int, default=FILES_PER_BATCH,
+                        help="バッチで1回にまとめて処理するファイル数")
+    parser.add_argument('-o', '--output', help="結果を保存する JSON ファイル")
+    asr_backend.add_arguments(parser, select=False)
+    asr_config.add_arguments(parser)
+    args = parser.parse_args()
+    config = asr_config.from_args(args)
+
+    # メモリを互いに含めないよう、エンジンごとに新しいプロセスで計測する
+    ctx = mp.get_context('spawn')
+    results = []
+    for engine in args.engines:
+        print(f"{engine} を計測しています...", flush=True)
+        options = asr_backend.options_from_args(args, engine)
+        try:
+            with ctx.Pool(1) as pool:
+                result = pool.apply(run_engine, (engine, config, options, args.wavfiles,
+                                                 max(1, args.files_per_batch)))
+        except Exception as e:
+            print(f"{engine}: 計測できませんでした: {type(e).__name__}: {e}")
+            continue
+        print(result['description'])
+        results.append(result)
+    if not results:
+        sys.exit(1)
+
+    columns = [('load_seconds', "ロード[s]"), ('stream_rtf', "RTF(逐次)"), ('batch_rtf', "RTF(バッチ)"),
+               ('chunk_p95_ms', "チャンクp95[ms]"), ('final_p50_ms', "確定p50[ms]"), ('final_p95_ms', "確定p95[ms]"),
+               ('first_text_audio_s', "最初の文字[s]"), ('files_per_minute', "ファイル/分"),
+               ('rss_loaded_mb', "RSS[MB]"), ('peak_rss_mb', "ピーク[MB]"), ('cer', "CER")]
+    print(f"\n{'エンジン':<10}" + "".join(f"{title:>16}" for _, title in columns))
+    for result in results:
+        print(f"{result['engine']:<10}" + "".join(f"{str(result[key]):>16}" for key, _ in columns))
+
+    live = min(results, key=lambda r: (r['final_p95_ms'], r['chunk_p95_ms']))
+    bulk = min(results, key=lambda r: r['batch_rtf'])
+    print(f"\nライブ向け（確定の遅延が最小）: {live['engine']}")
+    print(f"大量のファイル向け（バッチの RTF が最小）: {bulk['engine']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'files': args.wavfiles,
+                'inference': config._asdict(),
+                'results': results,
+                'live': live['engine'],
+                'bulk': bulk['engine'],
+            }, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
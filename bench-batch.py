@@ -0,0 +1,84 @@
+"""
+複数ストリームのデコードを、ストリームごとの逐次呼び出しと InferenceThread で比較する
+
+同じ WAV ファイルを N 本のセッションで最大速度で流し、全体の実時間比（RTF）を計測する。
+InferenceThread もモデルは1セッションずつ呼ぶため、差は推論スレッドとの受け渡しのオーバーヘッドになる。
+
+使い方:
+    python bench-batch.py input.wav [--streams 1 4 8] [--max-group 8] [--max-wait-ms 10]
+"""
+import time
+import asyncio
+import argparse
+import asr_config
+from bench_common import load_chunks
+from resampler import TARGET_SAMPLE_RATE
+from asr_session import StreamSession, fork_speech2text
+from inference_thread import InferenceThread, MAX_GROUP, MAX_WAIT
+
+# 1回に渡すサンプル数（マイク入力と同じ 0.128 秒）
+CHUNK = 2048
+
+
+def run_sequential(base, chunks, n):
+    """ストリームごとに speech2text を呼ぶ（チャンクごとに全ストリームを順に処理する）"""
+    sessions = [StreamSession(i, fork_speech2text(base)) for i in range(n)]
+    start = time.perf_counter()
+    for i, chunk in enumerate(chunks):
+        is_final = i == len(chunks) - 1
+        for session in sessions:
+            session.decode(chunk, is_final)
+    return time.perf_counter() - start, [s.text for s in sessions], None
+
+
+def run_threaded(base, chunks, n, max_group, max_wait):
+    """各ストリームが独立に InferenceThread へ要求を出す"""
+    sessions = [StreamSession(i, fork_speech2text(base)) for i in range(n)]
+    inference = InferenceThread(max_group=max_group, max_wait=max_wait)
+
+    async def stream(session):
+        for i, chunk in enumerate(chunks):
+            await inference.decode(session, chunk, i == len(chunks) - 1)
+
+    async def run_all():
+        await asyncio.gather(*(stream(s) for s in sessions))
+
+    start = time.perf_counter()
+    asyncio.run(run_all())
+    elapsed = time.perf_counter() - start
+    inference.close()
+    return elapsed, [s.text for s in sessions], inference
+
+
+def main():
+    parser = argparse.ArgumentParser(description="複数ストリームのデコード方式を比較する")
+    parser.add_argument('wavfile', help="各ストリームで流す WAV ファイル")
+    parser.add_argument('--streams', type=int, nargs='+', default=[1, 4, 8], help="同時ストリーム数")
+    parser.add_argument('--max-group', type=int, default=MAX_GROUP)
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT * 1000)
+    asr_config.add_arguments(parser)
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.wavfile, CHUNK)
+    audio_seconds = sum(len(c) for c in chunks) / TARGET_SAMPLE_RATE
+
+    print("ASRモデルをロード中...")
+    config = asr_config.from_args(args)
+    base = asr_config.load_speech2text(config)
+
+    print(f"音声: {audio_seconds:.1f}秒 × ストリーム数, チャンク: {CHUNK}, デバイス: {config.device}")
+    header = f"{'ストリーム数':>10} {'方式':<11} {'経過[s]':>8} {'全体RTF':>8} {'平均件数':>10} {'結果一致':>8}"
+    print(header)
+    print("-" * len(header))
+    for n in args.streams:
+        t_seq, texts_seq, _ = run_sequential(base, chunks, n)
+        t_thr, texts_thr, inference = run_threaded(base, chunks, n, args.max_group, args.max_wait_ms / 1000)
+        total_audio = audio_seconds * n
+        same = "はい" if texts_seq == texts_thr else "いいえ"
+        print(f"{n:>10} {'sequential':<11} {t_seq:>8.2f} {t_seq / total_audio:>8.3f} {'-':>10} {'':>8}")
+        print(f"{n:>10} {'thread':<11} {t_thr:>8.2f} {t_thr / total_audio:>8.3f}"
+              f" {inference.mean_group_size:>10.2f} {same:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+チャンク長ごとの実時間比（RTF）と遅延のトレードオフを計測する
+
+WAV ファイルをエンコーダの1ホップ分の倍数のチャンク長でデコードし、チャンク長ごとに
+RTF と遅延（チャンクが揃うまでの待ち時間 + 処理時間）のパーセンタイルを表示する。
+比較のため、モデルに揃えていない従来のチャンク長（640 / 2048）も計測する。
+
+使い方:
+    python bench-chunk.py input.wav [--hops 1 2 4] [--extra 640 2048]
+"""
+import time
+import argparse
+import asr_config
+import audio_io
+import chunking
+from bench_common import load_speech
+from resampler import TARGET_SAMPLE_RATE
+
+
+def measure(speech2text, speech, chunk):
+    """chunk サンプルずつデコードし、計測値を返す"""
+    chunker = chunking.AdaptiveChunker(chunk, rate=TARGET_SAMPLE_RATE, max_multiple=1)
+    for _, piece in audio_io.array_chunks(speech, chunk):
+        start = time.perf_counter()
+        speech2text(speech=piece, is_final=False)
+        chunker.record(len(piece), time.perf_counter() - start)
+    speech2text(speech=speech[:0], is_final=True)
+    return chunker.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="チャンク長ごとの RTF と遅延を計測する")
+    parser.add_argument('wavfile', help="デコードする WAV ファイル")
+    parser.add_argument('--hops', type=int, nargs='+', default=[1, 2, 4],
+                        help="チャンク長（エンコーダのホップ数の倍数）")
+    parser.add_argument('--extra', type=int, nargs='*', default=[640, 2048],
+                        help="比較用に計測するチャンク長（サンプル数）")
+    asr_config.add_arguments(parser)
+    args = parser.parse_args()
+
+    speech2text = asr_config.load_speech2text(asr_config.from_args(args))
+    print(chunking.describe(speech2text, TARGET_SAMPLE_RATE))
+    speech = load_speech(args.wavfile)
+    print(f"音声: {len(speech) / TARGET_SAMPLE_RATE:.1f}秒")
+
+    sizes = [(f"{hops}ホップ", chunking.model_chunk_size(speech2text, hops)) for hops in args.hops]
+    sizes += [("固定", size) for size in args.extra]
+    header = f"{'指定':<8} {'チャンク':>8} {'長さ[s]':>8} {'呼出回数':>8} {'RTF':>7} {'遅延p50[s]':>11} {'遅延p95[s]':>11}"
+    print(header)
+    print("-" * len(header))
+    for label, size in sizes:
+        s = measure(speech2text, speech, size)
+        print(f"{label:<8} {size:>8} {s['chunk_seconds']:>8.3f} {s['calls']:>8} {s['rtf']:>7.3f}"
+              f" {s['latency_p50_s']:>11.3f} {s['latency_p95_s']:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+デコード方法ごとの速度と精度を並べて比較する
+
+ローカルの WAV ファイル群を、ビーム幅を変えたビームサーチと CTC の貪欲デコードでそれぞれ
+デコードし、実時間比（RTF）と文字誤り率を表示する。WAV ファイルと同じ名前の .txt があれば
+それを正解とし、なければ最初の設定（既定ではビーム幅 20）の結果を基準にしたずれを表示する。
+
+モデルは一度だけロードし、ビームサーチのパラメータを切り替えながら計測する。
+
+使い方:
+    python bench-decode.py corpus/*.wav [--beams 20 10 5 1] [--ctc-weight 0.5]
+"""
+import os
+import argparse
+import asr_config
+import chunking
+import decoding
+from bench_common import load_chunks, load_reference, decode
+from resampler import TARGET_SAMPLE_RATE
+from metrics import error_rate
+
+
+def run(speech2text, inputs):
+    """全ファイルをデコードし、ファイルごとの (テキスト, 経過時間) を返す"""
+    # 1回目の呼び出しにかかる初期化の時間を計測から除く
+    decode(speech2text, inputs[0][1][:2])
+    return [decode(speech2text, chunks) for _, chunks, _ in inputs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="デコード方法ごとの RTF と文字誤り率を比較する")
+    parser.add_argument('wavfiles', nargs='+', help="デコードする WAV ファイル")
+    parser.add_argument('--beams', type=int, nargs='+', default=[20, 10, 5, 1], help="比較するビーム幅")
+    parser.add_argument('--chunk', default=chunking.CHUNK_MODE,
+                        help="1回に渡すサンプル数（'model' でエンコーダのブロック設定に合わせる）")
+    asr_config.add_arguments(parser)
+    args = parser.parse_args()
+
+    # ビームサーチのパラメータは下で切り替えるため、ロード時には既定のまま構築する
+    config = asr_config.from_args(args)._replace(beam_size=None, nbest=None, greedy_ctc=False)
+    speech2text = asr_config.load_speech2text(config)
+    chunk = chunking.resolve_chunk_size(speech2text, args.chunk)
+
+    inputs = [(f, load_chunks(f, chunk), load_reference(f)) for f in args.wavfiles]
+    inputs = [item for item in inputs if item[1]]
+    if not inputs:
+        parser.error("音声が空です")
+    total = sum(len(c) for _, chunks, _ in inputs for c in chunks) / TARGET_SAMPLE_RATE
+    has_reference = all(reference is not None for _, _, reference in inputs)
+    print(f"ファイル数: {len(inputs)}, 音声: {total:.1f}秒, チャンク: {chunk}サンプル,"
+          f" 精度の基準: {'正解テキスト' if has_reference else f'ビーム幅 {args.beams[0]} の結果'}")
+
+    results = []
+    for beam in args.beams:
+        print(f"ビーム幅 {beam} でデコード中...")
+        decoding.configure_beam(speech2text, beam_size=beam)
+        results.append((f"beam={beam}", run(speech2text, inputs)))
+    print("greedy-ctc でデコード中...")
+    results.append(("greedy-ctc", run(decoding.GreedyCTCStreaming(speech2text), inputs)))
+
+    if has_reference:
+        references = [reference for _, _, reference in inputs]
+    else:
+        references = [text for text, _ in results[0][1]]
+
+    header = f"{'方式':<12} {'経過[s]':>8} {'RTF':>7} {'速度比':>7} {'文字誤り率':>10}"
+    print(header)
+    print("-" * len(header))
+    baseline = sum(t for _, t in results[0][1])
+    for label, outputs in results:
+        elapsed = sum(t for _, t in outputs)
+        errors = [error_rate(ref, text) for ref, (text, _) in zip(references, outputs)]
+        print(f"{label:<12} {elapsed:>8.2f} {elapsed / total:>7.3f} {baseline / elapsed:>7.2f}"
+              f" {sum(errors) / len(errors) * 100:>9.2f}%")
+
+    if len(inputs) > 1:
+        print("\nファイルごとの文字誤り率[%]:")
+        print(f"{'ファイル':<24} " + " ".join(f"{label:>12}" for label, _ in results))
+        for i, (wavfile, _, _) in enumerate(inputs):
+            rates = [error_rate(references[i], outputs[i][0]) * 100 for _, outputs in results]
+            print(f"{os.path.basename(wavfile):<24} " + " ".join(f"{r:>12.2f}" for r in rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+CPU 推論で fp32 と int8 動的量子化の速度と認識結果の差を比較する
+
+同じ WAV ファイル群をそれぞれの精度でデコードし、実時間比（RTF）と、fp32 の結果を基準にした
+int8 の文字誤り率（量子化による認識結果のずれ）を表示する。WAV ファイルと同じ名前の .txt
+（例: a.wav に対して a.txt）があれば、それを正解として各精度の文字誤り率も表示する。
+
+使い方:
+    python bench-int8.py a.wav b.wav [--threads 4] [--chunk 2048]
+"""
+import os
+import argparse
+import asr_config
+from bench_common import load_chunks, load_reference, decode
+from resampler import TARGET_SAMPLE_RATE
+from metrics import error_rate
+
+# 1回に渡すサンプル数（マイク入力と同じ 0.128 秒）
+CHUNK = 2048
+
+
+def run(config, inputs):
+    """1つの精度で全ファイルをデコードし、ファイルごとの (テキスト, 経過時間) を返す"""
+    speech2text = asr_config.load_speech2text(config)
+    # 1回目の呼び出しにかかる初期化の時間を計測から除く
+    decode(speech2text, inputs[0][1][:2])
+    return [decode(speech2text, chunks) for _, chunks, _ in inputs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="fp32 と int8 動的量子化の RTF と認識結果の差を比較する")
+    parser.add_argument('wavfiles', nargs='+', help="デコードする WAV ファイル")
+    parser.add_argument('--chunk', type=int, default=CHUNK, help="1回に渡すサンプル数")
+    asr_config.add_arguments(parser)
+    args = parser.parse_args()
+    # 動的量子化は CPU でのみ使えるため、両方とも CPU で比較する
+    config = asr_config.from_args(args)._replace(device='cpu')
+
+    inputs = [(f, load_chunks(f, args.chunk), load_reference(f)) for f in args.wavfiles]
+    inputs = [item for item in inputs if item[1]]
+    if not inputs:
+        parser.error("音声が空です")
+    durations = [sum(len(c) for c in chunks) / TARGET_SAMPLE_RATE for _, chunks, _ in inputs]
+
+    print("fp32 でデコード中...")
+    fp32 = run(config._replace(int8=False), inputs)
+    print("int8 でデコード中...")
+    int8 = run(config._replace(int8=True), inputs)
+
+    header = f"{'ファイル':<24} {'音声[s]':>8} {'fp32 RTF':>9} {'int8 RTF':>9} {'速度比':>7} {'ずれ(CER)':>10}"
+    print(header)
+    print("-" * len(header))
+    drifts = []
+    for (wavfile, _, reference), duration, (text32, t32), (text8, t8) in zip(inputs, durations, fp32, int8):
+        drift = error_rate(text32, text8)
+        drifts.append(drift)
+        name = os.path.basename(wavfile)
+        print(f"{name:<24} {duration:>8.1f} {t32 / duration:>9.3f} {t8 / duration:>9.3f}"
+              f" {t32 / t8:>7.2f} {drift * 100:>9.2f}%")
+        if reference is not None:
+            print(f"{'':<24} 正解との文字誤り率: fp32 {error_rate(reference, text32) * 100:.2f}%,"
+                  f" int8 {error_rate(reference, text8) * 100:.2f}%")
+
+    total = sum(durations)
+    t32 = sum(t for _, t in fp32)
+    t8 = sum(t for _, t in int8)
+    print("-" * len(header))
+    print(f"{'合計':<24} {total:>8.1f} {t32 / total:>9.3f} {t8 / total:>9.3f} {t32 / t8:>7.2f}"
+          f" {sum(drifts) / len(drifts) * 100:>9.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+ライブ認識の流れをマイクなしで N 本同時に動かし、遅延と取りこぼしを計測する
+
+各ストリームは asr-text.py と同じ流れ（入力のリングバッファから chunk の倍数で読み出し、
+VAD で無音を読み飛ばしてデコードする）で、入力は audio_source の実時間の入力を使う。
+推論が実時間に追いつかなければリングバッファに音声がたまり、容量を超えた分は取りこぼしになる。
+ストリームごとに次の値を表示する。
+・チャンクあたりのデコード時間（p50 / p95 / 最大）と RTF
+・読み出した時点でバッファに残っていた音声の長さ（p95 / 最大。入力から認識までの遅れの目安）
+・取りこぼしたサンプル数とバッファの最大使用量
+
+モデルは一度だけ読み込み、ストリームごとにデコードの状態だけを複製する（asr_session.fork_speech2text）。
+いずれかのストリームで取りこぼしがあれば終了コード 1 を返す。
+
+使い方:
+    python bench-live.py --sources 4 --seconds 600 --fake
+    python bench-live.py --source wav:meeting.wav --sources 2 -o live.json
+    python bench-live.py --source "synthetic,speed=2" --sources 8 --buffer-seconds 5 --fake
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+import numpy as np
+import asr_config
+import audio_source
+import chunking
+from asr_session import fork_speech2text
+from audio_io import PCMConverter
+from metrics import percentile
+from resampler import TARGET_SAMPLE_RATE
+from vad import EnergyVAD, Endpointer
+
+# 推論が遅れている場合に1回でまとめて読み出すチャンク数の上限（asr-text.py と同じ）
+MAX_CHUNKS = 4
+
+
+def run_stream(index, capture, speech2text, chunk_mode, use_vad, stop, results):
+    """
+    1本のストリームを入力が終わるか stop が立つまで処理し、計測値を results[index] に入れる
+    """
+    rate = TARGET_SAMPLE_RATE
+    chunker = chunking.make_chunker(speech2text, chunk_mode, rate=rate)
+    pcm_buffer = np.empty(chunker.max_chunk * MAX_CHUNKS, dtype=np.int16)
+    converter = PCMConverter(chunker.max_chunk * MAX_CHUNKS)
+    vad = EnergyVAD(rate=rate) if use_vad else Endpointer(rate=rate)
+    latencies = []
+    backlogs = []
+    utterances = 0
+    capture.start()
+    while not stop.is_set() and not capture.exhausted:
+        data = capture.read(chunker.chunk, max_chunks=MAX_CHUNKS, out=pcm_buffer)
+        if data is None:
+            continue
+        backlogs.append(len(capture.ring) / rate)
+        data = converter.convert(data)
+        start = time.perf_counter()
+        nsamples = len(data)
+        data, is_final = vad.gate(data, is_last=capture.exhausted)
+        if data is not None:
+            speech2text(speech=data, is_final=is_final)
+            utterances += is_final
+        elapsed = time.perf_counter() - start
+        latencies.append(elapsed)
+        capture.record_inference(nsamples, elapsed)
+        chunker.record(nsamples, elapsed, backlog=len(capture.ring))
+    capture.close()
+
+    stats = capture.stats()
+    results[index] = {
+        'stream': index,
+        'source': capture.describe(),
+        'audio_seconds': round(capture.audio_seconds, 2),
+        'chunks': len(latencies),
+        'utterances': utterances,
+        'rtf': round(stats['rtf'], 4),
+        'latency_p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'latency_p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'latency_max_ms': round(max(latencies, default=0.0) * 1000, 2),
+        'backlog_p95_s': round(percentile(backlogs, 95), 3),
+        'backlog_max_s': round(max(backlogs, default=0.0), 3),
+        'dropped_samples': stats['frames_dropped'],
+        'buffer_high_water': stats['buffer_high_water'],
+        'buffer_capacity': stats['buffer_capacity'],
+        'late_writes': getattr(capture, 'late_writes', 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ライブ認識をマイクなしで複数同時に動かし、遅延と取りこぼしを計測する")
+    parser.add_argument('--source', default='synthetic',
+                        help="入力の指定（audio_source を参照。synthetic はストリームごとに別の内容になる）")
+    parser.add_argument('-n', '--sources', type=int, default=1, help="同時に動かすストリーム数")
+    parser.add_argument('--seconds', type=float, default=60.0,
+                        help="計測する時間（秒）。入力が先に終わった場合はそこで終える")
+    parser.add_argument('--buffer-seconds', type=float, default=30.0, help="入力のリングバッファの長さ（秒）")
+    parser.add_argument('--no-vad', action='store_true',
+                        help="VAD を使わず、発話の長さの上限だけで区切る（Endpointer）")
+    parser.add_argument('--chunk', default=chunking.CHUNK_MODE,
+                        help="チャンク長（'model' / 'adaptive' / サンプル数）")
+    parser.add_argument('--fake', action='store_true',
+                        help="モデルを読み込まず擬似的な認識器を使う（ダウンロードなしで動作確認する）")
+    parser.add_argument('--fake-rtf', type=float, default=0.05, help="--fake の認識器の RTF")
+    parser.add_argument('-o', '--output', help="結果を保存する JSON ファイル")
+    asr_config.add_arguments(parser)
+    args = parser.parse_args()
+    config = asr_config.from_args(args)
+    if args.sources > 1 and audio_source.parse_source(args.source)[0] == 'mic':
+        parser.error("マイク入力は1本しか開けません（--source で wav / synthetic などを指定してください）")
+
+    if args.fake:
+        from fake_asr import FakeSpeech2TextStreaming
+        base = FakeSpeech2TextStreaming(rtf=args.fake_rtf)
+        model = 'fake'
+    else:
+        base = asr_config.load_speech2text(config)
+        model = asr_config.TAG
+    print(chunking.describe(base, TARGET_SAMPLE_RATE))
+
+    captures = []
+    for index in range(max(1, args.sources)):
+        captures.append(audio_source.open_source(args.source, buffer_seconds=args.buffer_seconds, seed=index))
+    print(f"入力: {args.source} x {len(captures)}本, {args.seconds:g}秒間計測します"
+          f"（バッファ {args.buffer_seconds:g}秒）", flush=True)
+
+    stop = threading.Event()
+    results = [None] * len(captures)
+    threads = [threading.Thread(target=run_stream,
+                                args=(i, capture, fork_speech2text(base), args.chunk, not args.no_vad, stop, results),
+                                name=f"stream-{i}", daemon=True)
+               for i, capture in enumerate(captures)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    deadline = start + args.seconds
+    try:
+        while any(thread.is_alive() for thread in threads) and time.perf_counter() < deadline:
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        print("\n中断しました")
+    stop.set()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    results = [result for result in results if result is not None]
+
+    columns = [('audio_seconds', "音声[s]"), ('rtf', "RTF"), ('latency_p50_ms', "p50[ms]"),
+               ('latency_p95_ms', "p95[ms]"), ('latency_max_ms', "最大[ms]"), ('backlog_p95_s', "遅れp95[s]"),
+               ('backlog_max_s', "遅れ最大[s]"), ('dropped_samples', "取りこぼし"), ('late_writes', "入力の遅れ")]
+    print(f"\n{'ストリーム':<8}" + "".join(f"{title:>12}" for _, title in columns))
+    for result in results:
+        print(f"{result['stream']:<8}" + "".join(f"{str(result[key]):>12}" for key, _ in columns))
+    dropped = sum(result['dropped_samples'] for result in results)
+    print(f"\n経過時間 {wall:.1f}秒, 取りこぼし合計 {dropped}サンプル ({dropped / TARGET_SAMPLE_RATE:.2f}秒)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'model': model,
+                'source': args.source,
+                'sources': len(captures),
+                'options': {
+                    'seconds': args.seconds,
+                    'buffer_seconds': args.buffer_seconds,
+                    'vad': not args.no_vad,
+                    'chunk': args.chunk,
+                    'inference': config._asdict(),
+                },
+                'wall_seconds': round(wall, 3),
+                'dropped_samples': dropped,
+                'streams': results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.output}")
+
+    if dropped:
+        print("推論が実時間に追いつかず、音声を取りこぼしました")
+        sys.exit(1)
+    print("取りこぼしはありません")
+
+
+if __name__ == "__main__":
+    main()
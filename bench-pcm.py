@@ -0,0 +1,77 @@
+"""
+16ビット PCM から float32 への変換方法ごとの速度と一時メモリを比較する
+
+各スクリプトが以前チャンクごとに行っていた変換と、事前確保したバッファに書き込む
+PCMConverter を、デコーダに渡すチャンク長（640 / 2048 サンプル）で計測する。
+
+使い方:
+    python bench-pcm.py [--chunks 640 2048] [--repeat 20000]
+"""
+import time
+import argparse
+import tracemalloc
+import numpy as np
+from audio_io import PCMConverter, INT16_SCALE
+
+
+def astype_inplace(pcm):
+    """以前のファイル読み込み: 型変換の1回だけ配列を確保し、スケーリングはその場で行う"""
+    chunk = pcm.astype(np.float32)
+    chunk *= np.float32(INT16_SCALE)
+    return chunk
+
+
+def methods(capacity):
+    """(名前, 変換関数) の列"""
+    converter = PCMConverter(capacity)
+    return [
+        # 以前のマイク入力: float16 で精度を落とし、モデルの中で float32 に戻される
+        ("float16 / 32767 (+float32化)", lambda pcm: (pcm.astype(np.float16) / 32767.0).astype(np.float32)),
+        # 以前のサーバ: 型変換と除算でそれぞれ配列を確保する
+        ("astype(float32) / 32768", lambda pcm: pcm.astype(np.float32) / 32768.0),
+        ("astype(float32) *= scale", astype_inplace),
+        ("PCMConverter", converter.convert),
+    ]
+
+
+def allocated_bytes(func, pcm):
+    """1回の呼び出しで確保されるメモリのピーク（バイト。ビューなどの小さなオブジェクトも含む）"""
+    func(pcm)
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    func(pcm)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return peak
+
+
+def per_call_us(func, pcm, repeat):
+    """1回の呼び出しにかかる時間（マイクロ秒）"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(pcm)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PCM から float32 への変換方法を比較する")
+    parser.add_argument('--chunks', type=int, nargs='+', default=[640, 2048], help="チャンク長（サンプル数）")
+    parser.add_argument('--repeat', type=int, default=20000, help="計測の繰り返し回数")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    header = f"{'チャンク':>8} {'方式':<30} {'時間[us]':>9} {'確保[B]':>9} {'最大誤差':>10}"
+    print(header)
+    print("-" * len(header))
+    for size in args.chunks:
+        pcm = rng.integers(-32768, 32768, size, dtype=np.int16)
+        exact = pcm.astype(np.float64) / 32768.0
+        for name, func in methods(size):
+            error = float(np.max(np.abs(func(pcm).astype(np.float64) - exact)))
+            print(f"{size:>8} {name:<30} {per_call_us(func, pcm, args.repeat):>9.2f}"
+                  f" {allocated_bytes(func, pcm):>9} {error:>10.2e}")
+
+
+if __name__ == "__main__":
+    main()
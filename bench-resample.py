@@ -0,0 +1,104 @@
+"""
+StreamingResampler と librosa.resample（ファイル全体を一括処理）のスループットを比較する
+
+使い方:
+    python bench-resample.py [--seconds 600] [--rates 44100 48000 22050 8000]
+"""
+import time
+import argparse
+import tracemalloc
+import numpy as np
+from resampler import StreamingResampler, TARGET_SAMPLE_RATE
+
+# デコーダに渡すチャンク長（16kHz で 640 サンプル）
+CHUNK = 640
+
+
+def make_signal(rate, seconds, channels):
+    """
+    ベンチマーク用の信号（正弦波の和 + 白色雑音）を作る
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(int(rate * seconds)) / rate
+    x = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.2 * np.sin(2 * np.pi * 3100 * t)
+    x = x[:, None] + 0.05 * rng.standard_normal((len(t), channels))
+    return x.astype(np.float32)
+
+
+def measure(func):
+    """
+    func を実行し、(戻り値, 経過時間, 最初の出力までの時間, ピークメモリ) を返す
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result, first = func(start)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, first, peak
+
+
+def run_librosa(x, rate):
+    import librosa
+
+    def func(start):
+        mono = x.mean(axis=1) if x.shape[1] > 1 else x[:, 0]
+        y = librosa.resample(mono, orig_sr=rate, target_sr=TARGET_SAMPLE_RATE)
+        # 全体の処理が終わるまで最初のチャンクを渡せない
+        return y, time.perf_counter() - start
+    return measure(func)
+
+
+def run_streaming(x, rate):
+    def func(start):
+        resampler = StreamingResampler(rate, TARGET_SAMPLE_RATE)
+        read_chunk = max(1, CHUNK * rate // TARGET_SAMPLE_RATE)
+        chunks = ((i, x[i:i + read_chunk]) for i in range(0, len(x), read_chunk))
+        out = []
+        first = None
+        for _, chunk in resampler.resample_chunks(chunks, CHUNK):
+            if first is None:
+                first = time.perf_counter() - start
+            out.append(chunk)
+        return np.concatenate(out), first
+    return measure(func)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="リサンプラのスループットを比較する")
+    parser.add_argument('--seconds', type=float, default=600, help="テスト信号の長さ（秒）")
+    parser.add_argument('--channels', type=int, default=2, help="テスト信号のチャンネル数")
+    parser.add_argument('--rates', type=int, nargs='+', default=[44100, 48000, 22050, 8000],
+                        help="入力のサンプリングレート")
+    args = parser.parse_args()
+
+    try:
+        import librosa  # noqa: F401
+        has_librosa = True
+    except ImportError:
+        print("librosa がインストールされていないため、StreamingResampler のみ計測します")
+        has_librosa = False
+
+    print(f"信号長: {args.seconds}秒, チャンネル数: {args.channels}, 出力: {TARGET_SAMPLE_RATE}Hz, チャンク: {CHUNK}")
+    header = f"{'入力Hz':>7} {'方式':<10} {'経過[s]':>8} {'実時間比':>9} {'初回出力[ms]':>12} {'ピーク[MB]':>10} {'最大誤差':>9}"
+    print(header)
+    print("-" * len(header))
+    for rate in args.rates:
+        x = make_signal(rate, args.seconds, args.channels)
+        y_stream, t_stream, first_stream, peak_stream = run_streaming(x, rate)
+        rows = [('streaming', y_stream, t_stream, first_stream, peak_stream)]
+        if has_librosa:
+            y_ref, t_ref, first_ref, peak_ref = run_librosa(x, rate)
+            rows.insert(0, ('librosa', y_ref, t_ref, first_ref, peak_ref))
+        for name, y, elapsed, first, peak in rows:
+            err = ""
+            if has_librosa and name == 'streaming':
+                n = min(len(y), len(rows[0][1]))
+                # 端の過渡応答を除いて比較する
+                err = f"{np.abs(y[1000:n - 1000] - rows[0][1][1000:n - 1000]).max():.2e}"
+            print(f"{rate:>7} {name:<10} {elapsed:>8.3f} {args.seconds / elapsed:>8.1f}x "
+                  f"{first * 1000:>12.2f} {peak / 1e6:>10.1f} {err:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+ストリーミング認識の実時間比（RTF）・遅延・メモリ・CPU 使用率を計測し、JSON で出力する
+
+WAV ファイルを実時間（--realtime）または最大速度でストリーミング認識に流し、次の値を計測する。
+・チャンクごとの遅延のパーセンタイル（最大速度では処理時間、実時間ではチャンクの最後のサンプルが
+  届いてから結果が出るまでの時間）
+・最初の文字が出るまでの時間（開始からの経過時間と、その時点までに流した音声の長さ）
+・全体の RTF（処理時間 / 音声長）、ピーク RSS、CPU 使用率（処理中の CPU 時間 / 経過時間）
+
+結果は --output の JSON に保存し、--baseline に以前の結果を渡すと悪化した項目を表示する
+（--tolerance を超えて悪化した項目があれば終了コード 1）。バージョン間の比較に使う。
+
+各スクリプトの処理に合わせるには次のように指定する。
+・localfile-asr-text.py / asr-summary.py: 既定（最大速度、モデルのチャンク長、VAD あり）
+・asr-text.py / mic-asr-summary.py: --realtime --max-chunks 4（--chunk adaptive で自動調整）
+
+--fake を指定するとモデルを読み込まず fake_asr.FakeSpeech2TextStreaming を使うため、
+モデルのダウンロードなしで（CI などで）計測の流れを確認できる。WAV ファイルを省略すると
+--synthetic 秒の合成音声を使う。
+
+使い方:
+    python bench-rtf.py corpus/*.wav [--realtime] [--chunk adaptive] [-o result.json]
+    python bench-rtf.py --fake --synthetic 30 -o result.json --baseline previous.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import asr_config
+import chunking
+import instrumentation
+from bench_common import load_speech, synthetic_speech, peak_rss_mb, cpu_seconds
+from metrics import percentile
+from resampler import TARGET_SAMPLE_RATE
+from vad import EnergyVAD
+
+# 遅延のパーセンタイル
+PERCENTILES = (50, 90, 95, 99)
+# --baseline との比較に使う項目（いずれも大きいほど悪い）
+COMPARE_KEYS = ('rtf', 'latency_p95_ms', 'first_token_s', 'peak_rss_mb')
+
+
+def replay(speech2text, speech, chunker, realtime=False, max_chunks=1, vad=None):
+    """
+    音声をチャンクに分けて speech2text に流し、計測値を辞書で返す
+    ・realtime=True の場合は音声が実時間で届くものとして待ち、遅れている場合は届いている分を
+      最大 max_chunks チャンクまとめて渡す（マイク入力のスクリプトと同じ読み出し方）
+    """
+    rate = TARGET_SAMPLE_RATE
+    latencies = []
+    compute = 0.0
+    calls = 0
+    first_token = None
+    text = ""
+    position = 0
+    start = time.perf_counter()
+    while position < len(speech):
+        size = chunker.chunk
+        if realtime:
+            # 次のチャンクが届くまで待つ（末尾は残りだけ）
+            ready_at = start + min(position + size, len(speech)) / rate
+            delay = ready_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            arrived = min(len(speech), int((time.perf_counter() - start) * rate))
+            take = max(size, min((arrived - position) // size, max_chunks) * size)
+        else:
+            take = size
+        begin = position
+        end = min(position + take, len(speech))
+        chunk = speech[begin:end]
+        is_last = end >= len(speech)
+        position = end
+
+        call_start = time.perf_counter()
+        if vad is not None:
+            with instrumentation.stage('vad'):
+                chunk, is_final = vad.gate(chunk, is_last=is_last)
+        else:
+            is_final = is_last
+        results = None
+        if chunk is not None:
+            with instrumentation.stage('decode'):
+                results = speech2text(speech=chunk, is_final=is_final)
+        done = time.perf_counter()
+        elapsed = done - call_start
+        compute += elapsed
+        calls += 1
+        if realtime:
+            # 処理中に届いた分は入力側に溜まっているものとして渡す（adaptive のチャンク長の調整用）
+            backlog = min(len(speech), int((done - start) * rate)) - end
+            chunker.record(end - begin, elapsed, backlog=max(0, backlog))
+            latencies.append(done - (start + end / rate))
+        else:
+            chunker.record(end - begin, elapsed)
+            latencies.append(elapsed)
+        if results:
+            text = results[0][0] or ""
+            if text and first_token is None:
+                first_token = (done - start, end / rate)
+
+    audio = len(speech) / rate
+    wall = time.perf_counter() - start
+    result = {
+        'audio_seconds': round(audio, 3),
+        'wall_seconds': round(wall, 3),
+        'compute_seconds': round(compute, 3),
+        'rtf': round(compute / audio, 4) if audio else 0.0,
+        'calls': calls,
+        'first_token_s': round(first_token[0], 3) if first_token else None,
+        'first_token_audio_s': round(first_token[1], 3) if first_token else None,
+        'last_text_chars': len(text),
+    }
+    result.update(latency_summary(latencies))
+    return result, latencies
+
+
+def latency_summary(latencies):
+    """遅延（秒）のリストからパーセンタイルと最大値（ミリ秒）を求める"""
+    summary = {f'latency_p{q}_ms': round(percentile(latencies, q) * 1000, 2) for q in PERCENTILES}
+    summary['latency_max_ms'] = round(max(latencies) * 1000, 2) if latencies else 0.0
+    return summary
+
+
+def compare(result, baseline, tolerance):
+    """
+    baseline の summary と比べて、tolerance（割合）を超えて悪化した項目を返す
+    """
+    regressions = []
+    print(f"\n{'項目':<18} {'基準':>10} {'今回':>10} {'変化':>8}")
+    for key in COMPARE_KEYS:
+        old = baseline.get('summary', {}).get(key)
+        new = result['summary'].get(key)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        mark = ""
+        if change > tolerance:
+            regressions.append(key)
+            mark = "  ← 悪化"
+        print(f"{key:<18} {old:>10} {new:>10} {change * 100:>+7.1f}%{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ストリーミング認識の RTF・遅延・メモリ・CPU 使用率を計測する")
+    parser.add_argument('wavfiles', nargs='*', help="計測に使う WAV ファイル（省略時は合成音声）")
+    parser.add_argument('--synthetic', type=float, default=20.0,
+                        help="WAV ファイルを省略した場合の合成音声の長さ（秒）")
+    parser.add_argument('--realtime', action='store_true', help="音声を実時間で流す（既定: 最大速度）")
+    parser.add_argument('--max-chunks', type=int, default=1,
+                        help="実時間で遅れている場合に1回でまとめて渡すチャンク数の上限")
+    parser.add_argument('--chunk', default=chunking.CHUNK_MODE,
+                        help="チャンク長（'model' / 'adaptive' / サンプル数）")
+    parser.add_argument('--no-vad', action='store_true', help="VAD を使わず、無音のチャンクもすべてデコードする")
+    parser.add_argument('--fake', action='store_true',
+                        help="モデルを読み込まず擬似的な認識器を使う（ダウンロードなしで動作確認する）")
+    parser.add_argument('--fake-rtf', type=float, default=0.05, help="--fake の認識器の RTF")
+    parser.add_argument('--label', default='', help="結果に記録するラベル（バージョン名など）")
+    parser.add_argument('-o', '--output', help="結果を保存する JSON ファイル")
+    parser.add_argument('--baseline', help="比較する以前の結果の JSON ファイル")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="--baseline と比べて悪化とみなす割合（既定: 0.1 = 10%%）")
+    asr_config.add_arguments(parser)
+    args = parser.parse_args()
+    config = asr_config.from_args(args)
+
+    rss_start = peak_rss_mb()
+    load_start = time.perf_counter()
+    if args.fake:
+        from fake_asr import FakeSpeech2TextStreaming
+        speech2text = FakeSpeech2TextStreaming(rtf=args.fake_rtf)
+        model = 'fake'
+    else:
+        speech2text = asr_config.load_speech2text(config)
+        model = asr_config.TAG
+    load_seconds = time.perf_counter() - load_start
+    # フロントエンド・エンコーダ・ビームサーチの内訳も結果に含める
+    speech2text = instrumentation.instrument_speech2text(speech2text)
+    rss_loaded = peak_rss_mb()
+    print(chunking.describe(speech2text, TARGET_SAMPLE_RATE))
+
+    if args.wavfiles:
+        inputs = [(f, load_speech(f)) for f in args.wavfiles]
+    else:
+        inputs = [(f"synthetic:{args.synthetic:g}s", synthetic_speech(args.synthetic))]
+
+    files = []
+    all_latencies = []
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    for name, speech in inputs:
+        if len(speech) == 0:
+            print(f"{name}: 音声が空のためスキップします")
+            continue
+        chunker = chunking.make_chunker(speech2text, args.chunk, rate=TARGET_SAMPLE_RATE)
+        vad = None if args.no_vad else EnergyVAD(rate=TARGET_SAMPLE_RATE)
+        result, latencies = replay(speech2text, speech, chunker, args.realtime, args.max_chunks, vad)
+        result['file'] = name
+        result['chunk'] = chunker.stats()
+        files.append(result)
+        all_latencies.extend(latencies)
+        print(f"{name}: 音声 {result['audio_seconds']}秒, RTF {result['rtf']},"
+              f" 遅延 p50={result['latency_p50_ms']}ms p95={result['latency_p95_ms']}ms,"
+              f" 最初の文字 {result['first_token_s']}秒")
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+    if not files:
+        parser.error("計測できる音声がありません")
+
+    audio = sum(f['audio_seconds'] for f in files)
+    compute = sum(f['compute_seconds'] for f in files)
+    first_tokens = [f['first_token_s'] for f in files if f['first_token_s'] is not None]
+    summary = {
+        'files': len(files),
+        'audio_seconds': round(audio, 3),
+        'wall_seconds': round(wall, 3),
+        'rtf': round(compute / audio, 4) if audio else 0.0,
+        'first_token_s': round(percentile(first_tokens, 50), 3) if first_tokens else None,
+        'load_seconds': round(load_seconds, 3),
+        'cpu_percent': round(cpu / wall * 100, 1) if wall else 0.0,
+        'cpu_count': os.cpu_count(),
+        'rss_start_mb': round(rss_start, 1) if rss_start is not None else None,
+        'rss_after_load_mb': round(rss_loaded, 1) if rss_loaded is not None else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1) if rss_start is not None else None,
+    }
+    summary.update(latency_summary(all_latencies))
+    result = {
+        'label': args.label,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'model': model,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': {
+            'realtime': args.realtime,
+            'max_chunks': args.max_chunks,
+            'chunk': args.chunk,
+            'vad': not args.no_vad,
+            'inference': config._asdict(),
+        },
+        'summary': summary,
+        'stages': instrumentation.METRICS.snapshot()['stages'],
+        'files': files,
+    }
+
+    print(f"\n合計: 音声 {summary['audio_seconds']}秒, RTF {summary['rtf']}, CPU 使用率 {summary['cpu_percent']}%,"
+          f" ピーク RSS {summary['peak_rss_mb']}MB (ロード後 {summary['rss_after_load_mb']}MB)")
+    print("遅延[ms]: " + ", ".join(f"p{q}={summary[f'latency_p{q}_ms']}" for q in PERCENTILES)
+          + f", 最大={summary['latency_max_ms']}")
+    print(instrumentation.report())
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print(f"\n基準より {args.tolerance * 100:.0f}% 以上悪化した項目: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+長時間のライブ認識でチャンクあたりの遅延とメモリが一定に保たれるかを確認する（ソークテスト）
+
+マイク入力のスクリプト（asr-text.py / mic-asr-summary.py）と同じ流れ（VAD または Endpointer で
+発話を区切り、is_final=True でデコーダをリセットし、TranscriptState に確定させる）で、
+音声を最大速度で --hours 時間分流し続ける。--window 秒分の音声ごとに次の値を 1 行ずつ表示する。
+・その区間のチャンクあたりの遅延（p50 / p95 / 最大）
+・区間の終わりの RSS（現在値）と、デコーダが保持しているエンコーダ出力のフレーム数（分かる場合）
+
+最初の区間と最後の区間を比べ、p95 の遅延が --tolerance の割合を超えて増えたか、RSS が
+--rss-tolerance MB を超えて増えた場合は「一定ではない」として終了コード 1 を返す。
+
+入力は WAV ファイル（繰り返し使う）か合成音声。--continuous は無音を挟まない合成音声で、
+VAD の無音だけでは発話が区切られない（発話の長さの上限だけが効く）場合を確認できる。
+--max-utterance 0 で上限を外すと、比較のために状態が伸び続ける様子を見られる。
+
+--fake を指定するとモデルを読み込まず fake_asr.FakeSpeech2TextStreaming を使う。
+--fake-history-cost で保持しているエンコーダ出力の長さに比例した処理時間を加えられるため、
+発話の区切りや --encoded-feat-length-limit の効果をモデルなしで確認できる。
+
+使い方:
+    python bench-soak.py --hours 8 --fake --fake-rtf 0.002 --continuous
+    python bench-soak.py --hours 8 --fake --fake-history-cost 0.001 --continuous --max-utterance 0
+    python bench-soak.py meeting.wav --hours 2 --encoded-feat-length-limit 256 -o soak.json
+"""
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import asr_config
+import chunking
+import instrumentation
+from bench_common import load_speech, synthetic_speech, current_rss_mb, peak_rss_mb
+from metrics import percentile
+from resampler import TARGET_SAMPLE_RATE
+from transcript import TranscriptState
+from vad import EnergyVAD, Endpointer, MAX_UTTERANCE
+
+# 合成音声を使う場合に繰り返す長さ（秒）
+SYNTHETIC_SECONDS = 120.0
+
+
+def history_frames(speech2text):
+    """デコーダが保持しているエンコーダ出力のフレーム数（分からない場合は None）"""
+    target = getattr(speech2text, 'speech2text', speech2text)
+    if hasattr(target, 'history_frames'):
+        return target.history_frames
+    buffer = getattr(getattr(target, 'beam_search', None), 'encbuffer', None)
+    return len(buffer) if buffer is not None else None
+
+
+def soak(speech2text, speech, chunker, endpointer, seconds, window):
+    """
+    speech を繰り返して seconds 秒分をチャンクごとにデコードし、window 秒ごとの計測値のリストを返す
+    """
+    rate = TARGET_SAMPLE_RATE
+    transcript = TranscriptState()
+    windows = []
+    latencies = []
+    window_audio = 0
+    window_start = time.perf_counter()
+    audio = 0.0
+    next_report = window
+    position = 0
+    total = int(seconds * rate)
+    fed = 0
+    while fed < total:
+        size = min(chunker.chunk, total - fed)
+        if position + size > len(speech):
+            position = 0
+        chunk = speech[position:position + size]
+        position += size
+        fed += size
+        audio = fed / rate
+
+        start = time.perf_counter()
+        with instrumentation.stage('vad'):
+            data, is_final = endpointer.gate(chunk, is_last=fed >= total)
+        if data is not None:
+            with instrumentation.stage('decode'):
+                results = speech2text(speech=data, is_final=is_final)
+            text = (results[0][0] or "") if results else ""
+            if is_final:
+                transcript.finalize(text, audio)
+            else:
+                transcript.update(text, audio)
+            transcript.take_new()
+        elapsed = time.perf_counter() - start
+        chunker.record(size, elapsed)
+        latencies.append(elapsed)
+        window_audio += size
+
+        if audio >= next_report or fed >= total:
+            wall = time.perf_counter() - window_start
+            row = {
+                'audio_hours': round(audio / 3600, 3),
+                'chunks': len(latencies),
+                'rtf': round(sum(latencies) / (window_audio / rate), 4) if window_audio else 0.0,
+                'latency_p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                'latency_p95_ms': round(percentile(latencies, 95) * 1000, 2),
+                'latency_max_ms': round(max(latencies, default=0.0) * 1000, 2),
+                'rss_mb': round(current_rss_mb() or 0.0, 1),
+                'history_frames': history_frames(speech2text),
+                'segments': len(transcript.segments),
+                'wall_seconds': round(wall, 2),
+            }
+            windows.append(row)
+            print(f"{row['audio_hours']:>7.2f}時間  p50={row['latency_p50_ms']:>8.2f}ms"
+                  f"  p95={row['latency_p95_ms']:>8.2f}ms  最大={row['latency_max_ms']:>8.2f}ms"
+                  f"  RSS={row['rss_mb']:>7.1f}MB  履歴={row['history_frames']}フレーム"
+                  f"  発話 {row['segments']}", flush=True)
+            latencies = []
+            window_audio = 0
+            window_start = time.perf_counter()
+            next_report += window
+    return windows
+
+
+def check_flat(windows, tolerance, rss_tolerance):
+    """
+    最初の区間と最後の区間を比べ、一定とみなせない項目のリストを返す
+    ・最初の区間はモデルやアロケータの立ち上がりを含むため、区間が 3 つ以上あれば 2 番目と比べる
+    """
+    if len(windows) < 2:
+        return []
+    first = windows[1] if len(windows) >= 3 else windows[0]
+    last = windows[-1]
+    problems = []
+    if first['latency_p95_ms'] and last['latency_p95_ms'] > first['latency_p95_ms'] * (1 + tolerance):
+        problems.append(f"p95 の遅延 {first['latency_p95_ms']}ms → {last['latency_p95_ms']}ms")
+    if last['rss_mb'] - first['rss_mb'] > rss_tolerance:
+        problems.append(f"RSS {first['rss_mb']}MB → {last['rss_mb']}MB")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="長時間のライブ認識で遅延とメモリが一定に保たれるかを確認する")
+    parser.add_argument('wavfiles', nargs='*', help="繰り返し流す WAV ファイル（省略時は合成音声）")
+    parser.add_argument('--hours', type=float, default=8.0, help="流す音声の長さ（時間）")
+    parser.add_argument('--window', type=float, default=600.0, help="計測値を集計する音声の長さ（秒）")
+    parser.add_argument('--continuous', action='store_true',
+                        help="合成音声に無音を挟まない（VAD の無音では発話が区切られない場合を確認する）")
+    parser.add_argument('--no-vad', action='store_true',
+                        help="VAD を使わず、発話の長さの上限だけで区切る（Endpointer）")
+    parser.add_argument('--max-utterance', type=float, default=MAX_UTTERANCE,
+                        help=f"1つの発話の長さの上限（秒）。0 で制限しない（既定: {MAX_UTTERANCE:g}）")
+    parser.add_argument('--chunk', default=chunking.CHUNK_MODE,
+                        help="チャンク長（'model' / 'adaptive' / サンプル数）")
+    parser.add_argument('--fake', action='store_true',
+                        help="モデルを読み込まず擬似的な認識器を使う（ダウンロードなしで動作確認する）")
+    parser.add_argument('--fake-rtf', type=float, default=0.002, help="--fake の認識器の RTF")
+    parser.add_argument('--fake-history-cost', type=float, default=0.0,
+                        help="--fake の認識器が、保持しているエンコーダ出力 1 秒あたりに追加する処理時間（秒）")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="p95 の遅延が増えたとみなす割合（既定: 0.2 = 20%%）")
+    parser.add_argument('--rss-tolerance', type=float, default=50.0,
+                        help="RSS が増えたとみなす増加量（MB）")
+    parser.add_argument('-o', '--output', help="結果を保存する JSON ファイル")
+    asr_config.add_arguments(parser)
+    args = parser.parse_args()
+    config = asr_config.from_args(args)
+
+    if args.fake:
+        from fake_asr import FakeSpeech2TextStreaming
+        import decoding
+        speech2text = FakeSpeech2TextStreaming(rtf=args.fake_rtf, history_cost=args.fake_history_cost)
+        decoding.configure_history(speech2text, config.decoder_text_length_limit, config.encoded_feat_length_limit)
+        model = 'fake'
+    else:
+        speech2text = asr_config.load_speech2text(config)
+        model = asr_config.TAG
+    speech2text = instrumentation.instrument_speech2text(speech2text)
+    chunker = chunking.make_chunker(speech2text, args.chunk, rate=TARGET_SAMPLE_RATE)
+    print(chunking.describe(speech2text, TARGET_SAMPLE_RATE))
+
+    if args.wavfiles:
+        speech = np.concatenate([load_speech(f) for f in args.wavfiles])
+        source = ",".join(args.wavfiles)
+    else:
+        speech = synthetic_speech(SYNTHETIC_SECONDS, pauses=not args.continuous)
+        source = f"synthetic:{'continuous' if args.continuous else 'pauses'}"
+    if len(speech) == 0:
+        parser.error("音声が空です")
+
+    if args.no_vad:
+        endpointer = Endpointer(rate=TARGET_SAMPLE_RATE, max_utterance=args.max_utterance)
+    else:
+        endpointer = EnergyVAD(rate=TARGET_SAMPLE_RATE, max_utterance=args.max_utterance)
+    print(f"入力: {source}, {args.hours:g}時間分を流します（発話の長さの上限 {args.max_utterance:g}秒）")
+
+    start = time.perf_counter()
+    windows = soak(speech2text, speech, chunker, endpointer, args.hours * 3600, args.window)
+    wall = time.perf_counter() - start
+    problems = check_flat(windows, args.tolerance, args.rss_tolerance)
+
+    print(f"\n経過時間 {wall:.1f}秒, ピーク RSS {peak_rss_mb()}MB")
+    print(endpointer.report())
+    print(instrumentation.report())
+    if args.output:
+        result = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'model': model,
+            'source': source,
+            'options': {
+                'hours': args.hours,
+                'window': args.window,
+                'vad': not args.no_vad,
+                'max_utterance': args.max_utterance,
+                'chunk': args.chunk,
+                'inference': config._asdict(),
+            },
+            'wall_seconds': round(wall, 3),
+            'flat': not problems,
+            'problems': problems,
+            'windows': windows,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.output}")
+
+    if problems:
+        print("遅延またはメモリが一定ではありません: " + ", ".join(problems))
+        sys.exit(1)
+    print("遅延とメモリは一定に保たれています")
+
+
+if __name__ == "__main__":
+    main()
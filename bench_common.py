@@ -0,0 +1,95 @@
+"""
+ベンチマーク用スクリプトで共有する小さな関数群
+"""
+import os
+import sys
+import time
+import numpy as np
+import audio_io
+from audio_io import load_speech
+from resampler import StreamingResampler, TARGET_SAMPLE_RATE
+
+try:
+    import resource
+except ImportError:
+    # Windows では RSS を計測しない
+    resource = None
+
+
+def load_chunks(wavfile, chunk_size):
+    """WAV ファイルを 16kHz・モノラルのチャンクのリストにする"""
+    with audio_io.open_wav(wavfile) as wav:
+        chunks = wav.chunks(chunk_size)
+        if wav.rate != TARGET_SAMPLE_RATE or wav.channels > 1:
+            chunks = StreamingResampler(wav.rate, TARGET_SAMPLE_RATE).resample_chunks(chunks, chunk_size)
+        return [chunk for _, chunk in chunks]
+
+
+def load_reference(wavfile):
+    """WAV ファイルと同じ名前の .txt があれば正解テキストとして読む"""
+    path = os.path.splitext(wavfile)[0] + '.txt'
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return f.read().strip()
+
+
+def decode(speech2text, chunks):
+    """チャンクの列をストリーミングでデコードし、(テキスト, 経過時間) を返す"""
+    text = ""
+    start = time.perf_counter()
+    for i, chunk in enumerate(chunks):
+        results = speech2text(speech=chunk, is_final=i == len(chunks) - 1)
+        if results:
+            text = results[0][0]
+    return text, time.perf_counter() - start
+
+
+def peak_rss_mb():
+    """このプロセスのピーク RSS（MB）"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def current_rss_mb():
+    """
+    このプロセスの現在の RSS（MB）
+    ・/proc のない環境ではピーク RSS で代用する（増え続けているかどうかの判定には使える）
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+def cpu_seconds():
+    """このプロセスが使った CPU 時間（ユーザー + システム）"""
+    t = os.times()
+    return t.user + t.system
+
+
+def synthetic_speech(seconds, rate=TARGET_SAMPLE_RATE, seed=0, pauses=True):
+    """
+    発話と無音が交互に続く合成音声（VAD の区切りも計測に含めるため）
+    ・発話は 1〜3 秒の振幅変調した雑音、無音は 0.3〜1 秒の小さな雑音
+    ・pauses=False の場合は無音を挟まず発話だけを続ける（話し続ける場合の確認用）
+    """
+    rng = np.random.default_rng(seed)
+    parts = []
+    total = 0
+    n = int(seconds * rate)
+    while total < n:
+        length = int(rng.uniform(1.0, 3.0) * rate)
+        envelope = 0.5 + 0.5 * np.sin(np.arange(length) * 2 * np.pi * 4 / rate)
+        parts.append((rng.standard_normal(length) * 0.1 * envelope).astype(np.float32))
+        total += length
+        if pauses:
+            length = int(rng.uniform(0.3, 1.0) * rate)
+            parts.append((rng.standard_normal(length) * 0.001).astype(np.float32))
+            total += length
+    return np.concatenate(parts)[:n]
@@ -0,0 +1,165 @@
+"""
+長い文字起こしを分割して要約する（map-reduce）
+
+要約モデル（DistilBART）の入力は最大トークン数で切り捨てられるため、文字起こし全体を 1 回で
+要約すると後半が失われ、1 回の呼び出しも長くなる。ChunkedSummarizer は文字起こしを
+トークン数が上限に収まるウィンドウに分け、ウィンドウごとの要約をバッチでまとめて実行し（map）、
+得られた要約をさらに同じ方法で要約して 1 つにまとめる（reduce）。
+
+ウィンドウは先頭から貪欲に詰めるため、文字起こしが後ろに伸びても前のウィンドウの境界は変わらない。
+ウィンドウの要約はテキストをキーにキャッシュするので、伸びた文字起こしを要約し直すときは
+最後のウィンドウと新しいウィンドウだけを要約すればよい。
+"""
+import time
+import hashlib
+from collections import OrderedDict
+
+# ウィンドウの最大トークン数を決めるときに、モデルの最大入力長から差し引く余裕（特殊トークンの分）
+WINDOW_MARGIN = 8
+# 最大入力長を持たないトークナイザ（model_max_length が非常に大きい値）の場合に使う上限
+DEFAULT_MAX_TOKENS = 1024
+# キャッシュするウィンドウの要約の最大件数
+CACHE_SIZE = 1024
+# 文の区切りとみなす文字（区切り文字は前の文に含める）
+SENTENCE_ENDS = '。．！？!?\n'
+
+
+def split_sentences(text):
+    """テキストを文の区切りで分ける（連結すると元のテキストに戻る）"""
+    sentences = []
+    start = 0
+    for i, ch in enumerate(text):
+        if ch in SENTENCE_ENDS:
+            sentences.append(text[start:i + 1])
+            start = i + 1
+    if start < len(text):
+        sentences.append(text[start:])
+    return sentences
+
+
+class ChunkedSummarizer:
+    """
+    transformers の要約パイプラインで長いテキストを map-reduce で要約する
+    ・summarize() には文字列か、発話などの単位に分けたテキストのリストを渡す
+    ・1 つの単位がウィンドウに収まらない場合は、収まるまで文字数で分割する
+    ・ウィンドウの要約は最大 cache_size 件まで、古いものから捨てる（LRU）
+    """
+
+    def __init__(self, pipeline, max_length=100, min_length=30, max_tokens=None,
+                 batch_size=4, cache_size=CACHE_SIZE):
+        self.pipeline = pipeline
+        self.tokenizer = pipeline.tokenizer
+        if max_tokens is None:
+            max_tokens = getattr(self.tokenizer, 'model_max_length', DEFAULT_MAX_TOKENS)
+            if max_tokens > 100000:
+                max_tokens = DEFAULT_MAX_TOKENS
+            max_tokens -= WINDOW_MARGIN
+        if max_length * 2 > max_tokens:
+            # 要約を 2 つ以上詰められないと reduce の段で件数が減らない
+            raise ValueError(f"max_length ({max_length}) はウィンドウの最大トークン数 ({max_tokens}) の半分以下にしてください")
+        self.max_tokens = max_tokens
+        self.max_length = max_length
+        self.min_length = min_length
+        self.batch_size = max(1, batch_size)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        # 統計情報
+        self.windows = 0
+        self.cache_hits = 0
+        self.summarized = 0
+        self.batches = 0
+        self.levels = 0
+        self.busy_seconds = 0.0
+
+    def count_tokens(self, text):
+        """テキストのトークン数（特殊トークンを除く）"""
+        return len(self.tokenizer(text, add_special_tokens=False)['input_ids'])
+
+    def _fit(self, unit):
+        """ウィンドウに収まらない単位を文字数で分割し、(テキスト, トークン数) の列にする"""
+        tokens = self.count_tokens(unit)
+        if tokens <= self.max_tokens or len(unit) < 2:
+            return [(unit, tokens)]
+        half = len(unit) // 2
+        return self._fit(unit[:half]) + self._fit(unit[half:])
+
+    def split_windows(self, units):
+        """
+        テキストの単位を先頭から順に、トークン数が max_tokens 以下のウィンドウに詰める
+        ・単位の区切りは保ったまま連結する（前のウィンドウの境界は後ろの単位に影響されない）
+        """
+        windows = []
+        current = []
+        current_tokens = 0
+        for unit in units:
+            if not unit:
+                continue
+            for piece, tokens in self._fit(unit):
+                if current and current_tokens + tokens > self.max_tokens:
+                    windows.append("".join(current))
+                    current = []
+                    current_tokens = 0
+                current.append(piece)
+                current_tokens += tokens
+        if current:
+            windows.append("".join(current))
+        return windows
+
+    @staticmethod
+    def _key(text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _map(self, windows):
+        """ウィンドウごとの要約を返す（キャッシュにないものだけをバッチで要約する）"""
+        keys = [self._key(window) for window in windows]
+        todo = {}
+        for key, window in zip(keys, windows):
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+            else:
+                todo[key] = window
+        self.windows += len(windows)
+
+        pending = list(todo.items())
+        for i in range(0, len(pending), self.batch_size):
+            batch = pending[i:i + self.batch_size]
+            outputs = self.pipeline([window for _, window in batch], batch_size=len(batch),
+                                    max_length=self.max_length, min_length=self.min_length,
+                                    do_sample=False, truncation=True)
+            self.batches += 1
+            self.summarized += len(batch)
+            for (key, _), output in zip(batch, outputs):
+                self._cache[key] = output['summary_text']
+
+        summaries = [self._cache[key] for key in keys]
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return summaries
+
+    def summarize(self, text):
+        """
+        テキスト（または単位に分けたテキストのリスト）を要約する
+        ・ウィンドウが 1 つになるまで、要約を連結して要約し直す
+        """
+        start = time.perf_counter()
+        units = split_sentences(text) if isinstance(text, str) else list(text)
+        self.levels = 0
+        summary = ""
+        windows = self.split_windows(units)
+        while windows:
+            summaries = self._map(windows)
+            self.levels += 1
+            if len(summaries) == 1:
+                summary = summaries[0]
+                break
+            # 要約どうしは改行で区切って次の段のウィンドウに詰める
+            windows = self.split_windows([s + "\n" for s in summaries])
+        self.busy_seconds += time.perf_counter() - start
+        return summary
+
+    def report(self):
+        """統計情報を表示用の文字列にする"""
+        return (f"要約のウィンドウ: {self.windows}件 (キャッシュ命中 {self.cache_hits}件),"
+                f" 要約した数 {self.summarized}件 / {self.batches}バッチ, 段数 {self.levels},"
+                f" 処理時間 {self.busy_seconds:.1f}秒")
@@ -0,0 +1,212 @@
+"""
+ストリーミングデコーダに渡すチャンク長の決定
+
+ContextualBlockConformerEncoder は、特徴量フレームをサブサンプリングした後のフレームを
+hop_size 個ずつ進めながらブロック単位でエンコードする。1ブロック分の音声より短いチャンクを
+渡しても、フロントエンドとバッファリングだけが走ってエンコーダは次のチャンクを待つことになる。
+ここではロードしたモデルの設定からエンコーダの1ホップに相当するサンプル数を求め、
+チャンク長をその倍数に揃える。
+
+AdaptiveChunker は実時間の入力（マイクなど）向けに、デコードが実時間に追いつかないときは
+チャンクを大きくし（呼び出しあたりのオーバーヘッドを減らす）、余裕があって遅延が目標を
+超えているときは小さくする。
+
+・環境変数 ASR_CHUNK: 'model'（既定。モデルのホップに合わせる）/ 'adaptive' / サンプル数
+・環境変数 ASR_LATENCY_BUDGET: adaptive での目標遅延（秒。既定: 1.0）
+"""
+import os
+from collections import deque, namedtuple
+from metrics import percentile
+
+# モデルからチャンク長を決められない場合の既定値（16kHz で 0.128 秒）
+DEFAULT_CHUNK = 2048
+# フロントエンドの既定のホップ長（ESPnet の DefaultFrontend と同じ）
+DEFAULT_HOP_LENGTH = 128
+# サブサンプリング層のクラス名とフレームの間引き率（strides を持たない層用）
+SUBSAMPLING_RATES = {
+    'Conv2dSubsampling': 4,
+    'Conv2dSubsampling1': 1,
+    'Conv2dSubsampling2': 2,
+    'Conv2dSubsampling6': 6,
+    'Conv2dSubsampling8': 8,
+}
+
+CHUNK_MODE = os.environ.get('ASR_CHUNK', 'model')
+LATENCY_BUDGET = float(os.environ.get('ASR_LATENCY_BUDGET', '1.0'))
+
+StreamingGeometry = namedtuple('StreamingGeometry',
+                               ['hop_length', 'subsampling', 'block_size', 'hop_size', 'look_ahead'])
+
+
+def _subsampling(embed):
+    """エンコーダの入力層のフレーム間引き率"""
+    strides = getattr(embed, 'strides', None)
+    if strides:
+        rate = 1
+        for stride in strides:
+            rate *= stride
+        return rate
+    return SUBSAMPLING_RATES.get(type(embed).__name__, 1)
+
+
+def streaming_geometry(speech2text):
+    """
+    ロードしたモデルからストリーミングのブロック設定を読み出す
+    ・ブロック処理のエンコーダでなければ None を返す
+    """
+    encoder = speech2text.asr_model.encoder
+    hop_size = getattr(encoder, 'hop_size', None)
+    if not hop_size:
+        return None
+    return StreamingGeometry(
+        hop_length=getattr(speech2text, 'hop_length', DEFAULT_HOP_LENGTH),
+        subsampling=_subsampling(getattr(encoder, 'embed', None)),
+        block_size=getattr(encoder, 'block_size', hop_size),
+        hop_size=hop_size,
+        look_ahead=getattr(encoder, 'look_ahead', 0),
+    )
+
+
+def block_hop_samples(geometry):
+    """エンコーダが1ブロック進むのに必要な音声のサンプル数"""
+    return geometry.hop_size * geometry.subsampling * geometry.hop_length
+
+
+def model_chunk_size(speech2text, hops=1):
+    """
+    エンコーダの hops ホップ分のサンプル数（ブロック処理のエンコーダでなければ DEFAULT_CHUNK）
+    """
+    geometry = streaming_geometry(speech2text)
+    if geometry is None:
+        return DEFAULT_CHUNK
+    return block_hop_samples(geometry) * max(1, hops)
+
+
+def describe(speech2text, rate=16000):
+    """ブロック設定とチャンク長を表示用の文字列にする"""
+    geometry = streaming_geometry(speech2text)
+    if geometry is None:
+        return f"ブロック処理のエンコーダではないため、既定のチャンク長 {DEFAULT_CHUNK} を使います"
+    hop = block_hop_samples(geometry)
+    return (f"ブロック {geometry.block_size}, ホップ {geometry.hop_size}, 先読み {geometry.look_ahead}"
+            f" (サブサンプリング {geometry.subsampling}, フレームシフト {geometry.hop_length})"
+            f" → チャンク長 {hop} サンプル ({hop / rate:.3f}秒)")
+
+
+def resolve_chunk_size(speech2text, mode=None):
+    """
+    チャンクの指定（'model' / 'adaptive' / サンプル数）から固定のチャンク長を決める
+    ・'adaptive' の場合は開始時のチャンク長（モデルの1ホップ分）を返す
+    """
+    mode = CHUNK_MODE if mode is None else str(mode)
+    if mode in ('model', 'adaptive', 'auto', ''):
+        return model_chunk_size(speech2text)
+    return int(mode)
+
+
+class AdaptiveChunker:
+    """
+    実時間入力のデコードで、チャンク長を base の倍数の範囲で調整する
+    ・window 回のデコードごとに、その間の実時間比（RTF = 処理時間 / 音声長）と遅延を見て判断する
+    ・RTF が grow_rtf を超えるか、入力が溜まっている（backlog）ときは1段大きくする
+    ・RTF が shrink_rtf を下回り、遅延が latency_budget を超えているときは1段小さくする
+    ・遅延はチャンクが揃うまでの待ち時間（チャンク長）と処理時間の和で見積もる
+    """
+
+    def __init__(self, base, rate=16000, min_multiple=1, max_multiple=8, latency_budget=LATENCY_BUDGET,
+                 grow_rtf=0.9, shrink_rtf=0.6, window=8, max_samples=10000):
+        self.base = base
+        self.rate = rate
+        self.min_multiple = max(1, min_multiple)
+        self.max_multiple = max(self.min_multiple, max_multiple)
+        self.latency_budget = latency_budget
+        self.grow_rtf = grow_rtf
+        self.shrink_rtf = shrink_rtf
+        self.window = window
+        self.multiple = self.min_multiple
+        self._recent = []
+        self._backlog = False
+        # 統計情報
+        self.latencies = deque(maxlen=max_samples)
+        self.audio_seconds = 0.0
+        self.compute_seconds = 0.0
+        self.calls = 0
+        self.grown = 0
+        self.shrunk = 0
+        self.max_multiple_used = self.multiple
+
+    @property
+    def chunk(self):
+        """現在のチャンク長（サンプル数）"""
+        return self.base * self.multiple
+
+    @property
+    def max_chunk(self):
+        """チャンク長の上限（読み出しバッファの確保用）"""
+        return self.base * self.max_multiple
+
+    def record(self, nsamples, elapsed, backlog=0):
+        """
+        1回のデコードを記録し、必要ならチャンク長を変える
+        ・backlog はデコード後に入力側に溜まっているサンプル数
+        """
+        if nsamples <= 0:
+            return
+        audio = nsamples / self.rate
+        self.audio_seconds += audio
+        self.compute_seconds += elapsed
+        self.calls += 1
+        self.latencies.append(audio + elapsed)
+        self._recent.append((audio, elapsed))
+        self._backlog = self._backlog or backlog >= self.chunk
+        if len(self._recent) >= self.window:
+            self._adjust()
+
+    def _adjust(self):
+        audio = sum(a for a, _ in self._recent)
+        elapsed = sum(e for _, e in self._recent)
+        rtf = elapsed / audio if audio > 0 else 0.0
+        latency = self.chunk / self.rate * (1.0 + rtf)
+        if (rtf > self.grow_rtf or self._backlog) and self.multiple < self.max_multiple:
+            self.multiple += 1
+            self.grown += 1
+        elif rtf < self.shrink_rtf and latency > self.latency_budget and self.multiple > self.min_multiple:
+            self.multiple -= 1
+            self.shrunk += 1
+        self.max_multiple_used = max(self.max_multiple_used, self.multiple)
+        self._recent = []
+        self._backlog = False
+
+    def stats(self):
+        """計測値を辞書で返す"""
+        latencies = list(self.latencies)
+        return {
+            'chunk': self.chunk,
+            'chunk_seconds': round(self.chunk / self.rate, 3),
+            'calls': self.calls,
+            'rtf': round(self.compute_seconds / self.audio_seconds, 4) if self.audio_seconds else 0.0,
+            'latency_p50_s': round(percentile(latencies, 50), 3),
+            'latency_p95_s': round(percentile(latencies, 95), 3),
+            'grown': self.grown,
+            'shrunk': self.shrunk,
+            'max_chunk_seconds': round(self.base * self.max_multiple_used / self.rate, 3),
+        }
+
+    def report(self):
+        """計測値を表示用の文字列にする"""
+        s = self.stats()
+        return (f"チャンク長: 現在 {s['chunk_seconds']}秒 (最大 {s['max_chunk_seconds']}秒, 拡大 {s['grown']}回,"
+                f" 縮小 {s['shrunk']}回), RTF {s['rtf']},"
+                f" 遅延 p50={s['latency_p50_s']}秒 p95={s['latency_p95_s']}秒")
+
+
+def make_chunker(speech2text, mode=None, rate=16000, latency_budget=LATENCY_BUDGET):
+    """
+    チャンクの指定から AdaptiveChunker を作る
+    ・'adaptive' 以外では倍率を 1 に固定する（チャンク長は変えずに遅延と RTF だけを計測する）
+    """
+    mode = CHUNK_MODE if mode is None else str(mode)
+    if mode == 'adaptive':
+        return AdaptiveChunker(model_chunk_size(speech2text), rate=rate, latency_budget=latency_budget)
+    return AdaptiveChunker(resolve_chunk_size(speech2text, mode), rate=rate, max_multiple=1,
+                           latency_budget=latency_budget)
@@ -0,0 +1,132 @@
+"""
+デコード方法の設定（ビームサーチのパラメータと CTC の貪欲デコード）
+
+ビームサーチのパラメータは、モデルを構築し直さずにロード済みの Speech2TextStreaming に適用する。
+構築時のオプションはモデルキャッシュのキーになるため、ビーム幅を変えるたびにキャッシュが
+増えないようにしている。デコーダが参照する履歴の長さの上限（decoder_text_length_limit /
+encoded_feat_length_limit）も同じ理由でロード後に設定する。
+
+GreedyCTCStreaming はアテンションデコーダのビームサーチを使わず、ストリーミングエンコーダの
+出力に対する CTC の最尤ラベル列だけで文字起こしする。精度は下がるが、チャンクあたりの処理は
+エンコーダと CTC の線形層だけになるため、ライブ字幕のように遅延を優先する用途に向く。
+"""
+import numpy as np
+import torch
+
+# 事前ビーム（部分スコアラで候補を絞る数）とビーム幅の比（ESPnet の BeamSearch の既定値と同じ）
+PRE_BEAM_RATIO = 1.5
+
+
+def configure_beam(speech2text, beam_size=None, ctc_weight=None, nbest=None):
+    """
+    ロード済みの Speech2TextStreaming のビームサーチのパラメータを変更する（None の項目は変えない）
+    ・ctc_weight はデコーダとの重みの配分（デコーダの重みは 1 - ctc_weight）
+    ・構築時に重みが 0 だったスコアラはビームサーチに含まれないため、後から有効にはできない
+    """
+    beam_search = speech2text.beam_search
+    if beam_size is not None:
+        beam_search.beam_size = beam_size
+        beam_search.pre_beam_size = int(PRE_BEAM_RATIO * beam_size)
+        beam_search.do_pre_beam = (
+            beam_search.pre_beam_score_key is not None
+            and beam_search.pre_beam_size < beam_search.n_vocab
+            and len(beam_search.part_scorers) > 0
+        )
+    if ctc_weight is not None:
+        weights = dict(beam_search.weights)
+        if 'ctc' not in beam_search.scorers or 'decoder' not in beam_search.scorers:
+            raise ValueError("CTC とデコーダの両方を使うモデルでなければ ctc_weight は変更できません")
+        weights['ctc'] = ctc_weight
+        weights['decoder'] = 1.0 - ctc_weight
+        beam_search.weights = weights
+    if nbest is not None:
+        speech2text.nbest = nbest
+    return speech2text
+
+
+def configure_history(speech2text, decoder_text_length_limit=None, encoded_feat_length_limit=None):
+    """
+    ロード済みの Speech2TextStreaming のビームサーチが参照する履歴の長さを制限する（None の項目は変えない）
+    ・decoder_text_length_limit: アテンションデコーダに渡す直近のトークン数（0 なら制限しない）
+    ・encoded_feat_length_limit: ソースアテンションに渡す直近のエンコーダ出力のフレーム数（0 なら制限しない）
+    ・どちらも長い発話でのチャンクあたりの計算量を一定に保つためのもの。短くしすぎると精度が下がる
+    ・CTC の貪欲デコードにはビームサーチがないため何もしない
+    """
+    beam_search = getattr(speech2text, 'beam_search', None)
+    if beam_search is None:
+        return speech2text
+    if decoder_text_length_limit is not None:
+        beam_search.decoder_text_length_limit = decoder_text_length_limit
+    if encoded_feat_length_limit is not None:
+        beam_search.encoded_feat_length_limit = encoded_feat_length_limit
+    return speech2text
+
+
+def describe_beam(speech2text):
+    """ビームサーチの設定を表示用の文字列にする"""
+    if isinstance(speech2text, GreedyCTCStreaming):
+        return "デコード: CTC の貪欲デコード（ビームサーチなし）"
+    beam_search = speech2text.beam_search
+    text_limit = getattr(beam_search, 'decoder_text_length_limit', 0)
+    feat_limit = getattr(beam_search, 'encoded_feat_length_limit', 0)
+    return (f"デコード: ビーム幅 {beam_search.beam_size}, CTC の重み {beam_search.weights.get('ctc', 0.0)},"
+            f" n-best {speech2text.nbest}, 履歴の上限 トークン {text_limit or 'なし'} / フレーム {feat_limit or 'なし'}")
+
+
+class GreedyCTCStreaming:
+    """
+    Speech2TextStreaming と同じ呼び出し方で、CTC の貪欲デコードを行う
+    ・フロントエンドとエンコーダはラップした Speech2TextStreaming のものを使い、重みは共有する
+    ・エンコーダが出力したフレームごとに最尤ラベルを取り、連続する同じラベルとブランクを除く
+    ・戻り値は [(テキスト, トークン, トークンID, None)]（ビームサーチの仮説はない）
+    """
+
+    def __init__(self, speech2text):
+        self.speech2text = speech2text
+        model = speech2text.asr_model
+        self.asr_model = model
+        if hasattr(speech2text, 'hop_length'):
+            # chunking.streaming_geometry() がフレームシフトを読めるようにする
+            self.hop_length = speech2text.hop_length
+        self.nbest = 1
+        self.ignore_ids = {getattr(model, 'blank_id', 0), getattr(model, 'sos', None), getattr(model, 'eos', None)}
+        self.reset()
+
+    def reset(self):
+        """発話の途中状態を初期化する"""
+        self.frontend_states = None
+        self.encoder_states = None
+        self.token_int = []
+        self._prev = None
+
+    def fork(self):
+        """重みを共有し、デコードの状態だけを独立させたインスタンスを作る"""
+        return GreedyCTCStreaming(self.speech2text)
+
+    def _assemble(self):
+        token = self.speech2text.converter.ids2tokens(self.token_int)
+        tokenizer = self.speech2text.tokenizer
+        text = tokenizer.tokens2text(token) if tokenizer is not None else None
+        return [(text, token, list(self.token_int), None)]
+
+    @torch.no_grad()
+    def __call__(self, speech, is_final=True):
+        if isinstance(speech, np.ndarray):
+            speech = torch.tensor(speech)
+        feats, feats_lengths, self.frontend_states = self.speech2text.apply_frontend(
+            speech, self.frontend_states, is_final=is_final
+        )
+        ret = []
+        if feats is not None:
+            enc, _, self.encoder_states = self.asr_model.encoder(
+                feats, feats_lengths, self.encoder_states, is_final=is_final, infer_mode=True
+            )
+            if enc.size(1) > 0:
+                for label in self.asr_model.ctc.argmax(enc)[0].tolist():
+                    if label != self._prev and label not in self.ignore_ids:
+                        self.token_int.append(label)
+                    self._prev = label
+            ret = self._assemble()
+        if is_final:
+            self.reset()
+        return ret
@@ -0,0 +1,115 @@
+"""
+モデルを読み込まずに Speech2TextStreaming の代わりをする擬似的な認識器
+
+ベンチマークや処理の流れの動作確認を、モデルのダウンロードや GPU なしで行うためのもの。
+呼び出し方と戻り値の形は Speech2TextStreaming と同じで、音声の長さに比例した処理時間（CPU を
+実際に使う）と、音声の長さに比例した長さのテキストを返す。認識結果に意味はない。
+
+エンコーダのブロック設定（block_size / hop_size / look_ahead / embed.strides）と hop_length を
+持つため、chunking のチャンク長の計算や asr_session のセッション分岐もそのまま使える。
+
+history_cost を指定すると、実際のビームサーチと同じように発話の先頭からのエンコーダ出力を
+保持し、その長さに比例した処理時間を追加する。beam_search.encoded_feat_length_limit で
+保持するフレーム数を制限できるため、発話の区切りや履歴の上限の効果をモデルなしで確認できる。
+"""
+import time
+from types import SimpleNamespace
+import numpy as np
+
+# 返すテキストに使う文字
+FAKE_CHARS = "あいうえおかきくけこさしすせそたちつてとなにぬねの"
+
+
+class FakeSpeech2TextStreaming:
+    """
+    Speech2TextStreaming と同じ呼び出し方で、決まった処理時間とテキストを返す
+    ・rtf: 音声 1 秒あたりの処理時間（秒）。その間は CPU を使い続ける
+    ・chars_per_second: 音声 1 秒あたりに出力する文字数
+    ・音声はエンコーダの 1 ホップ分たまるごとに処理したものとして文字を追加する（先読みの遅延を模擬）
+    ・history_cost: 発話の先頭から保持しているエンコーダ出力 1 秒あたりに、呼び出しごとに追加する処理時間（秒）
+    """
+
+    def __init__(self, rtf=0.05, chars_per_second=8.0, rate=16000, hop_length=128,
+                 block_size=40, hop_size=16, look_ahead=16, strides=(2, 2), history_cost=0.0):
+        self.rtf = rtf
+        self.history_cost = history_cost
+        self.chars_per_second = chars_per_second
+        self.rate = rate
+        self.hop_length = hop_length
+        self.nbest = 1
+        encoder = SimpleNamespace(block_size=block_size, hop_size=hop_size, look_ahead=look_ahead,
+                                  embed=SimpleNamespace(strides=list(strides)))
+        self.asr_model = SimpleNamespace(encoder=encoder)
+        subsampling = 1
+        for stride in strides:
+            subsampling *= stride
+        self.hop_samples = hop_size * subsampling * hop_length
+        # エンコーダ出力の 1 フレームあたりのサンプル数と次元（保持する履歴の大きさの計算用）
+        self.frame_samples = subsampling * hop_length
+        self.feat_dim = 256
+        self.beam_search = SimpleNamespace(decoder_text_length_limit=0, encoded_feat_length_limit=0)
+        self.reset()
+
+    def reset(self):
+        """発話の途中状態を初期化する"""
+        self.buffered = 0
+        self.consumed = 0
+        self.text = ""
+        self.history = []
+        self.history_frames = 0
+
+    def fork(self):
+        """同じ設定で、デコードの状態だけを独立させたインスタンスを作る"""
+        fork = FakeSpeech2TextStreaming(self.rtf, self.chars_per_second, self.rate, self.hop_length,
+                                        self.asr_model.encoder.block_size, self.asr_model.encoder.hop_size,
+                                        self.asr_model.encoder.look_ahead, self.asr_model.encoder.embed.strides,
+                                        self.history_cost)
+        fork.beam_search = SimpleNamespace(**vars(self.beam_search))
+        return fork
+
+    def _burn(self, seconds):
+        """seconds 秒だけ CPU を使う（sleep では CPU 使用率の計測にならないため）"""
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            pass
+
+    def _extend_history(self, nsamples):
+        """
+        処理した音声の分のエンコーダ出力を保持する（encoded_feat_length_limit を超えた古いフレームは捨てる）
+        """
+        frames = nsamples // self.frame_samples
+        if frames <= 0:
+            return
+        self.history.append(np.zeros((frames, self.feat_dim), dtype=np.float32))
+        self.history_frames += frames
+        limit = self.beam_search.encoded_feat_length_limit
+        while limit > 0 and self.history and self.history_frames - len(self.history[0]) >= limit:
+            self.history_frames -= len(self.history.pop(0))
+
+    def _emit(self, nsamples):
+        total = int((self.consumed + nsamples) / self.rate * self.chars_per_second)
+        start = int(self.consumed / self.rate * self.chars_per_second)
+        self.text += "".join(FAKE_CHARS[i % len(FAKE_CHARS)] for i in range(start, total))
+        self.consumed += nsamples
+
+    def __call__(self, speech, is_final=True):
+        nsamples = len(speech) if speech is not None else 0
+        if isinstance(speech, np.ndarray) and speech.ndim > 1:
+            nsamples = speech.shape[0]
+        history = self.history_frames * self.frame_samples / self.rate
+        self._burn(nsamples / self.rate * self.rtf + history * self.history_cost)
+        self.buffered += nsamples
+        # 1 ホップ分たまった音声だけを処理済みにする（発話の終わりでは残りもすべて処理する）
+        ready = self.buffered if is_final else self.buffered // self.hop_samples * self.hop_samples
+        if ready:
+            self._emit(ready)
+            if self.history_cost:
+                self._extend_history(ready)
+            self.buffered -= ready
+        text = self.text
+        if is_final:
+            self.reset()
+        if not text:
+            return []
+        token = list(text)
+        return [(text, token, [FAKE_CHARS.index(ch) for ch in token], None)]
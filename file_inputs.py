@@ -0,0 +1,96 @@
+"""
+バッチ処理の入力（音声ファイルの一覧）と、JSONL の結果出力からの再開に使う関数群
+"""
+import os
+import sys
+import glob
+import json
+
+# マニフェストとして扱う拡張子（1行に1ファイルのパスを記載）
+MANIFEST_SUFFIXES = ('.txt', '.list', '.scp')
+# ディレクトリを指定した場合に列挙する音声ファイル
+AUDIO_PATTERNS = ('*.wav',)
+# 出力の末尾の途切れた行を探すときに一度に読むバイト数
+TAIL_BLOCK_BYTES = 64 * 1024
+
+
+def collect_inputs(inputs, patterns=AUDIO_PATTERNS):
+    """
+    入力指定を音声ファイルの一覧に展開する
+    ・ディレクトリ: 配下の patterns に一致するファイルを再帰的に列挙
+    ・マニフェスト(.txt/.list/.scp): 1行に1パス（空行と # 始まりの行は無視）
+    ・それ以外: ファイルパスまたは glob パターン
+    """
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for pattern in patterns:
+                files.extend(sorted(glob.glob(os.path.join(item, '**', pattern), recursive=True)))
+        elif item.endswith(MANIFEST_SUFFIXES) and os.path.isfile(item):
+            with open(item, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        files.append(line)
+        elif os.path.isfile(item):
+            files.append(item)
+        else:
+            files.extend(sorted(glob.glob(item, recursive=True)))
+
+    # 重複を除いて順序を保つ
+    return list(dict.fromkeys(files))
+
+
+def load_finished(output):
+    """
+    既存の JSONL 出力から処理済みのファイルを読み込む
+    ・エラーになったファイルは再実行の対象にする
+    ・途中で書き込みが途切れた最終行は無視する
+    """
+    finished = set()
+    if not os.path.exists(output):
+        return finished
+    with open(output, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if 'error' not in record:
+                finished.add(record['file'])
+    return finished
+
+
+def open_output(output):
+    """
+    JSONL の出力を追記用に開く
+    ・最終行が改行で終わっていなければ（書き込み中に落ちた場合）、最後の完全な行まで切り詰めてから開く。
+      そのまま追記すると新しい行が途切れた行とつながり、load_finished() で読めずに失われる
+    """
+    if os.path.exists(output):
+        with open(output, 'r+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                start = max(0, end - TAIL_BLOCK_BYTES)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b'\n')
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end < size:
+                print(f"{output}: 途中で途切れた最終行 ({size - end}バイト) を削除して追記します", file=sys.stderr)
+                f.truncate(end)
+    return open(output, 'a', encoding='utf-8')
+
+
+def iter_stdin_paths(stream=sys.stdin):
+    """
+    標準入力から1行に1パスずつ読み、届いた順に返す（空行と # 始まりの行は無視）
+    ・パイプの相手が書き込むのを待ちながら処理するため、一覧としてまとめてからは返さない
+    """
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
@@ -0,0 +1,128 @@
+"""
+複数セッションのデコード要求を1本の推論スレッドで順に実行する
+
+モデルの重みは全セッションで共有しているため、推論は1本のスレッドに集めて1件ずつ実行する
+（複数スレッドから同時に呼ぶと CPU の取り合いになり、どのセッションの遅延も悪化する）。
+要求を1件ずつスレッドへ渡すとスレッドの切り替えとイベントループとの往復がセッション数 ×
+チャンク数だけ発生するため、最初の要求から max_wait 秒以内に届いた要求を最大 max_group 件まとめて
+受け取り、1回のステップとして続けて実行する。
+
+まとめるのは受け渡しだけで、モデルの呼び出しはセッションごとに1回ずつ行う。ESPnet の
+ContextualBlockConformerEncoder の推論モード（forward_infer）はバッチサイズ 1 のみに対応しており、
+複数セッションのチャンクを積み重ねて1回の forward で処理することはできない。
+そのため全体のスループットは1セッションずつ呼び出す場合とほぼ変わらず、減らせるのは受け渡しの
+オーバーヘッドだけである。バッチ推論に対応したエンコーダを用意した場合は step に渡せば差し替えられる。
+
+step は (セッション, 音声, is_final) の列を受け取り、要求ごとの結果のリストを返す。失敗した要求の位置には
+例外のインスタンスを入れ、その要求の Future だけを失敗させる（ほかのセッションはデコーダの状態が
+進んでいるため、結果を捨てると呼び出し側の認識と食い違う）。step 自体が例外を出した場合は全件を失敗させる。
+"""
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+
+# 1ステップでまとめて受け取る要求数の上限
+MAX_GROUP = 8
+# 最初の要求から他の要求を待つ最大時間（秒）
+MAX_WAIT = 0.01
+
+
+def decode_sequential(requests):
+    """
+    (セッション, 音声, is_final) の列を1件ずつ順にデコードし、各セッションのテキストを返す
+    ・デコードに失敗した要求の位置には例外を入れ、残りの要求はそのまま続ける
+    """
+    results = []
+    for session, speech, is_final in requests:
+        try:
+            results.append(session.decode(speech, is_final))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+class InferenceThread:
+    """
+    デコード要求を集め、1本の推論スレッドで順に実行する
+    ・submit() は concurrent.futures.Future を、decode() は await できる結果を返す
+    ・同じセッションの要求は、前の要求の完了を待ってから出すこと（順序はそれで保証される）
+    """
+
+    def __init__(self, step=decode_sequential, max_group=MAX_GROUP, max_wait=MAX_WAIT):
+        self.step = step
+        self.max_group = max(1, max_group)
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._closed = False
+        # 統計情報
+        self.steps = 0
+        self.requests = 0
+        self.busy_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name='asr-inference', daemon=True)
+        self._thread.start()
+
+    def submit(self, session, speech, is_final=False):
+        """デコード要求を登録する"""
+        future = Future()
+        self._queue.put((session, speech, is_final, future))
+        return future
+
+    async def decode(self, session, speech, is_final=False):
+        """デコード要求を登録し、結果のテキストを待つ"""
+        return await asyncio.wrap_future(self.submit(session, speech, is_final))
+
+    def _collect(self, first):
+        """最初の要求から max_wait 秒以内に届いた要求を max_group 件までまとめる"""
+        group = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(group) < self.max_group:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._closed = True
+                break
+            group.append(item)
+        return group
+
+    def _run(self):
+        while not self._closed:
+            first = self._queue.get()
+            if first is None:
+                return
+            group = self._collect(first)
+            start = time.perf_counter()
+            try:
+                results = self.step([(session, speech, is_final) for session, speech, is_final, _ in group])
+            except Exception as e:
+                for *_, future in group:
+                    future.set_exception(e)
+                continue
+            finally:
+                self.busy_seconds += time.perf_counter() - start
+                self.steps += 1
+                self.requests += len(group)
+            for (*_, future), result in zip(group, results):
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    @property
+    def mean_group_size(self):
+        """1ステップあたりの平均要求数"""
+        return self.requests / self.steps if self.steps else 0.0
+
+    def close(self):
+        """推論スレッドを終了する（登録済みの要求は処理してから終わる）"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def report(self):
+        """統計情報を表示用の文字列にする"""
+        return (f"推論スレッド: {self.steps}ステップ, 要求 {self.requests}件,"
+                f" 平均 {self.mean_group_size:.2f}件/ステップ, 推論時間 {self.busy_seconds:.1f}秒")
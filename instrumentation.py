@@ -0,0 +1,499 @@
+"""
+処理段階ごとの時間と件数の計測（Prometheus 形式・JSON ログでの出力とサンプリングプロファイラ）
+
+音声の読み込み、正規化、リサンプリング、VAD、フロントエンド、エンコーダ、ビームサーチ、表示、
+要約などの段階ごとに、呼び出し回数と時間のヒストグラムを記録する。段階は入れ子にでき、
+各段階の時間は内側の段階を除いた時間として数える（すべての段階を合計すると全体の時間になる）。
+
+計測は time.perf_counter() と数回の加算だけで、ロックも取らないため常に有効にしておける
+（複数のスレッドが同じ段階を同時に記録すると、まれに件数がずれることがある）。
+
+・環境変数 ASR_METRICS=0: 計測しない（stage() などは何もしない）
+・環境変数 ASR_METRICS_PORT: 指定したポートで Prometheus 形式（/metrics）と JSON（/metrics.json）を公開する
+・環境変数 ASR_METRICS_HOST: 計測値を公開するアドレス（既定: 127.0.0.1。ほかのホストから読む場合は 0.0.0.0）
+・環境変数 ASR_METRICS_LOG: 指定したファイル（'-' は標準エラー出力）に ASR_METRICS_INTERVAL 秒
+  （既定: 60）ごとに JSON を1行ずつ追記する
+・環境変数 ASR_PROFILE: サンプリングプロファイラの結果（collapsed stack 形式。flamegraph.pl などで
+  図にできる）の保存先。SIGUSR1 で記録の開始と停止を切り替える
+・環境変数 ASR_PROFILE_INTERVAL: プロファイラのサンプリング間隔（ミリ秒。既定: 5）
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import signal
+import threading
+from bisect import bisect_left
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.environ.get('ASR_METRICS', '1') not in ('', '0')
+METRICS_PORT = int(os.environ.get('ASR_METRICS_PORT') or 0)
+METRICS_HOST = os.environ.get('ASR_METRICS_HOST') or '127.0.0.1'
+METRICS_LOG = os.environ.get('ASR_METRICS_LOG', '')
+METRICS_INTERVAL = float(os.environ.get('ASR_METRICS_INTERVAL', '60'))
+PROFILE = os.environ.get('ASR_PROFILE', '')
+PROFILE_INTERVAL = float(os.environ.get('ASR_PROFILE_INTERVAL', '5')) / 1000
+
+# ヒストグラムの区切り（秒）
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class StageStats:
+    """1つの段階の呼び出し回数・合計時間・最大時間・ヒストグラム"""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+
+class _Stage:
+    """with 文で使う段階の計測（状態はスレッドごとのスタックに置くため、スレッド間で共有できる）"""
+
+    __slots__ = ('metrics', 'stats')
+
+    def __init__(self, metrics, stats):
+        self.metrics = metrics
+        self.stats = stats
+
+    def __enter__(self):
+        self.metrics._push(self.stats)
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._pop(self.stats)
+        return False
+
+
+class _NullStage:
+    """計測しない場合の stage()"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Metrics:
+    """
+    段階ごとの時間と件数を記録する
+    ・stage(name): with 文で囲んだ処理の時間を記録する（内側の段階の時間は除く）
+    ・count(name, n): 件数を加算する / gauge(name, value): 現在値を記録する
+    ・wrap(func, name) / wrap_method(obj, attr, name) / timed_iter(iterable, name): 既存の処理を段階として包む
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started = time.time()
+        self.stages = {}
+        self.counters = Counter()
+        self.gauges = {}
+        self._contexts = {}
+        self._local = threading.local()
+
+    def _stats(self, name):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages.setdefault(name, StageStats(name))
+        return stats
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _push(self, stats):
+        # [段階, 開始時刻, 内側の段階の合計時間]
+        self._stack().append([stats, time.perf_counter(), 0.0])
+
+    def _pop(self, stats):
+        now = time.perf_counter()
+        stack = self._stack()
+        # 内側の段階が例外で閉じられなかった場合は、その分を捨てる
+        while stack and stack[-1][0] is not stats:
+            stack.pop()
+        if not stack:
+            return
+        _, start, child = stack.pop()
+        elapsed = now - start
+        stats.observe(elapsed - child)
+        if stack:
+            stack[-1][2] += elapsed
+
+    def stage(self, name):
+        """name の段階として時間を記録する with 文用のオブジェクト"""
+        if not self.enabled:
+            return _NULL_STAGE
+        context = self._contexts.get(name)
+        if context is None:
+            context = self._contexts[name] = _Stage(self, self._stats(name))
+        return context
+
+    def begin(self, name):
+        """段階を開始する（with 文を使えない場合。end() と対にして呼ぶ）"""
+        if self.enabled:
+            self._push(self._stats(name))
+
+    def end(self, name):
+        """begin() で開始した段階を終了する"""
+        if self.enabled:
+            self._pop(self._stats(name))
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    def gauge(self, name, value):
+        if self.enabled:
+            self.gauges[name] = value
+
+    def wrap(self, func, name):
+        """func を呼ぶたびに name の段階として記録する関数を返す（計測しない場合は func のまま）"""
+        if not self.enabled:
+            return func
+        context = self.stage(name)
+
+        def wrapper(*args, **kwargs):
+            with context:
+                return func(*args, **kwargs)
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def wrap_method(self, obj, attr, name):
+        """obj のメソッド attr をインスタンスの属性として計測付きのものに置き換える"""
+        method = getattr(obj, attr, None)
+        if method is not None and self.enabled and not hasattr(method, '__wrapped__'):
+            setattr(obj, attr, self.wrap(method, name))
+        return obj
+
+    def timed_iter(self, iterable, name):
+        """イテレータの要素を1つ取り出すごとに name の段階として記録する"""
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        stats = self._stats(name)
+        while True:
+            self._push(stats)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                # 終わりを確認しただけの呼び出しは記録しない
+                self._stack().pop()
+                return
+            except BaseException:
+                self._pop(stats)
+                raise
+            self._pop(stats)
+            yield item
+
+    def snapshot(self):
+        """現在の計測値を辞書で返す"""
+        return {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'uptime_s': round(time.time() - self.started, 3),
+            'stages': {
+                name: {
+                    'count': s.count,
+                    'total_s': round(s.total, 6),
+                    'mean_ms': round(s.total / s.count * 1000, 3) if s.count else 0.0,
+                    'max_ms': round(s.max * 1000, 3),
+                }
+                for name, s in list(self.stages.items())
+            },
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+        }
+
+    def prometheus_text(self):
+        """Prometheus のテキスト形式で出力する"""
+        lines = [
+            "# HELP asr_stage_seconds 処理段階ごとの時間（内側の段階を除く）",
+            "# TYPE asr_stage_seconds histogram",
+        ]
+        for name, s in list(self.stages.items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS, s.buckets):
+                cumulative += n
+                lines.append(f'asr_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'asr_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {s.count}')
+            lines.append(f'asr_stage_seconds_sum{{stage="{name}"}} {s.total:.6f}')
+            lines.append(f'asr_stage_seconds_count{{stage="{name}"}} {s.count}')
+        lines += ["# HELP asr_events_total 処理した件数", "# TYPE asr_events_total counter"]
+        for name, n in list(self.counters.items()):
+            lines.append(f'asr_events_total{{name="{name}"}} {n}')
+        lines += ["# HELP asr_value 現在値", "# TYPE asr_value gauge"]
+        for name, value in list(self.gauges.items()):
+            lines.append(f'asr_value{{name="{name}"}} {value}')
+        lines += ["# HELP asr_uptime_seconds 計測を始めてからの秒数", "# TYPE asr_uptime_seconds gauge"]
+        lines.append(f"asr_uptime_seconds {time.time() - self.started:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def report(self):
+        """段階ごとの集計を表示用の文字列にする"""
+        stages = sorted(self.stages.values(), key=lambda s: s.total, reverse=True)
+        total = sum(s.total for s in stages)
+        if not stages:
+            return "計測: 記録なし"
+        lines = [f"{'段階':<14} {'回数':>8} {'合計[s]':>9} {'平均[ms]':>9} {'最大[ms]':>9} {'割合':>6}"]
+        for s in stages:
+            lines.append(f"{s.name:<14} {s.count:>8} {s.total:>9.3f} {s.total / s.count * 1000:>9.3f}"
+                         f" {s.max * 1000:>9.3f} {s.total / total * 100 if total else 0.0:>5.1f}%")
+        if self.counters:
+            lines.append("件数: " + ", ".join(f"{name}={n}" for name, n in self.counters.items()))
+        return "\n".join(lines)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    metrics = None
+
+    def do_GET(self):
+        if self.path.startswith('/metrics.json'):
+            body = json.dumps(self.metrics.snapshot(), ensure_ascii=False).encode('utf-8')
+            content_type = 'application/json'
+        elif self.path.startswith('/metrics'):
+            body = self.metrics.prometheus_text().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # アクセスログで文字起こしの表示を崩さない
+        pass
+
+
+def serve_metrics(metrics, port, host=METRICS_HOST):
+    """Prometheus 形式の計測値を HTTP で公開する（デーモンスレッドで動く）"""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'metrics': metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+class JsonLogger:
+    """
+    interval 秒ごとに計測値を JSON で1行ずつ書き出す
+    ・各段階には前回の出力からの増分（interval_count / interval_s）も含める
+    """
+
+    def __init__(self, metrics, path, interval=METRICS_INTERVAL):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._last = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-log', daemon=True)
+        self._thread.start()
+
+    def write(self):
+        snapshot = self.metrics.snapshot()
+        for name, stage in snapshot['stages'].items():
+            count, total = self._last.get(name, (0, 0.0))
+            stage['interval_count'] = stage['count'] - count
+            stage['interval_s'] = round(stage['total_s'] - total, 6)
+            self._last[name] = (stage['count'], stage['total_s'])
+        line = json.dumps(snapshot, ensure_ascii=False) + "\n"
+        if self.path == '-':
+            sys.stderr.write(line)
+            sys.stderr.flush()
+        else:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def close(self):
+        """最後の計測値を書き出して終了する"""
+        self._stop.set()
+        self.write()
+
+
+class SamplingProfiler:
+    """
+    対象スレッドのスタックを一定間隔で記録するサンプリングプロファイラ
+    ・計測対象のコードには手を入れず、別スレッドから sys._current_frames() を読む
+    ・記録していない間はスレッドを止めているため、切り替え可能なまま常駐させておける
+    ・結果は collapsed stack 形式（"関数;関数;... 回数"）で保存する
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.samples = Counter()
+        self._running = threading.Event()
+        self._stop = False
+        self._thread = None
+
+    @property
+    def active(self):
+        return self._running.is_set()
+
+    def start(self):
+        """記録を開始する"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+        self._running.set()
+
+    def stop(self):
+        """記録を止める（それまでのサンプルは残す）"""
+        self._running.clear()
+
+    def toggle(self):
+        """記録の開始と停止を切り替え、切り替え後に記録中なら True を返す"""
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+        return self.active
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop:
+            self._running.wait()
+            if self._stop:
+                return
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None and self.thread_id != me:
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def dump(self, path):
+        """collapsed stack 形式で保存する"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, n in self.samples.most_common():
+                f.write(f"{stack} {n}\n")
+
+    def top(self, n=10):
+        """サンプル数の多い関数（スタックの末端）を表示用の文字列にする"""
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values())
+        if not total:
+            return "プロファイラ: サンプルなし"
+        lines = [f"プロファイラ: {total}サンプル"]
+        for name, count in leaves.most_common(n):
+            lines.append(f"  {count / total * 100:5.1f}% {name}")
+        return "\n".join(lines)
+
+    def close(self):
+        self._stop = True
+        self._running.set()
+
+
+# スクリプト全体で共有する計測値
+METRICS = Metrics(enabled=ENABLED)
+stage = METRICS.stage
+count = METRICS.count
+gauge = METRICS.gauge
+wrap = METRICS.wrap
+wrap_method = METRICS.wrap_method
+timed_iter = METRICS.timed_iter
+report = METRICS.report
+
+_logger = None
+_profiler = None
+
+
+def instrument_speech2text(speech2text, metrics=METRICS):
+    """
+    Speech2TextStreaming の内部の段階（フロントエンド・エンコーダ・ビームサーチ）を計測する
+    ・フロントエンドはインスタンスの apply_frontend を置き換え、エンコーダとビームサーチは
+      torch のフォワードフックで計測する（重みを共有するセッションの分岐にも効く）
+    ・呼び出し全体を stage('decode') で囲むと、decode にはそれ以外の時間（仮説の組み立てなど）が残る
+    ・GreedyCTCStreaming などのラッパーは内側の Speech2TextStreaming を計測する
+    """
+    if not metrics.enabled:
+        return speech2text
+    target = getattr(speech2text, 'speech2text', speech2text)
+    metrics.wrap_method(target, 'apply_frontend', 'frontend')
+    model = getattr(target, 'asr_model', None)
+    for name, module in (('encoder', getattr(model, 'encoder', None)),
+                         ('beam_search', getattr(target, 'beam_search', None))):
+        if module is None or not hasattr(module, 'register_forward_hook') or getattr(module, '_asr_metrics', False):
+            continue
+        module.register_forward_pre_hook(lambda m, args, name=name: metrics.begin(name))
+        module.register_forward_hook(lambda m, args, output, name=name: metrics.end(name))
+        module._asr_metrics = True
+    return speech2text
+
+
+def add_arguments(parser):
+    """計測の出力先のコマンドライン引数を追加する（既定値は環境変数から取る）"""
+    group = parser.add_argument_group("計測")
+    group.add_argument('--metrics-port', type=int, default=METRICS_PORT or None,
+                       help="Prometheus 形式の計測値を公開するポート（/metrics）")
+    group.add_argument('--metrics-host', default=METRICS_HOST,
+                       help="計測値を公開するアドレス（ほかのホストから読む場合は 0.0.0.0）")
+    group.add_argument('--metrics-log', default=METRICS_LOG or None,
+                       help="計測値を JSON で定期的に追記するファイル（'-' で標準エラー出力）")
+    group.add_argument('--metrics-interval', type=float, default=METRICS_INTERVAL,
+                       help="--metrics-log に書き出す間隔（秒）")
+    group.add_argument('--profile', default=PROFILE or None,
+                       help="サンプリングプロファイラの結果の保存先（SIGUSR1 で記録を切り替える）")
+    return group
+
+
+def setup(port=METRICS_PORT, log=METRICS_LOG, interval=METRICS_INTERVAL, profile=PROFILE, host=METRICS_HOST):
+    """
+    計測値の出力とプロファイラを開始する（既定値は環境変数の設定）
+    ・プロファイラは呼び出したスレッド（推論のループ）を記録し、開始時から記録する
+    ・終了時に JSON ログの最後の1行とプロファイラの結果を書き出す
+    """
+    global _logger, _profiler
+    if not METRICS.enabled:
+        return
+    if port:
+        serve_metrics(METRICS, port, host)
+        print(f"計測値を公開しています: http://{host}:{port}/metrics")
+    if log and _logger is None:
+        _logger = JsonLogger(METRICS, log, interval)
+        atexit.register(_logger.close)
+    if profile and _profiler is None:
+        _profiler = SamplingProfiler(thread_id=threading.get_ident())
+        _profiler.start()
+        if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda sig, frame: _profiler.toggle())
+
+        def finish():
+            _profiler.close()
+            _profiler.dump(profile)
+            print(_profiler.top())
+            print(f"プロファイラの結果を保存しました: {profile}")
+        atexit.register(finish)
+
+
+def setup_from_args(args):
+    """add_arguments() で追加した引数で setup() を呼ぶ"""
+    setup(args.metrics_port, args.metrics_log, args.metrics_interval, args.profile, args.metrics_host)
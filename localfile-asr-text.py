@@ -1,96 +1,449 @@
-import sys
-import wave
-import numpy as np
-import librosa  # Add this import for resampling
-from espnet_model_zoo.downloader import ModelDownloader
-from espnet2.bin.asr_inference_streaming import Speech2TextStreaming
+import os
+import json
+import time
+import argparse
+import multiprocessing as mp
+import audio_io
+from audio_io import PCMConverter
+from resampler import StreamingResampler, TARGET_SAMPLE_RATE
+from transcript import TranscriptState, format_time
+from file_inputs import collect_inputs, load_finished, open_output
+from vad import EnergyVAD
+from segmenter import split_at_silence
+from renderer import TranscriptRenderer, QUIET
+import model_cache
+import asr_config
+import chunking
+import instrumentation
+import result_cache
 
 tag = 'eml914/streaming_conformer_asr_csj'
 audio_file = "GD-ST-A_a1.wav"
+# バッチモードの結果出力先（JSONL）
+DEFAULT_OUTPUT = "transcripts.jsonl"
+# 無音のチャンクをデコードせずに読み飛ばすかどうか
+USE_VAD = True
+# デコードのチャンク長（'model' でエンコーダのブロック設定に合わせる。サンプル数も指定できる）
+CHUNK = chunking.CHUNK_MODE
+# offline モードで区切る区間のおよその長さ（秒）
+SEGMENT_SECONDS = 60.0
 
-# モデルのセットアップ
-d=ModelDownloader()
-speech2text = Speech2TextStreaming(
-    **d.download_and_unpack(tag),
-    token_type=None,
-    bpemodel=None,
-    maxlenratio=0.0,
-    minlenratio=0.0,
-    beam_size=20,
-    ctc_weight=0.5,
-    lm_weight=0.0,
-    penalty=0.0,
-    nbest=1,
-    device = "cuda",
-    disable_repetition_detection=True,
-    decoder_text_length_limit=0,
-    encoded_feat_length_limit=0
-)
-
-
-prev_lines = 0
-def progress_output(text):
-    """
-    推論中の進捗を表示する
-    ・50文字ごとに改行を挿入
-    ・進捗を表示するために、前の行を上書きする
-    """
-    global prev_lines
-    lines=['']
-    for i in text:
-        if len(lines[-1]) > 50:
-            lines.append('')
-        lines[-1] += i
-    for i,line in enumerate(lines):
-        if i == prev_lines:
-            sys.stderr.write('\n\r')
-        else:
-            sys.stderr.write('\r\033[B\033[K')
-        sys.stderr.write(line)
-
-    prev_lines = len(lines)
-    sys.stderr.flush()
-
-
-def recognize(wavfile):
+# モデルはプロセスごとに一度だけロードする
+speech2text = None
+
+
+def build_speech2text(config=None, verbose=True):
+    """
+    推論の設定に従って Speech2TextStreaming をモデルキャッシュから読み込む
+    """
+    speech2text = asr_config.load_speech2text(config, tag=tag, verbose=verbose)
+    # フロントエンド・エンコーダ・ビームサーチの時間を段階ごとに記録する
+    return instrumentation.instrument_speech2text(speech2text)
+
+
+def recognize(wavfile, show_progress=True, vad=None, chunk=None, span=None, transcript=None):
     """
     音声ファイルを読み込んで、ASR推論を行う
+    ・最終的な認識結果のテキストを返す
+    ・show_progress=False の場合は途中経過を表示しない（バッチモード用）
+    ・vad を渡すと無音のチャンクはデコードせず、発話の終わりごとにデコーダをリセットする
+    ・chunk はチャンクの指定（'model' またはサンプル数。省略時は環境変数 ASR_CHUNK）
+    ・span（segmenter.Span）を渡すとその範囲だけを1つの音声としてデコードする（offline モード用）
+    ・transcript（TranscriptState）を渡すと、ファイル先頭からの時刻付きの発話区間をそこに記録する
     """
-    with wave.open(wavfile, 'rb') as wavfile:
-        ch = wavfile.getnchannels()
-        bits = wavfile.getsampwidth()
-        rate = wavfile.getframerate()
-        nframes = wavfile.getnframes()
-        buf = wavfile.readframes(-1)
-        data = np.frombuffer(buf, dtype=np.int16)
-
-    # ステレオ音声をモノラルに変換
-    # if ch > 1:
-    #     data = data.reshape(-1, ch).mean(axis=1).astype(np.int16)
-
-    # 正規化（16ビットの範囲を [-1.0, 1.0] にスケール）
-    speech = data.astype(np.float32) / 32768.0
-
-    # Resample audio to match the model's expected sample rate (16 kHz)
-    target_sample_rate = 16000
-    if rate != target_sample_rate:
-        speech = librosa.resample(speech, orig_sr=rate, target_sr=target_sample_rate)
-
-    sim_chunk_length = 640
-    if sim_chunk_length > 0:
-        for i in range(len(speech) // sim_chunk_length):
-            results = speech2text(speech=speech[i * sim_chunk_length:(i + 1) * sim_chunk_length], is_final=False)
+    # 途中結果は変わった部分だけを書き直して表示する
+    renderer = TranscriptRenderer(quiet=not show_progress)
+    instrumentation.wrap_method(renderer, 'update', 'render')
+    instrumentation.wrap_method(renderer, 'commit', 'render')
+    if transcript is None:
+        transcript = TranscriptState()
+    with audio_io.open_wav(wavfile) as wav:
+        rate = wav.rate
+        start, end = span if span is not None else (0, wav.nframes)
+        base_time = start / rate
+        transcript.restore(transcript.segments, base_time)
+
+        # チャンク長はエンコーダのブロック設定に合わせる（1回の呼び出しで1ブロック進む）
+        # 正規化（16ビットの範囲を [-1.0, 1.0] にスケール）はチャンクごとに、再利用するバッファ上で行う
+        sim_chunk_length = chunking.resolve_chunk_size(speech2text, chunk)
+        total = end - start
+        converter = instrumentation.wrap_method(PCMConverter(sim_chunk_length * wav.channels), 'convert', 'normalize')
+        chunks = instrumentation.timed_iter(wav.chunks(sim_chunk_length, start, end, converter=converter), 'read')
+        # チャンクの位置は範囲の先頭からのサンプル数で数える
+        origin = start
+
+        # モデルが想定するサンプリングレート（16kHz・モノラル）に合わせて、
+        # ダウンミックスとリサンプリングをチャンクごとに行う
+        if rate != TARGET_SAMPLE_RATE or wav.channels > 1:
+            resampler = StreamingResampler(rate, TARGET_SAMPLE_RATE)
+            total = resampler.output_length(end - start)
+            chunks = instrumentation.timed_iter(resampler.resample_chunks(chunks, sim_chunk_length), 'resample')
+            origin = 0
+
+        for offset, chunk in chunks:
+            position = offset - origin + len(chunk)
+            is_last = position >= total
+            end_time = base_time + position / TARGET_SAMPLE_RATE
+            instrumentation.count('chunks')
+            if vad is not None:
+                with instrumentation.stage('vad'):
+                    speech, is_final = vad.gate(chunk, is_last=is_last)
+                if speech is None:
+                    # 無音のチャンクはデコードしない
+                    instrumentation.count('vad_skipped_chunks')
+                    continue
+            else:
+                speech, is_final = chunk, is_last
+
+            with instrumentation.stage('decode'):
+                results = speech2text(speech=speech, is_final=is_final)
+            text = ""
             if results is not None and len(results) > 0:
                 nbests = [text for text, token, token_int, hyp in results]
                 text = nbests[0] if nbests is not None and len(nbests) > 0 else ""
-                progress_output(nbests[0])
+
+            if is_final:
+                transcript.finalize(text, end_time)
+            else:
+                transcript.update(text, end_time)
+
+            renderer.update(text)
+            if is_final:
+                # 確定した発話は残して、次の発話は新しい行に表示する
+                renderer.commit()
+
+    renderer.close()
+    return transcript.finalized_text
+
+
+def cache_options(config=None, use_vad=USE_VAD, chunk=CHUNK, **extra):
+    """
+    結果のキャッシュのキーに含めるデコードの設定（VAD の有無・チャンク長も結果を変えるため含める）
+    """
+    return result_cache.decoding_options(config or asr_config.from_env(), vad=use_vad, chunk=str(chunk), **extra)
+
+
+def cache_key(cache, wavfile, options):
+    """
+    音声ファイルの結果のキャッシュのキー（キャッシュが無効か、ファイルを開けない場合は None）
+    """
+    if not cache.enabled:
+        return None
+    try:
+        with audio_io.open_wav(wavfile) as wav:
+            return cache.key(wav, tag, options)
+    except Exception:
+        return None
+
+
+def _init_worker(config, use_vad, chunk):
+    """
+    ワーカープロセスの初期化（モデルはここで一度だけキャッシュから読み込む）
+    """
+    global speech2text, USE_VAD, CHUNK
+    speech2text = build_speech2text(config, verbose=False)
+    USE_VAD = use_vad
+    CHUNK = chunk
+
+
+def _transcribe_worker(wavfile):
+    """
+    ワーカープロセスで1ファイルを文字起こしし、結果を辞書で返す
+    """
+    start = time.time()
+    try:
+        with audio_io.open_wav(wavfile) as wav:
+            duration = wav.duration
+        vad = EnergyVAD() if USE_VAD else None
+        text = recognize(wavfile, show_progress=False, vad=vad, chunk=CHUNK)
+    except Exception as e:
+        return {'file': wavfile, 'error': f"{type(e).__name__}: {e}"}
+    elapsed = time.time() - start
+    result = {
+        'file': wavfile,
+        'text': text,
+        'duration': round(duration, 3),
+        'elapsed': round(elapsed, 3),
+        'rtf': round(elapsed / duration, 4) if duration > 0 else None,
+    }
+    if vad is not None:
+        result['vad_skipped'] = round(vad.skipped_samples / vad.rate, 3)
+    return result
+
+
+def _worker_pool(workers, use_vad, config=None, chunk=CHUNK):
+    """
+    モデルを読み込んだワーカープロセスのプールを作る
+    ・モデルのダウンロードと構築は親プロセスで一度だけ行い、キャッシュに保存しておく
+    ・各ワーカーはキャッシュをメモリマップで読み込むため、重みのページはプロセス間で共有される
+    """
+    config = config or asr_config.from_env()
+    load_timings = model_cache.ensure_cached(tag, **asr_config.model_options(config))
+    if load_timings:
+        print(f"モデルをキャッシュに保存しました: {model_cache.format_timings(load_timings)}")
+
+    # スレッド数の指定がなければ、CPU コアをワーカーで分け合う（スレッドの取り合いを避ける）
+    if config.threads is None and config.device == 'cpu':
+        config = config._replace(threads=max(1, (os.cpu_count() or 1) // workers))
+    print(f"デバイス: {config.device}, ワーカーあたりのスレッド数: {config.threads or '既定'},"
+          f" 精度: {'int8' if config.int8 else 'fp32'}")
+
+    # CUDA を使うため fork ではなく spawn でワーカーを起動する
+    ctx = mp.get_context('spawn')
+    return ctx.Pool(workers, initializer=_init_worker, initargs=(config, use_vad, chunk))
+
+
+def batch_recognize(wavfiles, output, workers, use_vad=USE_VAD, config=None, chunk=CHUNK, cache=None):
+    """
+    複数の音声ファイルをワーカープロセスのプールで並列に文字起こしする
+    ・各ワーカーはモデルを一度だけロードして使い回す
+    ・結果は完了したものから JSONL に追記するため、途中で落ちても完了分は失われない
+    ・再実行時は出力済みのファイルをスキップする
+    ・cache（result_cache.ResultCache）に同じ内容の音声の結果があれば、デコードせずにそれを書き出す
+    """
+    cache = cache or result_cache.ResultCache(None)
+    finished = load_finished(output)
+    todo = [f for f in wavfiles if f not in finished]
+    print(f"入力ファイル数: {len(wavfiles)}, 処理済み: {len(wavfiles) - len(todo)}, 処理対象: {len(todo)}")
+    if not todo:
+        return
+
+    start = time.time()
+    done = 0
+    errors = 0
+    audio = 0.0
+    skipped = 0.0
+    options = cache_options(config, use_vad, chunk)
+    keys = {}
+    misses = []
+    # 同じ内容のファイルは1つだけデコードし、残りはその結果を使う（キー -> ファイルのリスト）
+    duplicates = {}
+    with open_output(output) as out:
+        def write_cached(wavfile, cached):
+            nonlocal done
+            result = {'file': wavfile, 'text': cached['text'], 'duration': cached['duration'],
+                      'elapsed': 0.0, 'rtf': 0.0, 'cached': True}
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+            out.flush()
+            done += 1
+            print(f"[{done}/{len(todo)}] {wavfile} ({result['duration']}秒, キャッシュ)")
+
+        # キャッシュにある結果は、モデルを読み込む前にすぐ書き出す
+        for wavfile in todo:
+            key = keys[wavfile] = cache_key(cache, wavfile, options)
+            if key in duplicates:
+                duplicates[key].append(wavfile)
+                continue
+            cached = cache.get(key)
+            if cached is not None:
+                write_cached(wavfile, cached)
+                continue
+            misses.append(wavfile)
+            if key is not None:
+                duplicates[key] = []
+        if cache.enabled:
+            print(f"キャッシュ: {len(todo) - len(misses)}件, デコード対象: {len(misses)}件")
+
+        if misses:
+            workers = max(1, min(workers, len(misses)))
+            print(f"ワーカー数: {workers}, 出力先: {output}")
+            with _worker_pool(workers, use_vad, config, chunk) as pool:
+                for result in pool.imap_unordered(_transcribe_worker, misses):
+                    out.write(json.dumps(result, ensure_ascii=False) + '\n')
+                    out.flush()
+                    done += 1
+                    key = keys[result['file']]
+                    if 'error' in result:
+                        errors += 1
+                        print(f"[{done}/{len(todo)}] エラー: {result['file']}: {result['error']}")
+                        # 同じ内容のファイルも同じエラーになるため、デコードし直さない
+                        for wavfile in duplicates.pop(key, []):
+                            out.write(json.dumps(dict(result, file=wavfile), ensure_ascii=False) + '\n')
+                            done += 1
+                            errors += 1
+                        continue
+                    cached = {'text': result['text'], 'duration': result['duration']}
+                    cache.put(key, cached)
+                    audio += result['duration']
+                    skipped += result.get('vad_skipped', 0.0)
+                    print(f"[{done}/{len(todo)}] {result['file']} ({result['duration']}秒, RTF={result['rtf']})")
+                    for wavfile in duplicates.pop(key, []):
+                        write_cached(wavfile, cached)
+
+    print(f"完了: {done}ファイル (エラー {errors}件), 経過時間 {time.time() - start:.1f}秒")
+    if use_vad and audio:
+        print(f"VAD: 無音としてデコードを省略 {skipped:.1f}秒 / {audio:.1f}秒"
+              f" ({skipped / audio * 100 if audio else 0.0:.1f}%)")
+
+
+def _decode_span_worker(task):
+    """
+    ワーカープロセスで1つの区間をデコードし、(区間番号, 発話区間のリスト, 経過時間) を返す
+    """
+    index, wavfile, span = task
+    start = time.time()
+    transcript = TranscriptState()
+    vad = EnergyVAD() if USE_VAD else None
+    recognize(wavfile, show_progress=False, vad=vad, chunk=CHUNK, span=span, transcript=transcript)
+    return index, [tuple(segment) for segment in transcript.segments], time.time() - start
+
+
+def offline_recognize(wavfiles, output, workers, use_vad=USE_VAD, config=None, chunk=CHUNK,
+                      segment_seconds=SEGMENT_SECONDS, cache=None):
+    """
+    長い音声ファイルを無音の位置で区間に分け、区間ごとにワーカープロセスで並列にデコードする
+    ・区切りの位置はエネルギーだけを見る軽い処理で先に求める（segmenter.split_at_silence）
+    ・各区間は独立した音声としてデコードする（区間の先頭でデコーダの状態は初期化される）
+    ・結果は区間の順に並べ直し、ファイル先頭からの時刻付きの発話区間としてつなげる
+    ・output を指定すると1ファイル1行の JSONL（発話区間を含む）に追記し、省略時は表示する
+    ・cache（result_cache.ResultCache）に同じ内容の音声の結果があれば、分割もデコードもせずにそれを使う
+    ・読み込みやデコードに失敗したファイルは {'file', 'error'} の行を書き出し、次のファイルに進む
+    """
+    cache = cache or result_cache.ResultCache(None)
+    options = cache_options(config, use_vad, chunk, mode='offline', segment_seconds=segment_seconds)
+    out = open_output(output) if output else None
+    print(f"offline モード: ワーカー数 {workers}, 区間の長さ 約{segment_seconds:g}秒")
+    # ワーカーはキャッシュにないファイルが出てきたときに初めて起動する
+    pool = None
+    try:
+        for wavfile in wavfiles:
+            start = time.time()
+            key = cache_key(cache, wavfile, options)
+            cached = cache.get(key)
+            if cached is not None:
+                duration = cached['duration']
+                spans = [None] * cached['spans']
+                segments = [(s['start'], s['end'], s['text']) for s in cached['segments']]
+                elapsed = time.time() - start
+                print(f"{wavfile}: キャッシュの結果を使います ({duration:.1f}秒, {len(spans)}区間)")
             else:
-                progress_output("")
+                try:
+                    with audio_io.open_wav(wavfile) as wav:
+                        duration = wav.duration
+                        spans = split_at_silence(wav, segment_seconds)
+                    print(f"{wavfile}: {duration:.1f}秒を {len(spans)}区間に分割しました"
+                          f" (分割 {time.time() - start:.2f}秒)")
+                    if pool is None:
+                        pool = _worker_pool(workers, use_vad, config, chunk)
+
+                    # 終わった区間から受け取り、最後に区間の順に並べ直す
+                    tasks = [(i, wavfile, span) for i, span in enumerate(spans)]
+                    results = [None] * len(spans)
+                    for done, (index, segments, elapsed) in enumerate(pool.imap_unordered(_decode_span_worker, tasks), 1):
+                        results[index] = segments
+                        span = spans[index]
+                        print(f"  [{done}/{len(spans)}] 区間 {index + 1}"
+                              f" ({format_time(span.start / wav.rate)} - {format_time(span.end / wav.rate)},"
+                              f" {elapsed:.1f}秒)")
+                    segments = [segment for span_segments in results for segment in span_segments]
+                    elapsed = time.time() - start
+                    cache.put(key, {
+                        'text': "".join(segment[2] for segment in segments),
+                        'duration': round(duration, 3),
+                        'spans': len(spans),
+                        'segments': [{'start': round(s, 3), 'end': round(e, 3), 'text': t} for s, e, t in segments],
+                    })
+                except Exception as e:
+                    # 1ファイルの失敗で全体を止めず、エラーを記録して次のファイルに進む
+                    error = f"{type(e).__name__}: {e}"
+                    print(f"{wavfile}: エラー {error}")
+                    if out is not None:
+                        out.write(json.dumps({'file': wavfile, 'error': error}, ensure_ascii=False) + '\n')
+                        out.flush()
+                    continue
+
+            text = "".join(segment[2] for segment in segments)
+            print(f"{wavfile}: 経過時間 {elapsed:.1f}秒, RTF={elapsed / duration if duration else 0.0:.4f}")
+            if out is not None:
+                record = {
+                    'file': wavfile,
+                    'text': text,
+                    'duration': round(duration, 3),
+                    'elapsed': round(elapsed, 3),
+                    'rtf': round(elapsed / duration, 4) if duration > 0 else None,
+                    'spans': len(spans),
+                    'segments': [{'start': round(s, 3), 'end': round(e, 3), 'text': t} for s, e, t in segments],
+                }
+                if cached is not None:
+                    record['cached'] = True
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                out.flush()
+            else:
+                for s, e, t in segments:
+                    print(f"[{format_time(s)} - {format_time(e)}] {t}")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if out is not None:
+            out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ローカルの音声ファイルを文字起こしする")
+    parser.add_argument('inputs', nargs='*',
+                        help="音声ファイル、ディレクトリ、globパターン、またはマニフェスト(.txt/.list/.scp)")
+    parser.add_argument('-o', '--output',
+                        help=f"バッチモードの結果出力先 JSONL（既定: {DEFAULT_OUTPUT}）")
+    parser.add_argument('-j', '--workers', type=int, default=max(1, (os.cpu_count() or 1) // 2),
+                        help="バッチモードのワーカープロセス数")
+    parser.add_argument('--no-vad', action='store_true',
+                        help="VAD を使わず、無音のチャンクもすべてデコードする")
+    parser.add_argument('--chunk', default=CHUNK,
+                        help="デコードのチャンク長（サンプル数。'model' でエンコーダのブロック設定に合わせる）")
+    parser.add_argument('--offline', action='store_true',
+                        help="長いファイルを無音の位置で区間に分け、区間ごとに -j 個のワーカーで並列にデコードする")
+    parser.add_argument('--segment-seconds', type=float, default=SEGMENT_SECONDS,
+                        help="offline モードで区切る区間のおよその長さ（秒）")
+    parser.add_argument('--quiet', action='store_true', default=QUIET,
+                        help="1ファイルの場合に途中経過を表示せず、最終結果だけを出力する")
+    asr_config.add_arguments(parser)
+    instrumentation.add_arguments(parser)
+    result_cache.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.setup_from_args(args)
+    use_vad = USE_VAD and not args.no_vad
+    config = asr_config.from_args(args)
+    cache = result_cache.from_args(args)
+
+    wavfiles = collect_inputs(args.inputs) if args.inputs else [audio_file]
+    if not wavfiles:
+        parser.error("入力に一致する音声ファイルがありません")
+
+    if args.offline:
+        offline_recognize(wavfiles, args.output, max(1, args.workers), use_vad, config, args.chunk,
+                          args.segment_seconds, cache)
+        print(cache.report())
+        return
+
+    # 1ファイルのみで出力先の指定がなければ、従来どおり途中経過を表示する
+    if len(wavfiles) == 1 and args.output is None:
+        # キャッシュに結果があれば、モデルを読み込まずに表示する
+        key = cache_key(cache, wavfiles[0], cache_options(config, use_vad, args.chunk))
+        cached = cache.get(key)
+        if cached is not None:
+            print(cached['text'])
+            print(cache.report())
+            return
+        global speech2text
+        speech2text = build_speech2text(config)
+        print(chunking.describe(speech2text))
+        vad = EnergyVAD() if use_vad else None
+        with audio_io.open_wav(wavfiles[0]) as wav:
+            duration = wav.duration
+        text = recognize(wavfiles[0], show_progress=not args.quiet, vad=vad, chunk=args.chunk)
+        cache.put(key, {'text': text, 'duration': round(duration, 3)})
+        if args.quiet:
+            print(text)
+        if vad is not None:
+            print("\n" + vad.report())
+        print(instrumentation.report())
+        print(cache.report())
+        return
+
+    batch_recognize(wavfiles, args.output or DEFAULT_OUTPUT, args.workers, use_vad, config, args.chunk, cache)
+    print(cache.report())
 
-        results = speech2text(speech[(i + 1) * sim_chunk_length:len(speech)], is_final=True)
-    else:
-        results = speech2text(speech, is_final=True)
-    nbests = [text for text, token, token_int, hyp in results]
-    progress_output(nbests[0])
 
-recognize(audio_file)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+計測値の集計に使う小さな関数群
+"""
+
+
+def percentile(values, q):
+    """values の q パーセンタイル（最近傍法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def error_rate(reference, hypothesis):
+    """
+    reference に対する hypothesis の誤り率（編集距離 / 参照の長さ）
+    ・日本語は単語の区切りがないため、空白を除いた文字単位で比較する（文字誤り率）
+    """
+    ref = ''.join(reference.split())
+    hyp = ''.join(hypothesis.split())
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1] / len(ref)
@@ -1,58 +1,57 @@
-import sys
-import pyaudio
 import numpy as np
 import time
 import signal
-from espnet_model_zoo.downloader import ModelDownloader
-from espnet2.bin.asr_inference_streaming import Speech2TextStreaming
+import audio_source
+from summary_worker import SummaryWorker
+from chunked_summary import ChunkedSummarizer
+from transcript import TranscriptState
+from vad import EnergyVAD, Endpointer
+import asr_config
+import chunking
+import instrumentation
+from audio_io import PCMConverter
+from renderer import TranscriptRenderer
 from transformers import pipeline
 
 # マイク入力のパラメータ設定
-CHUNK = 2048          # 一度に読み込むサンプル数
-FORMAT = pyaudio.paInt16  # 16ビット整数で音声を取得
+CHUNK = 2048          # PyAudio のコールバック1回あたりのサンプル数（デコードのチャンク長はモデルから決める）
 CHANNELS = 1          # モノラル入力
 RATE = 16000         # サンプリングレート
+USE_VAD = True       # 無音のチャンクをデコードせずに読み飛ばすかどうか
+MAX_CHUNKS = 4       # 推論が遅れている場合に1回でまとめて読み出すチャンク数の上限
 
 # ASRモデルのタグ
 tag = 'eml914/streaming_conformer_asr_csj'
 # 要約する間隔（秒）
 SUMMARY_INTERVAL = 30  # 30秒ごとに要約
+# 要約待ちのテキストの最大件数（超えた分は結合して1回の要約にまとめる）
+SUMMARY_MAX_PENDING = 1
 # 要約の最大長と最小長
 MAX_SUMMARY_LENGTH = 100
 MIN_SUMMARY_LENGTH = 30
+# 要約モデルに一度に渡すウィンドウの数
+SUMMARY_BATCH_SIZE = 4
 
 # モデルのセットアップ
 print("ASRモデルをロード中...")
-d = ModelDownloader()
-speech2text = Speech2TextStreaming(
-    **d.download_and_unpack(tag),
-    token_type=None,
-    bpemodel=None,
-    maxlenratio=0.0,
-    minlenratio=0.0,
-    beam_size=20,
-    ctc_weight=0.5,
-    lm_weight=0.0,
-    penalty=0.0,
-    nbest=1,
-    device="cuda",
-    disable_repetition_detection=True,
-    decoder_text_length_limit=0,
-    encoded_feat_length_limit=0
-)
+# デバイス・スレッド数・int8 量子化は環境変数 ASR_DEVICE などで指定する（asr_config.py を参照）
+speech2text = asr_config.load_speech2text(tag=tag)
+# 段階ごとの時間を記録する（出力先は環境変数 ASR_METRICS_PORT などで指定する。instrumentation.py を参照）
+speech2text = instrumentation.instrument_speech2text(speech2text)
 
 # 要約モデルのセットアップ
 print("要約モデルをロード中...")
 try:
     # より小さいモデルを使用
     summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-6-6")
+    # 長い文字起こしはモデルの入力長に収まるウィンドウに分けて要約し、要約どうしをさらに要約する
+    chunked_summarizer = ChunkedSummarizer(summarizer, max_length=MAX_SUMMARY_LENGTH,
+                                           min_length=MIN_SUMMARY_LENGTH, batch_size=SUMMARY_BATCH_SIZE)
     print("要約モデルのロードが完了しました")
 except Exception as e:
     print(f"要約モデルのロード中にエラーが発生しました: {e}")
     raise
 
-# 出力用の変数
-prev_lines = 0
 # 要約用のバッファ
 transcript_buffer = ""
 # 最後に要約した時間
@@ -68,54 +67,22 @@ def signal_handler(sig, frame):
     print("\n\n音声認識を終了します...")
     running = False
 
-def progress_output(text, is_summary=False):
+def summary_units(transcript):
     """
-    推論中の進捗を表示する
-    ・50文字ごとに改行を挿入
-    ・進捗を表示するために、前の行を上書きする
+    要約に渡す文字起こし（確定した発話ごとのテキストと、現在の発話の途中結果）
     """
-    global prev_lines
-
-    # 要約の場合は特別な表示
-    if is_summary:
-        sys.stderr.write("\n\n=== 要約 ===\n")
-        lines = ['']
-        for i in text:
-            if len(lines[-1]) > 50:
-                lines.append('')
-            lines[-1] += i
-        for line in lines:
-            sys.stderr.write(line + "\n")
-        sys.stderr.write("===========\n\n")
-        sys.stderr.flush()
-        return
-
-    # 通常の文字起こし表示
-    lines = ['']
-    for i in text:
-        if len(lines[-1]) > 50:
-            lines.append('')
-        lines[-1] += i
-    for i, line in enumerate(lines):
-        if i == prev_lines:
-            sys.stderr.write('\n\r')
-        else:
-            sys.stderr.write('\r\033[B\033[K')
-        sys.stderr.write(line)
-
-    prev_lines = len(lines)
-    sys.stderr.flush()
-
-def summarize_text(text):
+    return [segment.text for segment in transcript.segments] + [transcript.partial]
+
+def summarize_text(units):
     """
-    テキストを要約する
+    文字起こし全体を要約する
+    ・units は発話ごとのテキストのリスト（前回までに要約したウィンドウはキャッシュから使う）
     """
-    if len(text.strip()) < 50:  # テキストが短すぎる場合は要約しない
+    if len("".join(units).strip()) < 50:  # テキストが短すぎる場合は要約しない
         return "テキストが短すぎるため、要約できません。"
 
     try:
-        summary = summarizer(text, max_length=MAX_SUMMARY_LENGTH, min_length=MIN_SUMMARY_LENGTH, do_sample=False)
-        return summary[0]['summary_text']
+        return chunked_summarizer.summarize(units)
     except Exception as e:
         print(f"要約中にエラーが発生しました: {e}")
         return "要約中にエラーが発生しました。"
@@ -127,77 +94,140 @@ def main():
     global transcript_buffer, last_summary_time, current_summary, running
 
     print("マイク入力からのリアルタイム音声認識と要約を準備中...")
+    # 計測値の出力とプロファイラ（プロファイラはこのスレッドの推論ループを記録する）
+    instrumentation.setup()
 
     # Ctrl+Cのシグナルハンドラを設定
     signal.signal(signal.SIGINT, signal_handler)
 
-    # PyAudioの初期化
+    # マイク入力の初期化（PyAudioのコールバックでリングバッファに取り込む）
+    # 環境変数 ASR_SOURCE で WAV の実時間再生・標準入力・合成音声などに差し替えられる（audio_source.py を参照）
     try:
-        p = pyaudio.PyAudio()
-        stream = p.open(format=FORMAT, channels=CHANNELS, rate=RATE, input=True, frames_per_buffer=CHUNK)
+        capture = audio_source.open_source(rate=RATE, channels=CHANNELS, frames_per_buffer=CHUNK)
+        capture.start()
         print("マイク入力の準備が完了しました")
     except Exception as e:
         print(f"マイク入力の初期化中にエラーが発生しました: {e}")
         raise
 
+    # 読み出し用の int16 バッファと float32 への変換バッファはループの外で一度だけ確保する
+    # デコードのチャンク長はエンコーダのブロック設定から決める（環境変数 ASR_CHUNK=adaptive で自動調整）
+    chunker = chunking.make_chunker(speech2text, rate=RATE)
+    print(chunking.describe(speech2text, RATE))
+    pcm_buffer = np.empty(chunker.max_chunk * MAX_CHUNKS, dtype=np.int16)
+    converter = instrumentation.wrap_method(PCMConverter(chunker.max_chunk * MAX_CHUNKS), 'convert', 'normalize')
+
+    # 要約は別スレッドで実行し、音声認識のループを止めない
+    # 要約は毎回文字起こし全体に対して行うため、追いつかない場合は最新のものだけを要約する
+    summary_worker = SummaryWorker(instrumentation.wrap(summarize_text, 'summarize'),
+                                   max_pending=SUMMARY_MAX_PENDING, latest_only=True)
+    # 文字起こしの状態（途中結果の重複を除き、確定した部分だけを要約に渡す）
+    transcript = TranscriptState()
+    # 処理した音声の長さ（秒）
+    audio_time = 0.0
+    # 無音区間を読み飛ばすための VAD（発話の終わりでデコーダをリセットする）
+    # 話し続けても発話の長さは ASR_MAX_UTTERANCE 秒程度で区切り、デコーダの状態が伸び続けないようにする
+    # VAD を使わない場合も Endpointer で発話を区切る（長時間の会議でも遅延とメモリを一定に保つ）
+    vad = EnergyVAD(rate=RATE) if USE_VAD else Endpointer(rate=RATE)
+    # 途中結果は変わった部分だけを書き直して表示する（環境変数 ASR_RENDER_FPS / ASR_QUIET で調整）
+    renderer = TranscriptRenderer()
+    instrumentation.wrap_method(renderer, 'update', 'render')
+    instrumentation.wrap_method(renderer, 'commit', 'render')
+
     print("\nリアルタイム音声認識と要約を開始します。話してください...")
     print("終了するには Ctrl+C を押してください")
     print("=" * 50)
 
     try:
-        while running:
-            # マイクからの音声データを取得
-            data = stream.read(CHUNK, exception_on_overflow=False)
-            data = np.frombuffer(data, dtype='int16')
-            # 32767は16ビットのバイナリ数の上限値であり、intをfloatに変換するための正規化に使用される
-            data = data.astype(np.float16) / 32767.0
+        # マイク以外の入力は終わりに達したら止める
+        while running and not capture.exhausted:
+            # マイクからの音声データを取得（推論が遅れている場合は溜まった分をまとめて受け取る）
+            with instrumentation.stage('capture_wait'):
+                data = capture.read(chunker.chunk, max_chunks=MAX_CHUNKS, out=pcm_buffer)
+            if data is None:
+                continue
+            instrumentation.count('chunks')
+            instrumentation.gauge('capture_backlog_samples', len(capture.ring))
+            # int16 を事前確保した float32 のバッファに変換する（[-1.0, 1.0) に正規化）
+            data = converter.convert(data)
 
             # ASR処理
-            results = speech2text(speech=data, is_final=False)
-            if results is not None and len(results) > 0:
-                nbests = [text for text, token, token_int, hyp in results]
-                text = nbests[0] if nbests is not None and len(nbests) > 0 else ""
-                progress_output(text)
-
-                # 文字起こし結果をバッファに追加
-                transcript_buffer += text
-            else:
-                progress_output("")
-
-            # 一定間隔で要約
+            start = time.perf_counter()
+            nsamples = len(data)
+            audio_time += nsamples / RATE
+            # 無音のチャンクはデコードしない。発話の終わりでは is_final=True でデコーダをリセットする
+            with instrumentation.stage('vad'):
+                data, is_final = vad.gate(data)
+            if data is not None:
+                decode_start = time.perf_counter()
+                with instrumentation.stage('decode'):
+                    results = speech2text(speech=data, is_final=is_final)
+                # 遅延と RTF を記録し、デコードが遅れていればチャンクを大きくする（adaptive の場合）
+                chunker.record(nsamples, time.perf_counter() - decode_start, backlog=len(capture.ring))
+                text = ""
+                if results is not None and len(results) > 0:
+                    nbests = [text for text, token, token_int, hyp in results]
+                    text = nbests[0] if nbests is not None and len(nbests) > 0 else ""
+                    renderer.update(text)
+
+                # 途中結果は発話の先頭からの仮説全体なので、新しく確定した部分だけをバッファに追加する
+                if is_final:
+                    transcript.finalize(text, audio_time)
+                    # 確定した発話は残して、次の発話は新しい行に表示する
+                    renderer.commit()
+                else:
+                    transcript.update(text, audio_time)
+                transcript_buffer += transcript.take_new()
+            capture.record_inference(nsamples, time.perf_counter() - start)
+
+            # 一定間隔で要約（バックグラウンドのワーカーに渡すだけで待たない）
             if time.time() - last_summary_time > SUMMARY_INTERVAL:
+                # 前回の要約以降に確定したテキストがあれば、文字起こし全体を要約し直す
                 if transcript_buffer.strip():
-                    print("\n\n要約中...")
-                    current_summary = summarize_text(transcript_buffer)
-                    progress_output(current_summary, is_summary=True)
+                    summary_worker.submit(summary_units(transcript))
                     last_summary_time = time.time()
-
-                    # バッファをクリアするか、一部を保持するかの選択
-                    # ここでは簡単のためにクリア
                     transcript_buffer = ""
 
-        # 最終結果を取得
-        results = speech2text(speech=np.array([], dtype=np.float16), is_final=True)
+            # 完了した要約があれば表示
+            for current_summary in summary_worker.poll():
+                renderer.print_block("要約", current_summary)
+
+        # 最終結果を取得（発話の途中で終了した場合のみ）
+        results = None
+        if vad.in_speech:
+            results = speech2text(speech=np.zeros(0, dtype=np.float32), is_final=True)
         if results is not None and len(results) > 0:
             nbests = [text for text, token, token_int, hyp in results]
             text = nbests[0] if nbests is not None and len(nbests) > 0 else ""
-            progress_output(text)
-            transcript_buffer += text
+            renderer.update(text, force=True)
+            transcript.finalize(text, audio_time)
+            transcript_buffer += transcript.take_new()
+
+        renderer.commit()
 
-        # 最終的な要約
+        # 最終的な要約（未処理の要約がすべて終わるまで待つ）
         if transcript_buffer.strip():
             print("\n\n最終要約を生成中...")
-            final_summary = summarize_text(transcript_buffer)
-            progress_output(final_summary, is_summary=True)
+            summary_worker.submit(summary_units(transcript))
+        summary_worker.close(wait=True)
+        for current_summary in summary_worker.poll():
+            renderer.print_block("要約", current_summary)
 
     except KeyboardInterrupt:
         print("\n\n音声認識を終了します...")
 
     finally:
         # リソースの解放
-        stream.stop_stream()
-        stream.close()
-        p.terminate()
+        renderer.close()
+        capture.close()
+        summary_worker.close(wait=False)
+        print("\n" + capture.report())
+        print(renderer.report())
+        print(chunker.report())
+        print(summary_worker.report())
+        print(chunked_summarizer.report())
+        print(vad.report())
+        print(instrumentation.report())
         print("\n音声認識と要約を終了しました")
 
 if __name__ == "__main__":
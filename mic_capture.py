@@ -0,0 +1,253 @@
+"""
+マイク入力の取り込みを推論から切り離すためのモジュール
+
+PyAudio のコールバック（PortAudio のスレッド）が事前確保したリングバッファに書き込み、
+推論側のループはそこからモデルに適したチャンク単位で読み出す。
+推論が 1 チャンク分の時間より遅れても、バッファに余裕がある間は音声が失われない。
+
+リングバッファへの書き込みと読み出し・統計は BufferedCapture にまとめてあり、マイク以外の
+入力（audio_source の WAV の再生・標準入力・合成音声など）も同じ read() で読み出せる。
+PyAudio はマイクを使う場合だけ読み込むため、マイクのない環境でもほかの入力は使える。
+"""
+import time
+import threading
+import numpy as np
+
+
+class RingBuffer:
+    """
+    単一プロデューサ・単一コンシューマ用のロックフリーなリングバッファ
+    ・書き込み位置と読み出し位置は単調増加の整数で、それぞれ片側のスレッドだけが更新する
+    ・満杯のときは新しいデータを捨て、捨てたサンプル数を数える
+    """
+
+    def __init__(self, capacity, dtype=np.int16):
+        self.capacity = capacity
+        self.buf = np.zeros(capacity, dtype=dtype)
+        self._write = 0
+        self._read = 0
+        self.dropped = 0
+        self.high_water = 0
+
+    def __len__(self):
+        """読み出し可能なサンプル数"""
+        return self._write - self._read
+
+    def write(self, data):
+        """
+        データを書き込み、書き込めたサンプル数を返す（プロデューサ側から呼ぶ）
+        """
+        n = len(data)
+        free = self.capacity - (self._write - self._read)
+        if n > free:
+            self.dropped += n - free
+            n = free
+        start = self._write % self.capacity
+        first = min(n, self.capacity - start)
+        self.buf[start:start + first] = data[:first]
+        self.buf[:n - first] = data[first:n]
+        # データのコピーが終わってから書き込み位置を公開する
+        self._write += n
+        level = self._write - self._read
+        if level > self.high_water:
+            self.high_water = level
+        return n
+
+    def read(self, n, out=None):
+        """
+        n サンプルを読み出す（コンシューマ側から呼ぶ）
+        ・n サンプルに満たない場合は None を返す
+        ・out を渡すとそこに書き込み、新しい配列を確保しない
+        """
+        if self._write - self._read < n:
+            return None
+        if out is None:
+            out = np.empty(n, dtype=self.buf.dtype)
+        start = self._read % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buf[start:start + first]
+        out[first:n] = self.buf[:n - first]
+        self._read += n
+        return out[:n]
+
+
+class BufferedCapture:
+    """
+    別スレッドから届く 16 ビット PCM をリングバッファに溜め、推論のループから読み出す入力の共通部分
+    ・入力のスレッドは push() で書き込み、終わりに達したら finish() を呼ぶ
+    ・read() はバッファに chunk サンプル以上たまるまで待ち、溜まっている分を chunk の倍数でまとめて返す
+    ・取りこぼし、バッファの最大使用量、実時間比（RTF）を数える
+    ・サブクラスは start() と close() で入力を開始・停止する
+    """
+    name = 'capture'
+
+    def __init__(self, rate=16000, channels=1, buffer_seconds=30):
+        self.rate = rate
+        self.channels = channels
+        self.ring = RingBuffer(int(rate * buffer_seconds) * channels)
+        self._ready = threading.Event()
+        self.finished = False
+        # 統計情報
+        self.frames_captured = 0
+        self.overflows = 0
+        self.audio_seconds = 0.0
+        self.compute_seconds = 0.0
+        self.max_chunk_rtf = 0.0
+
+    def push(self, pcm):
+        """int16 の PCM を書き込む（入力のスレッドから呼ぶ。ここでは重い処理をしない）"""
+        self.ring.write(pcm)
+        self.frames_captured += len(pcm) // self.channels
+        self._ready.set()
+
+    def finish(self):
+        """入力の終わりに達したことを知らせる（残りのデータは read() で読み出せる）"""
+        self.finished = True
+        self._ready.set()
+
+    @property
+    def exhausted(self):
+        """入力が終わり、バッファも空になったかどうか（マイク入力は終わらない）"""
+        return self.finished and len(self.ring) == 0
+
+    def start(self):
+        """入力を開始する"""
+        return self
+
+    def describe(self):
+        """入力の説明（表示用）"""
+        return self.name
+
+    def read(self, chunk, max_chunks=4, timeout=0.5, out=None):
+        """
+        chunk サンプル以上たまるまで待って読み出す
+        ・推論が遅れてデータがたまっている場合は最大 max_chunks 個分をまとめて返す
+        ・timeout 秒待っても足りなければ None を返す
+        ・入力が終わっている場合は chunk に満たない残りも返す
+        ・out（chunk * max_chunks 以上の int16 配列）を渡すとそこに書き込み、新しい配列を確保しない
+        """
+        deadline = time.monotonic() + timeout
+        while len(self.ring) < chunk:
+            if self.finished:
+                return self.ring.read(len(self.ring), out) if len(self.ring) else None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self._ready.clear()
+            # clear() と待機の間に書き込まれた場合を取りこぼさないよう再確認する
+            if len(self.ring) >= chunk:
+                break
+            self._ready.wait(remaining)
+        n = min(len(self.ring) // chunk, max_chunks) * chunk
+        return self.ring.read(n, out)
+
+    def record_inference(self, nsamples, elapsed):
+        """推論にかかった時間を記録する"""
+        audio = nsamples / (self.rate * self.channels)
+        self.audio_seconds += audio
+        self.compute_seconds += elapsed
+        if audio > 0:
+            self.max_chunk_rtf = max(self.max_chunk_rtf, elapsed / audio)
+
+    def stats(self):
+        """統計情報を辞書で返す"""
+        return {
+            'frames_captured': self.frames_captured,
+            'frames_dropped': self.ring.dropped,
+            'input_overflows': self.overflows,
+            'buffer_high_water': self.ring.high_water,
+            'buffer_capacity': self.ring.capacity,
+            'rtf': self.compute_seconds / self.audio_seconds if self.audio_seconds else 0.0,
+            'max_chunk_rtf': self.max_chunk_rtf,
+        }
+
+    def report(self):
+        """統計情報を表示用の文字列にする"""
+        s = self.stats()
+        return (f"取り込み: {s['frames_captured']}フレーム, 取りこぼし: {s['frames_dropped']}フレーム"
+                f" (入力オーバーフロー {s['input_overflows']}回),"
+                f" バッファ最大使用量: {s['buffer_high_water']}/{s['buffer_capacity']},"
+                f" RTF: {s['rtf']:.3f} (最大 {s['max_chunk_rtf']:.3f})")
+
+    def close(self):
+        """入力を停止してリソースを解放する"""
+
+
+class MicCapture(BufferedCapture):
+    """
+    PyAudio のコールバックモードでマイク入力をリングバッファに取り込む
+    """
+    name = 'mic'
+
+    def __init__(self, rate=16000, channels=1, frames_per_buffer=2048, buffer_seconds=30,
+                 input_device_index=None):
+        super().__init__(rate, channels, buffer_seconds)
+        self.frames_per_buffer = frames_per_buffer
+        self.input_device_index = input_device_index
+        self._pa = None
+        self._stream = None
+
+    def describe(self):
+        device = self.input_device_index if self.input_device_index is not None else "既定"
+        return f"マイク (デバイス {device}, {self.rate}Hz, {self.channels}チャンネル)"
+
+    def _callback(self, in_data, frame_count, time_info, status_flags):
+        """PortAudio のスレッドから呼ばれる（ここでは重い処理をしない）"""
+        import pyaudio
+        if status_flags & pyaudio.paInputOverflow:
+            self.overflows += 1
+        self.push(np.frombuffer(in_data, dtype=np.int16))
+        return (None, pyaudio.paContinue)
+
+    def start(self):
+        """マイク入力を開始する"""
+        import pyaudio
+        self._pa = pyaudio.PyAudio()
+        self._stream = self._pa.open(format=pyaudio.paInt16, channels=self.channels, rate=self.rate,
+                                     input=True, frames_per_buffer=self.frames_per_buffer,
+                                     input_device_index=self.input_device_index,
+                                     stream_callback=self._callback)
+        self._stream.start_stream()
+        return self
+
+    def close(self):
+        """マイク入力を停止してリソースを解放する"""
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        if self._pa is not None:
+            self._pa.terminate()
+            self._pa = None
+
+
+def input_devices(rate=16000, channels=1):
+    """
+    入力に使えるデバイスの一覧（辞書のリスト）
+    ・native: rate・channels・16 ビットの入力にデバイスがそのまま対応しているかどうか
+      （対応していれば、PortAudio やこちら側でリサンプリングせずに取り込める）
+    """
+    import pyaudio
+    pa = pyaudio.PyAudio()
+    try:
+        devices = []
+        for index in range(pa.get_device_count()):
+            info = pa.get_device_info_by_index(index)
+            if info.get('maxInputChannels', 0) < 1:
+                continue
+            try:
+                native = bool(pa.is_format_supported(rate, input_device=index, input_channels=channels,
+                                                     input_format=pyaudio.paInt16))
+            except ValueError:
+                native = False
+            devices.append({
+                'index': index,
+                'name': info.get('name'),
+                'host_api': pa.get_host_api_info_by_index(info['hostApi']).get('name'),
+                'max_input_channels': info.get('maxInputChannels'),
+                'default_sample_rate': info.get('defaultSampleRate'),
+                'native': native,
+            })
+        return devices
+    finally:
+        pa.terminate()
@@ -0,0 +1,128 @@
+"""
+ASR モデルのローカルキャッシュ
+
+ModelDownloader().download_and_unpack(tag) によるモデルの解決と、設定ファイルからのネットワーク構築を
+毎回行う代わりに、構築済みの Speech2TextStreaming（トークナイザを含む）を torch.save で保存しておき、
+次回からは torch.load(mmap=True) で読み込む。重みはメモリマップされ、実際に使われる時に読み込まれる。
+
+・キャッシュのキーはタグ・構築オプション・espnet と torch のバージョンから作る
+・解決済みのモデルファイルのパスも保存するため、一度キャッシュすればオフラインで動作する
+・キャッシュの場所は環境変数 ASR_MODEL_CACHE（既定: ~/.cache/asr-espnet）
+・環境変数 ASR_OFFLINE=1 の場合はネットワークに接続せず、キャッシュがなければエラーにする
+"""
+import os
+import json
+import time
+import hashlib
+import torch
+
+CACHE_DIR = os.environ.get('ASR_MODEL_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'asr-espnet'))
+OFFLINE = os.environ.get('ASR_OFFLINE', '') not in ('', '0')
+
+
+def _versions():
+    import espnet
+    return {'espnet': getattr(espnet, '__version__', ''), 'torch': torch.__version__}
+
+
+def _digest(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def cache_path(tag, options, cache_dir=CACHE_DIR):
+    """タグと構築オプションに対応するキャッシュファイルのパス"""
+    key = _digest({'tag': tag, 'options': options, 'versions': _versions()})
+    return os.path.join(cache_dir, 'models', f"{key}.pt")
+
+
+def resolve_model_files(tag, cache_dir=CACHE_DIR, offline=OFFLINE):
+    """
+    モデルファイルのパスを解決する
+    ・一度解決したパスは保存しておき、ファイルが残っていればネットワークに接続しない
+    """
+    manifest = os.path.join(cache_dir, 'resolved', f"{_digest(tag)}.json")
+    if os.path.exists(manifest):
+        with open(manifest, encoding='utf-8') as f:
+            files = json.load(f)
+        if all(not isinstance(v, str) or os.path.exists(v) for v in files.values()):
+            return files
+    if offline:
+        raise FileNotFoundError(f"オフラインモードですが、モデル '{tag}' がキャッシュにありません")
+
+    from espnet_model_zoo.downloader import ModelDownloader
+    files = ModelDownloader().download_and_unpack(tag)
+    os.makedirs(os.path.dirname(manifest), exist_ok=True)
+    tmp = manifest + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(files, f, ensure_ascii=False)
+    os.replace(tmp, manifest)
+    return files
+
+
+def _save(obj, path):
+    """一時ファイルに保存してから置き換える（途中で落ちても壊れたキャッシュを残さない）"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        torch.save(obj, tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def load_speech2text(tag, cache_dir=CACHE_DIR, use_cache=True, offline=OFFLINE, **options):
+    """
+    Speech2TextStreaming をキャッシュから読み込む（なければ構築してキャッシュに保存する）
+    ・(speech2text, 各フェーズの所要時間[秒]の辞書) を返す
+    ・options は Speech2TextStreaming のモデルファイル以外の引数
+    """
+    timings = {}
+    path = cache_path(tag, options, cache_dir)
+    if use_cache and os.path.exists(path):
+        start = time.perf_counter()
+        try:
+            speech2text = torch.load(path, map_location=options.get('device', 'cpu'),
+                                     mmap=True, weights_only=False)
+            timings['load_cache'] = time.perf_counter() - start
+            return speech2text, timings
+        except Exception as e:
+            print(f"モデルキャッシュの読み込みに失敗したため再構築します: {e}")
+
+    from espnet2.bin.asr_inference_streaming import Speech2TextStreaming
+
+    start = time.perf_counter()
+    files = resolve_model_files(tag, cache_dir, offline)
+    timings['resolve'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    speech2text = Speech2TextStreaming(**files, **options)
+    timings['build'] = time.perf_counter() - start
+
+    if use_cache:
+        start = time.perf_counter()
+        try:
+            _save(speech2text, path)
+            timings['save_cache'] = time.perf_counter() - start
+        except Exception as e:
+            print(f"モデルをキャッシュに保存できませんでした: {e}")
+    return speech2text, timings
+
+
+def ensure_cached(tag, cache_dir=CACHE_DIR, offline=OFFLINE, **options):
+    """
+    キャッシュがなければ構築して保存する（ワーカーを起動する前に親プロセスで呼ぶ）
+    ・各フェーズの所要時間の辞書を返す
+    """
+    if os.path.exists(cache_path(tag, options, cache_dir)):
+        return {}
+    _, timings = load_speech2text(tag, cache_dir=cache_dir, offline=offline, **options)
+    return timings
+
+
+def format_timings(timings):
+    """所要時間の辞書を表示用の文字列にする"""
+    names = {'load_cache': "キャッシュ読み込み", 'resolve': "モデル解決", 'build': "構築", 'save_cache': "キャッシュ保存",
+             'quantize': "int8 量子化"}
+    parts = [f"{names.get(k, k)} {v:.2f}秒" for k, v in timings.items()]
+    return f"{', '.join(parts)} (合計 {sum(timings.values()):.2f}秒)"
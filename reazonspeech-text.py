@@ -1,13 +1,300 @@
+"""
+ReazonSpeech（k2）で多数の音声ファイルを文字起こしする常駐ワーカー
+
+モデルは起動時に一度だけ読み込み、入力されたファイルを順に処理する。ReazonSpeech の k2 モデルは
+30 秒程度までの音声を想定しているため、長いファイルは無音の位置で約 --window-seconds 秒
+（最大でその 1.5 倍）のウィンドウに分け（segmenter.split_at_silence）、複数ファイルの
+ウィンドウをまとめて --batch-size 件ずつバッチで認識する。
+
+認識は asr_backend.K2Backend を使う（asr-transcribe.py --engine k2 と同じモデルの扱い）。
+結果は1ファイル1行の JSONL（ウィンドウごとのタイムスタンプ付き）で、入力の順に出力する。
+-o を指定するとそのファイルに追記し、処理済みのファイルは再実行時に読み飛ばす。
+省略時は標準出力に書き、進捗とスループット（ファイル数/分・RTF）は標準エラー出力に表示する。
+
+入力は次のいずれか。
+・引数: 音声ファイル、ディレクトリ、glob パターン、マニフェスト(.txt/.list/.scp)
+・標準入力: 引数を省略するか '-' を指定すると、1行に1パスずつ届いた順に処理する
+  （届いたファイルはバッチがそろうのを待たずに認識し、すぐに結果を出力する）
+
+使い方:
+    python reazonspeech-text.py audio.wav
+    python reazonspeech-text.py corpus/ manifest.txt -o results.jsonl --batch-size 16
+    find corpus -name '*.wav' | python reazonspeech-text.py - > results.jsonl
+"""
+import os
 import sys
-from reazonspeech.k2.asr import load_model, transcribe, audio_from_path
+import json
+import time
+import argparse
+from collections import deque, namedtuple
+import numpy as np
+from reazonspeech.k2.asr import audio_from_path
+import audio_io
+import instrumentation
+import result_cache
+from asr_backend import K2Backend, K2_PRECISION, K2_WINDOW_SECONDS, K2_BATCH_SIZE
+from file_inputs import collect_inputs, load_finished, open_output, iter_stdin_paths
+from resampler import StreamingResampler, TARGET_SAMPLE_RATE
+from segmenter import split_at_silence
+from transcript import format_time
+
+# GPUで推論したい場合は環境変数 ASR_DEVICE=cuda（または --device cuda）と指定ください
+DEVICE = os.environ.get('ASR_DEVICE', 'cpu')
+# ディレクトリを指定した場合に列挙する音声ファイル
+AUDIO_PATTERNS = ('*.wav', '*.flac', '*.mp3', '*.ogg', '*.m4a')
+# 結果のキャッシュのキーに使うモデル名
+CACHE_MODEL = 'reazonspeech-k2'
+
+# 認識待ちのウィンドウ（start / end はファイル先頭からの秒数）
+Window = namedtuple('Window', ['job', 'index', 'start', 'end', 'speech'])
+
+
+def log(message):
+    """進捗を標準エラー出力に表示する（標準出力は JSONL の結果に使う）"""
+    print(message, file=sys.stderr, flush=True)
+
+
+def open_audio(path):
+    """
+    音声ファイルを開く
+    ・16ビット PCM の WAV はメモリマップで開き、ウィンドウの分だけ読み込む
+    ・それ以外の形式は ReazonSpeech の audio_from_path で全体を読み込む
+    """
+    if path.lower().endswith('.wav'):
+        try:
+            return audio_io.open_wav(path)
+        except ValueError:
+            pass
+    audio = audio_from_path(path)
+    return audio_io.ArrayWav(audio.waveform, audio.samplerate, path)
+
+
+def model_input(speech, rate):
+    """ウィンドウの音声を 16kHz・モノラルにする"""
+    resampler = StreamingResampler(rate, TARGET_SAMPLE_RATE)
+    return np.concatenate([resampler.process(speech), resampler.flush()])
+
+
+class FileJob:
+    """
+    1ファイル分の処理状態（すべてのウィンドウの結果がそろったら出力できる）
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.start = time.time()
+        self.duration = 0.0
+        self.windows = None
+        self.segments = {}
+        self.error = None
+        # 結果のキャッシュのキーと、キャッシュにあった結果
+        self.key = None
+        self.cached = None
+
+    @property
+    def done(self):
+        return (self.error is not None or self.cached is not None
+                or (self.windows is not None and len(self.segments) == self.windows))
+
+    def record(self):
+        """出力する JSONL の1行分"""
+        elapsed = time.time() - self.start
+        if self.error is not None:
+            return {'file': self.path, 'error': self.error, 'elapsed': round(elapsed, 3)}
+        if self.cached is not None:
+            return {'file': self.path, **self.cached, 'elapsed': round(elapsed, 3), 'rtf': 0.0, 'cached': True}
+        segments = [self.segments[i] for i in range(self.windows) if self.segments[i] is not None]
+        return {
+            'file': self.path,
+            'text': "".join(segment['text'] for segment in segments),
+            'duration': round(self.duration, 3),
+            'elapsed': round(elapsed, 3),
+            'rtf': round(elapsed / self.duration, 4) if self.duration > 0 else None,
+            'windows': self.windows,
+            'segments': segments,
+        }
+
+
+class K2Worker:
+    """
+    読み込み済みの K2Backend でファイルをウィンドウ単位にバッチ認識する
+    ・submit() で受け取ったファイルのウィンドウを溜め、バッチの件数だけたまるごとに認識する
+    ・結果は入力の順に out（JSONL）へ書き出す。前のファイルが終わるまで後のファイルは待たせる
+    ・cache（result_cache.ResultCache）に同じ内容の音声の結果があれば、ウィンドウに分けずにそれを使う
+    """
+
+    def __init__(self, backend, out, cache=None):
+        self.backend = backend
+        self.out = out
+        self.cache = cache or result_cache.ResultCache(None)
+        self.cache_options = {'precision': backend.precision, 'window_seconds': backend.window_seconds}
+        self.batch_size = backend.batch_size
+        self.window_seconds = backend.window_seconds
+        self.pending = []
+        self.jobs = deque()
+        # 統計情報
+        self.started = time.time()
+        self.files = 0
+        self.errors = 0
+        self.cached_files = 0
+        self.audio_seconds = 0.0
+        self.decode_seconds = 0.0
+        self.batches = 0
+        self.decoded_windows = 0
+
+    def submit(self, path):
+        """ファイルをウィンドウに分けて認識待ちに加える（バッチがそろえば認識する）"""
+        job = FileJob(path)
+        self.jobs.append(job)
+        try:
+            with instrumentation.stage('read'):
+                wav = open_audio(path)
+            with wav:
+                job.duration = wav.duration
+                if self.cache.enabled:
+                    with instrumentation.stage('hash'):
+                        job.key = self.cache.key(wav, CACHE_MODEL, self.cache_options)
+                    job.cached = self.cache.get(job.key)
+                    if job.cached is not None:
+                        job.windows = job.cached['windows']
+                        self.emit()
+                        return
+                spans = split_at_silence(wav, self.window_seconds)
+                for index, span in enumerate(spans):
+                    with instrumentation.stage('resample'):
+                        speech = model_input(wav.read(span.start, span.end), wav.rate)
+                    self.pending.append(Window(job, index, span.start / wav.rate, span.end / wav.rate, speech))
+                    if len(self.pending) >= self.batch_size:
+                        self.run_batch()
+                job.windows = len(spans)
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+        self.emit()
+
+    def run_batch(self):
+        """溜まっているウィンドウをまとめて認識する"""
+        # 失敗したファイルの残りのウィンドウは認識しない
+        batch = [window for window in self.pending if window.job.error is None]
+        self.pending = []
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            with instrumentation.stage('decode'):
+                results = self.backend.decode_windows([window.speech for window in batch])
+        except Exception as e:
+            # バッチに含まれるファイルはすべて失敗とし、書き出しが止まらないようにする
+            error = f"{type(e).__name__}: {e}"
+            for window in batch:
+                window.job.error = error
+            self.emit()
+            return
+        self.decode_seconds += time.perf_counter() - start
+        self.batches += 1
+        self.decoded_windows += len(batch)
+        instrumentation.count('windows', len(batch))
+
+        for window, (text, first) in zip(batch, results):
+            segment = None
+            if text:
+                # 最初のトークンの時刻を発話の開始とする
+                segment = {
+                    'start': round(min(window.start + (first or 0.0), window.end), 3),
+                    'end': round(window.end, 3),
+                    'text': text,
+                }
+            window.job.segments[window.index] = segment
+        self.emit()
+
+    def flush(self):
+        """溜まっているウィンドウをすべて認識し、終わったファイルの結果を書き出す"""
+        self.run_batch()
+        self.emit()
+
+    def emit(self):
+        """先頭から順に、結果がそろったファイルを書き出す"""
+        while self.jobs and self.jobs[0].done:
+            job = self.jobs.popleft()
+            record = job.record()
+            self.out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.out.flush()
+            self.files += 1
+            if 'error' in record:
+                self.errors += 1
+                log(f"[{self.files}] {job.path}: エラー {record['error']}")
+                continue
+            self.audio_seconds += job.duration
+            if job.cached is not None:
+                self.cached_files += 1
+            else:
+                self.cache.put(job.key, {key: record[key] for key in ('text', 'duration', 'windows', 'segments')})
+            log(f"[{self.files}] {job.path}: {format_time(job.duration)}, {job.windows}ウィンドウ,"
+                f" 経過時間 {record['elapsed']:.1f}秒{'（キャッシュ）' if job.cached is not None else ''}"
+                f" ({self.files_per_minute():.1f}ファイル/分)")
+
+    def files_per_minute(self):
+        elapsed = time.time() - self.started
+        return self.files / elapsed * 60 if elapsed > 0 else 0.0
+
+    def report(self):
+        """スループットを表示用の文字列にする"""
+        elapsed = time.time() - self.started
+        audio = self.audio_seconds
+        batch = self.decoded_windows / self.batches if self.batches else 0.0
+        return (f"処理したファイル: {self.files}件 (エラー {self.errors}件, キャッシュ {self.cached_files}件), 音声 {audio / 60:.1f}分,"
+                f" 経過時間 {elapsed:.1f}秒\n"
+                f"スループット: {self.files_per_minute():.1f}ファイル/分,"
+                f" RTF {elapsed / audio if audio else 0.0:.4f} (認識のみ {self.decode_seconds / audio if audio else 0.0:.4f}),"
+                f" バッチ {self.batches}回 (平均 {batch:.1f}ウィンドウ)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ReazonSpeech（k2）で音声ファイルを文字起こしする")
+    parser.add_argument('inputs', nargs='*',
+                        help="音声ファイル、ディレクトリ、globパターン、マニフェスト(.txt/.list/.scp)。"
+                             "省略または '-' で標準入力から1行に1パスずつ読む")
+    parser.add_argument('-o', '--output', help="結果を追記する JSONL ファイル（既定: 標準出力）")
+    parser.add_argument('--device', default=DEVICE, help=f"推論に使うデバイス（既定: {DEVICE}）")
+    parser.add_argument('--precision', default=K2_PRECISION, choices=('fp32', 'int8'), help="モデルの精度")
+    parser.add_argument('--batch-size', type=int, default=K2_BATCH_SIZE, help="1回のバッチで認識するウィンドウ数")
+    parser.add_argument('--window-seconds', type=float, default=K2_WINDOW_SECONDS,
+                        help="長いファイルを区切るウィンドウのおよその長さ（秒）")
+    instrumentation.add_arguments(parser)
+    result_cache.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.setup_from_args(args)
+
+    from_stdin = not args.inputs or args.inputs == ['-']
+    if from_stdin and sys.stdin.isatty():
+        parser.error("音声ファイルを指定するか、標準入力にパスを渡してください")
+    paths = iter_stdin_paths() if from_stdin else collect_inputs(args.inputs, AUDIO_PATTERNS)
 
-# GPUで推論したい場合は device='cuda' と指定ください
-model = load_model(device='cpu')
+    finished = load_finished(args.output) if args.output else set()
+    backend = K2Backend(device=args.device, precision=args.precision,
+                        window_seconds=args.window_seconds, batch_size=args.batch_size)
+    log(f"モデルのロード時間: {backend.load():.1f}秒, {backend.describe()}")
 
-# ローカルの音声ファイルを読み込む
-audio = audio_from_path(sys.argv[1])
+    out = open_output(args.output) if args.output else sys.stdout
+    cache = result_cache.from_args(args)
+    worker = K2Worker(backend, out, cache)
+    try:
+        for path in paths:
+            if path in finished:
+                continue
+            worker.submit(path)
+            if from_stdin:
+                # 次のパスがいつ届くか分からないため、バッチがそろうのを待たずに認識する
+                worker.flush()
+        worker.flush()
+    except KeyboardInterrupt:
+        log("\n中断しました（出力済みの結果は -o のファイルに残っています）")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        log(worker.report())
+        log(cache.report())
+        log(instrumentation.report())
 
-# 音声認識を適用する
-ret = transcribe(model, audio)
 
-print(ret.text)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
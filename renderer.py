@@ -0,0 +1,183 @@
+"""
+文字起こしの途中経過を端末に表示する差分レンダラ
+
+途中結果は発話の先頭からの仮説全体なので、毎回全文を描き直すと表示の処理量と端末への出力量が
+セッションの長さに比例して増えていく。TranscriptRenderer は前回表示したテキストとの共通部分を
+残し、変わった末尾だけを書き直す。描画の回数は fps で間引き、間引いたテキストは次の描画か
+確定（commit）のときにまとめて表示する。
+
+・環境変数 ASR_RENDER_FPS: 1秒あたりの最大描画回数（既定: 15。0 で間引かない）
+・環境変数 ASR_QUIET=1: 途中経過を表示しない（バッチ処理用）
+・出力先が端末でない場合はエスケープシーケンスを使わず、確定したテキストだけを1行ずつ書き出す
+"""
+import os
+import sys
+import time
+import shutil
+import unicodedata
+from bisect import bisect_right
+
+FPS = float(os.environ.get('ASR_RENDER_FPS', '15'))
+QUIET = os.environ.get('ASR_QUIET', '') not in ('', '0')
+# 1行の最大表示幅（全角50文字分）
+MAX_WIDTH = 100
+
+
+def char_width(ch):
+    """文字の表示幅（全角は 2）"""
+    return 2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1
+
+
+def wrap(text, width):
+    """表示幅 width ごとにテキストを行に分ける"""
+    lines = []
+    start = 0
+    col = 0
+    for i, ch in enumerate(text):
+        w = char_width(ch)
+        if col + w > width:
+            lines.append(text[start:i])
+            start = i
+            col = 0
+        col += w
+    lines.append(text[start:])
+    return lines
+
+
+def common_prefix_length(a, b):
+    """a と b の共通の接頭辞の長さ（比較は文字列のスライス単位で行う）"""
+    if b.startswith(a):
+        return len(a)
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class TranscriptRenderer:
+    """
+    発話ごとの途中結果を差分で書き直して表示する
+    ・update() で現在の仮説を渡し、発話が確定したら commit() で次の行に進む
+    ・print_block() は要約などのまとまったテキストを表示する（quiet でも表示する）
+    """
+
+    def __init__(self, stream=None, fps=FPS, quiet=QUIET, width=None):
+        self.stream = stream or sys.stderr
+        self.quiet = quiet
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.tty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self.width = width or max(20, min(shutil.get_terminal_size().columns - 1, MAX_WIDTH))
+        self._last_draw = 0.0
+        self._reset()
+        # 統計情報
+        self.draws = 0
+        self.skipped = 0
+        self.written = 0
+
+    def _reset(self):
+        self.text = ""
+        self._pending = None
+        # 表示中の各行の先頭の文字位置
+        self._rows = [0]
+        self._cursor_row = 0
+
+    def _write(self, s):
+        self.stream.write(s)
+        self.stream.flush()
+        self.written += len(s)
+
+    def update(self, text, force=False):
+        """現在の仮説を表示する（前回の描画から 1/fps 秒経っていなければ次回に回す）"""
+        if self.quiet:
+            return
+        text = text or ""
+        if not self.tty:
+            self._pending = text
+            return
+        now = time.monotonic()
+        if not force and now - self._last_draw < self.interval:
+            self._pending = text
+            self.skipped += 1
+            return
+        self._draw(text)
+        self._last_draw = now
+
+    def _draw(self, text):
+        self._pending = None
+        old = self.text
+        p = common_prefix_length(old, text)
+        if p == len(old) == len(text):
+            return
+        # 変わった位置の行まで戻り、そこから先を消して書き直す
+        row = bisect_right(self._rows, p) - 1
+        if row > 0 and self._rows[row] == p:
+            # 行の先頭で変わった場合は前の行の末尾から書く（空の行を残さない）
+            row -= 1
+        del self._rows[row + 1:]
+        col = sum(char_width(ch) for ch in text[self._rows[row]:p])
+        out = []
+        if self._cursor_row > row:
+            out.append(f'\033[{self._cursor_row - row}A')
+        out.append('\r')
+        if col:
+            out.append(f'\033[{col}C')
+        out.append('\033[J')
+        start = p
+        for i in range(p, len(text)):
+            w = char_width(text[i])
+            if col + w > self.width:
+                out.append(text[start:i])
+                out.append('\n')
+                row += 1
+                self._rows.append(i)
+                start = i
+                col = 0
+            col += w
+        out.append(text[start:])
+        self._cursor_row = row
+        self.text = text
+        self.draws += 1
+        self._write(''.join(out))
+
+    def flush(self):
+        """間引いたテキストがあれば表示する"""
+        if self._pending is not None and self.tty and not self.quiet:
+            self._draw(self._pending)
+            self._last_draw = time.monotonic()
+
+    def commit(self):
+        """発話を確定し、次の発話は新しい行に表示する"""
+        if self.quiet:
+            return
+        if self.tty:
+            self.flush()
+            if self.text:
+                self._write('\n')
+        else:
+            text = self._pending if self._pending is not None else self.text
+            if text:
+                self._write(text + '\n')
+        self._reset()
+
+    def print_block(self, title, text):
+        """見出し付きのテキストを表示し、途中の発話があればその下に表示し直す（text が None なら見出しだけ）"""
+        current = self._pending if self._pending is not None else self.text
+        if self.tty and self.text:
+            self._write('\n')
+        self._reset()
+        lines = wrap(text or "", self.width)
+        self._write(f"\n=== {title} ===\n" + ''.join(line + '\n' for line in lines) + "===========\n\n")
+        if current and not self.quiet:
+            self.update(current, force=True)
+
+    def close(self):
+        """表示中の発話を確定して終了する"""
+        self.commit()
+
+    def report(self):
+        """統計情報を表示用の文字列にする"""
+        return f"表示: 描画 {self.draws}回, 間引き {self.skipped}回, 出力 {self.written}文字"
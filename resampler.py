@@ -0,0 +1,158 @@
+"""
+ストリーミング用のポリフェーズリサンプラ
+
+ファイル全体を librosa.resample に渡す代わりに、チャンク単位で状態を持ちながら
+リサンプリングし、Speech2TextStreaming に逐次供給する。
+フィルタ係数は初期化時にポリフェーズ形式で一度だけ計算する。
+"""
+import math
+import numpy as np
+
+# モデルが想定するサンプリングレート
+TARGET_SAMPLE_RATE = 16000
+
+
+def downmix(chunk):
+    """
+    (フレーム数, チャンネル数) の配列をモノラルに変換する（1次元の配列はそのまま返す）
+    """
+    if chunk.ndim == 1:
+        return chunk
+    if chunk.shape[1] == 1:
+        return chunk[:, 0]
+    return chunk.mean(axis=1, dtype=np.float32)
+
+
+class StreamingResampler:
+    """
+    状態付きのポリフェーズ FIR リサンプラ
+    ・up/down は orig_sr と target_sr の比を既約分数にしたもの
+    ・カイザー窓付き sinc のローパスフィルタを位相ごとに分解して保持する
+    ・process() に渡したチャンクの境界をまたいでも、一括で処理した場合と同じ出力になる
+    ・複数チャンネルの入力はモノラルにダウンミックスしてから処理する
+    """
+
+    def __init__(self, orig_sr, target_sr=TARGET_SAMPLE_RATE, num_zeros=16, rolloff=0.945, beta=8.6):
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+        g = math.gcd(orig_sr, target_sr)
+        self.up = target_sr // g
+        self.down = orig_sr // g
+
+        # アップサンプル後の領域でのカットオフ周波数（サイクル/サンプル）
+        cutoff = rolloff / (2 * max(self.up, self.down))
+        # フィルタの片側長（ゼロ交差 num_zeros 個分）
+        self.half_len = int(math.ceil(num_zeros / (2 * cutoff)))
+        k = np.arange(-self.half_len, self.half_len + 1, dtype=np.float64)
+        h = 2 * cutoff * np.sinc(2 * cutoff * k) * np.kaiser(len(k), beta) * self.up
+
+        # h[p + j*up] を (位相 p, タップ j) の表に並べ替える
+        self.taps = int(math.ceil(len(h) / self.up))
+        padded = np.zeros(self.taps * self.up)
+        padded[:len(h)] = h
+        self.bank = padded.reshape(self.taps, self.up).T.astype(np.float32)
+        self._tap_index = np.arange(self.taps)
+        self.reset()
+
+    @property
+    def passthrough(self):
+        """リサンプリングが不要かどうか"""
+        return self.up == self.down
+
+    def reset(self):
+        """ストリームの状態を初期化する"""
+        # 直前の入力サンプル（taps-1 個、先頭はゼロ埋め）
+        self.history = np.zeros(self.taps - 1, dtype=np.float32)
+        self.in_count = 0
+        self.out_count = 0
+
+    def output_length(self, n):
+        """入力 n サンプルに対する出力サンプル数"""
+        if self.passthrough:
+            return n
+        return -(-n * self.up // self.down)
+
+    def _produce(self, x, limit=None):
+        """
+        現在までの入力で計算可能な出力（limit 指定時は最大 limit 個）を計算する
+        """
+        # 出力 m はアップサンプル領域の位置 n = m*down + half_len に対応し、入力 n//up までを参照する
+        m_end = (self.in_count * self.up - self.half_len - 1) // self.down + 1
+        if limit is not None:
+            m_end = min(m_end, limit)
+        if m_end <= self.out_count:
+            return np.zeros(0, dtype=np.float32)
+        n = np.arange(self.out_count, m_end, dtype=np.int64) * self.down + self.half_len
+        phase = n % self.up
+        base = n // self.up - (self.in_count - len(x))
+        window = x[base[:, None] - self._tap_index[None, :]]
+        out = np.einsum('ij,ij->i', window, self.bank[phase])
+        self.out_count = m_end
+        return out
+
+    def process(self, chunk):
+        """
+        チャンクを入力し、この時点で確定した出力を返す
+        """
+        chunk = downmix(np.asarray(chunk, dtype=np.float32))
+        if self.passthrough:
+            self.in_count += len(chunk)
+            self.out_count += len(chunk)
+            return chunk
+        x = np.concatenate([self.history, chunk])
+        self.in_count += len(chunk)
+        out = self._produce(x)
+        self.history = x[len(x) - (self.taps - 1):]
+        return out
+
+    def flush(self):
+        """
+        末尾をゼロ埋めして残りの出力を返し、状態を初期化する
+        """
+        if self.passthrough:
+            self.reset()
+            return np.zeros(0, dtype=np.float32)
+        expected = self.output_length(self.in_count)
+        pad = self.half_len // self.up + 2
+        x = np.concatenate([self.history, np.zeros(pad, dtype=np.float32)])
+        total_in = self.in_count
+        self.in_count += pad
+        out = self._produce(x, expected)
+        self.in_count = total_in
+        self.reset()
+        return out
+
+    def resample_chunks(self, chunks, chunk_size):
+        """
+        (先頭位置, チャンク) の列をリサンプリングし、chunk_size ごとに区切り直して返す
+        ・位置は出力側のサンプル数で数える
+        ・最後のチャンクは chunk_size より短いことがある
+        """
+        self.reset()
+        pending = []
+        pending_len = 0
+        offset = 0
+        for _, chunk in chunks:
+            out = self.process(chunk)
+            if len(out) == 0:
+                continue
+            pending.append(out)
+            pending_len += len(out)
+            if pending_len < chunk_size:
+                continue
+            buf = np.concatenate(pending) if len(pending) > 1 else pending[0]
+            n = (pending_len // chunk_size) * chunk_size
+            for start in range(0, n, chunk_size):
+                yield offset, buf[start:start + chunk_size]
+                offset += chunk_size
+            pending = [buf[n:]] if n < pending_len else []
+            pending_len -= n
+        tail = self.flush()
+        if len(tail):
+            pending.append(tail)
+            pending_len += len(tail)
+        if pending_len:
+            buf = np.concatenate(pending) if len(pending) > 1 else pending[0]
+            for start in range(0, pending_len, chunk_size):
+                yield offset, buf[start:start + chunk_size]
+                offset += len(buf[start:start + chunk_size])
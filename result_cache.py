@@ -0,0 +1,221 @@
+"""
+文字起こし結果のキャッシュ（音声の内容をキーにする）
+
+同じ録音が別の名前で何度も入力されても、デコードをやり直さずに前回の結果を返す。
+キーは次の値から作る。
+・モデルに入力する音声（16kHz・モノラルに変換し、16 ビットに量子化したもの）のハッシュ。
+  WAV のヘッダやメタデータ、ファイル名のほか、コンテナの形式（WAV / FLAC など）や
+  モノラルを複数チャンネルに複製しただけの違いがあっても、モデルへの入力が同じなら同じキーになる。
+  ほかのツールでサンプリングレートを変換したファイルは入力が一致しないため別のキーになる。
+  音声はブロックごとに変換してハッシュに流し込むため、ファイル全体を読み込まない
+・モデルのタグとデコードの設定（結果が変わる項目だけ。スレッド数などは含めない）
+
+結果は1件1つの JSON ファイルとしてキャッシュのディレクトリに保存する。読み出すたびに
+更新時刻を新しくし、合計サイズが上限を超えたら更新時刻の古いものから削除する（LRU）。
+
+・環境変数 ASR_RESULT_CACHE: キャッシュの場所（既定: ~/.cache/asr-espnet/results。'0' で無効）
+・環境変数 ASR_RESULT_CACHE_MB: キャッシュの合計サイズの上限（MB。既定: 1024）
+"""
+import os
+import json
+import time
+import hashlib
+from audio_source import to_pcm16
+from resampler import StreamingResampler, TARGET_SAMPLE_RATE
+
+RESULT_CACHE = os.environ.get('ASR_RESULT_CACHE',
+                              os.path.join(os.path.expanduser('~'), '.cache', 'asr-espnet', 'results'))
+RESULT_CACHE_MB = float(os.environ.get('ASR_RESULT_CACHE_MB', '1024'))
+# ハッシュを計算するときに一度に読むフレーム数
+HASH_BLOCK_FRAMES = 1 << 20
+# 書き込み途中で終了したとみなす一時ファイルの経過時間（秒）
+STALE_TMP_SECONDS = 3600
+# デコードの設定のうち、結果に影響しない項目（キーに含めない）
+IGNORED_OPTIONS = ('device', 'threads', 'interop_threads')
+
+
+def pcm_digest(wav, block_frames=HASH_BLOCK_FRAMES):
+    """
+    開いた音声（audio_io.MappedWav / ArrayWav）をモデルに入力する形にしたもののハッシュ
+    ・16kHz・モノラルに変換して 16 ビットに量子化してから流し込む（変換の丸め誤差でキーが変わらないようにする）
+    ・ブロックごとに読み込んで変換するため、メモリはブロックの分しか使わない
+    """
+    h = hashlib.sha256()
+    h.update(f"pcm16:{TARGET_SAMPLE_RATE}:1:".encode('ascii'))
+    resampler = StreamingResampler(wav.rate, TARGET_SAMPLE_RATE)
+    for start in range(0, wav.nframes, block_frames):
+        h.update(to_pcm16(resampler.process(wav.read(start, start + block_frames))).tobytes())
+    h.update(to_pcm16(resampler.flush()).tobytes())
+    return h.hexdigest()
+
+
+def decoding_options(config=None, **extra):
+    """
+    キーに含めるデコードの設定
+    ・config は asr_config.InferenceConfig（結果に影響しない項目は除く）
+    ・extra には VAD の有無やチャンク長など、スクリプトごとの設定を渡す
+    """
+    options = {}
+    if config is not None:
+        options.update({k: v for k, v in config._asdict().items() if k not in IGNORED_OPTIONS})
+    options.update(extra)
+    return options
+
+
+class ResultCache:
+    """
+    文字起こし結果のディスクキャッシュ（合計サイズを上限とする LRU）
+    ・key() でキーを作り、get() / put() で結果（JSON にできる辞書）を読み書きする
+    ・cache_dir が空か '0' の場合は何も保存しない（get() は常に None）
+    """
+
+    def __init__(self, cache_dir=RESULT_CACHE, max_mb=RESULT_CACHE_MB):
+        self.cache_dir = cache_dir if cache_dir not in ('', '0') else None
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._size = None
+        # 統計情報
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.hashed_bytes = 0
+        self.hash_seconds = 0.0
+
+    @property
+    def enabled(self):
+        return self.cache_dir is not None
+
+    def key(self, wav, model, options):
+        """音声の内容・モデル・デコードの設定からキーを作る"""
+        start = time.perf_counter()
+        digest = pcm_digest(wav)
+        self.hash_seconds += time.perf_counter() - start
+        self.hashed_bytes += wav.pcm.nbytes if wav.pcm is not None else 0
+        payload = json.dumps({'pcm': digest, 'model': model, 'options': options}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """キャッシュされた結果を返す（なければ None）。読み出した結果は最近使ったものとして扱う"""
+        if not self.enabled or key is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return record
+
+    def put(self, key, record):
+        """結果を保存し、合計サイズが上限を超えていれば古いものから削除する"""
+        if not self.enabled or key is None:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        old = os.path.getsize(path) if os.path.exists(path) else 0
+        # 一時ファイルに書き込んでから置き換えるため、同時に読んでいるプロセスが壊れた結果を読まない
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self.stores += 1
+        if self._size is None:
+            self._size = self._scan_size()
+        else:
+            self._size += os.path.getsize(path) - old
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def update(self, key, **fields):
+        """保存済みの結果に項目を追加する（要約を後から加える場合など）"""
+        record = self.peek(key)
+        if record is not None:
+            record.update(fields)
+            self.put(key, record)
+
+    def peek(self, key):
+        """統計と更新時刻を変えずに結果を読む"""
+        if not self.enabled or key is None:
+            return None
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _entries(self):
+        """
+        (更新時刻, サイズ, パス) のリスト
+        ・書き込み途中で終了したプロセスが残した一時ファイルは、十分に古ければ削除する
+        """
+        entries = []
+        now = time.time()
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(('.json', '.tmp')):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                    if name.endswith('.tmp'):
+                        if now - st.st_mtime > STALE_TMP_SECONDS:
+                            os.remove(path)
+                        continue
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """更新時刻の古いものから、合計サイズが上限以下になるまで削除する"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        self._size = total
+
+    def report(self):
+        """統計情報を表示用の文字列にする"""
+        if not self.enabled:
+            return "結果のキャッシュ: 無効"
+        lookups = self.hits + self.misses
+        ratio = self.hits / lookups * 100 if lookups else 0.0
+        size = self._size if self._size is not None else self._scan_size()
+        return (f"結果のキャッシュ: 命中 {self.hits}件 / 未命中 {self.misses}件 ({ratio:.1f}%),"
+                f" 保存 {self.stores}件, 削除 {self.evictions}件, 合計 {size / 1024 / 1024:.1f}MB"
+                f" (上限 {self.max_bytes / 1024 / 1024:.0f}MB), ハッシュ {self.hashed_bytes / 1024 / 1024:.1f}MB"
+                f" / {self.hash_seconds:.2f}秒")
+
+
+def add_arguments(parser):
+    """結果のキャッシュのコマンドライン引数を追加する（既定値は環境変数から取る）"""
+    group = parser.add_argument_group("結果のキャッシュ")
+    group.add_argument('--no-cache', action='store_true',
+                       help="結果のキャッシュを使わない（読み出しも保存もしない）")
+    group.add_argument('--cache-dir', default=RESULT_CACHE, help="結果のキャッシュの場所")
+    group.add_argument('--cache-mb', type=float, default=RESULT_CACHE_MB, help="結果のキャッシュの合計サイズの上限（MB）")
+    return group
+
+
+def from_args(args):
+    """add_arguments() で追加した引数から ResultCache を作る"""
+    return ResultCache(None if args.no_cache else args.cache_dir, args.cache_mb)
@@ -0,0 +1,76 @@
+"""
+長い音声ファイルを無音の位置で区間に分ける
+
+オフラインの並列デコード用。ファイル全体のフレームごとのエネルギーを一度だけ計算し
+（メモリマップした int16 の PCM をブロックごとに読むだけで、モデルは使わない）、
+およそ target 秒ごとに、その前後で最も静かな位置を区切りにする。区切りは無音の中に置くため、
+各区間は独立したストリーミングデコーダでデコードしても発話の途中で切れにくい。
+"""
+from collections import namedtuple
+import numpy as np
+
+# 区間（start / end は入力ファイルのフレーム位置）
+Span = namedtuple('Span', ['start', 'end'])
+
+# エネルギーを計算するフレームの長さ（秒）
+FRAME_SECONDS = 0.02
+# 区切りの候補とする静かな区間の長さ（秒）。この長さの平均エネルギーが最も小さい位置で区切る
+MIN_SILENCE = 0.3
+# 一度に読み込むフレーム数（メモリの使用量を抑える）
+BLOCK_FRAMES = 1 << 20
+
+
+def frame_energy_db(wav, frame_seconds=FRAME_SECONDS):
+    """
+    フレームごとの平均パワー（dB）を返す
+    ・複数チャンネルの場合はチャンネルの平均で計算する
+    """
+    frame = max(1, int(wav.rate * frame_seconds))
+    nframes = wav.nframes // frame
+    energies = np.empty(nframes, dtype=np.float32)
+    block = max(frame, BLOCK_FRAMES // frame * frame)
+    for start in range(0, nframes * frame, block):
+        end = min(start + block, nframes * frame)
+        x = wav.pcm[start:end].astype(np.float32)
+        if x.ndim > 1:
+            x = x.mean(axis=1)
+        x = x.reshape(-1, frame)
+        power = np.einsum('ij,ij->i', x, x) / frame
+        energies[start // frame:end // frame] = 10.0 * np.log10(power / 32768.0 ** 2 + 1e-10)
+    return energies, frame
+
+
+def find_cuts(energies, target, min_silence):
+    """
+    フレーム単位のエネルギーから区切りのフレーム番号を選ぶ
+    ・前の区切りから target / 2 〜 target * 3 / 2 の範囲で、min_silence フレームの平均エネルギーが
+      最も小さい位置の中央を区切りにする
+    """
+    n = len(energies)
+    width = max(1, min_silence)
+    # 移動平均（累積和で計算する）
+    cumsum = np.concatenate([[0.0], np.cumsum(energies, dtype=np.float64)])
+    smoothed = (cumsum[width:] - cumsum[:-width]) / width
+    cuts = []
+    prev = 0
+    while n - prev > target * 3 // 2:
+        lo = prev + max(1, target // 2)
+        hi = min(prev + target * 3 // 2, len(smoothed))
+        if hi <= lo:
+            break
+        cut = lo + int(np.argmin(smoothed[lo:hi])) + width // 2
+        cuts.append(cut)
+        prev = cut
+    return cuts
+
+
+def split_at_silence(wav, target_seconds=60.0, min_silence=MIN_SILENCE, frame_seconds=FRAME_SECONDS):
+    """
+    音声ファイルを無音の位置でおよそ target_seconds 秒ごとの区間に分け、Span のリストを返す
+    ・target_seconds の 1.5 倍より短いファイルは分けない
+    """
+    energies, frame = frame_energy_db(wav, frame_seconds)
+    target = max(1, int(target_seconds / frame_seconds))
+    cuts = find_cuts(energies, target, max(1, int(min_silence / frame_seconds)))
+    bounds = [0] + [cut * frame for cut in cuts] + [wav.nframes]
+    return [Span(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
@@ -0,0 +1,58 @@
+"""
+音声認識サーバとクライアントの間の TCP フレームプロトコル
+
+1フレームは「種別(1バイト) + ペイロード長(4バイト, ビッグエンディアン) + ペイロード」。
+
+クライアント → サーバ
+・START (b'S'): セッション開始。ペイロードは JSON（{"rate": 16000} など、省略可）
+・AUDIO (b'A'): 16kHz・モノラル・16ビット PCM（リトルエンディアン）
+・END   (b'E'): 入力の終わり。サーバは最終結果を返してセッションを閉じる
+
+サーバ → クライアント
+・PARTIAL (b'P'): 途中結果 {"text": ..., "latency_ms": ...}
+・FINAL   (b'F'): 最終結果 {"text": ..., "metrics": {...}}
+・ERROR   (b'X'): エラー {"error": ...}（セッション数の上限を超えた場合など）
+"""
+import json
+import struct
+
+START = b'S'
+AUDIO = b'A'
+END = b'E'
+PARTIAL = b'P'
+FINAL = b'F'
+ERROR = b'X'
+
+_HEADER = struct.Struct('>cI')
+# 1フレームのペイロードの上限（不正なデータでメモリを使い果たさないため）
+MAX_PAYLOAD = 1 << 22
+
+
+class ProtocolError(Exception):
+    """プロトコル違反"""
+
+
+async def read_frame(reader):
+    """
+    フレームを1つ読み込み、(種別, ペイロード) を返す
+    ・接続が閉じられた場合は (None, b'') を返す
+    """
+    try:
+        header = await reader.readexactly(_HEADER.size)
+    except EOFError:
+        return None, b''
+    kind, length = _HEADER.unpack(header)
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"ペイロードが大きすぎます: {length}バイト")
+    payload = await reader.readexactly(length) if length else b''
+    return kind, payload
+
+
+def pack_frame(kind, payload=b''):
+    """フレームをバイト列にする"""
+    return _HEADER.pack(kind, len(payload)) + payload
+
+
+def pack_json(kind, obj):
+    """JSON ペイロードのフレームをバイト列にする"""
+    return pack_frame(kind, json.dumps(obj, ensure_ascii=False).encode('utf-8'))
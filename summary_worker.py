@@ -0,0 +1,90 @@
+"""
+要約をバックグラウンドで実行するためのワーカー
+
+要約モデルの推論は数秒かかるため、音声認識のループから切り離して別スレッドで実行する。
+要約が追いつかない場合は、未処理のテキストを結合して 1 回の要約にまとめる。
+文字起こし全体を要約し直す場合（latest_only=True）は、未処理のものを最新のテキストで置き換える。
+"""
+import time
+import threading
+from collections import deque
+
+
+class SummaryWorker:
+    """
+    要約関数をバックグラウンドスレッドで実行する
+    ・submit() はブロックせずにテキストを登録する
+    ・未処理のテキストは最大 max_pending 件まで保持し、それを超えた分は最後の件に結合する
+    ・latest_only=True の場合は結合せず、最後の件を新しいテキストで置き換える
+    ・結果は poll() で（呼び出し側のスレッドから）受け取る
+    """
+
+    def __init__(self, summarize, max_pending=1, latest_only=False):
+        self.summarize = summarize
+        self.max_pending = max(1, max_pending)
+        self.latest_only = latest_only
+        self._pending = deque()
+        self._results = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        # 統計情報
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name='summary-worker', daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        """要約するテキストを登録する"""
+        with self._cond:
+            self.submitted += 1
+            if len(self._pending) >= self.max_pending:
+                # 要約が追いついていないので、まだ処理していないテキストにまとめる
+                if self.latest_only:
+                    self._pending[-1] = text
+                else:
+                    self._pending[-1] += text
+                self.coalesced += 1
+            else:
+                self._pending.append(text)
+            self._cond.notify()
+
+    def poll(self):
+        """完了した要約を古い順にすべて返す"""
+        results = []
+        while self._results:
+            results.append(self._results.popleft())
+        return results
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                text = self._pending.popleft()
+            start = time.perf_counter()
+            summary = self.summarize(text)
+            self.busy_seconds += time.perf_counter() - start
+            self._results.append(summary)
+            self.completed += 1
+
+    def close(self, wait=True):
+        """
+        ワーカーを終了する
+        ・wait=True の場合は登録済みのテキストをすべて要約し終えるまで待つ
+        """
+        with self._cond:
+            if not wait:
+                self._pending.clear()
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            self._thread.join()
+
+    def report(self):
+        """統計情報を表示用の文字列にする"""
+        return (f"要約: 登録 {self.submitted}件, 完了 {self.completed}件,"
+                f" 結合 {self.coalesced}件, 処理時間 {self.busy_seconds:.1f}秒")
@@ -0,0 +1,108 @@
+"""
+ストリーミング認識の途中結果から文字起こしを組み立てるモジュール
+
+Speech2TextStreaming の途中結果（is_final=False）は、その発話の先頭からの仮説全体である。
+これを毎回連結すると同じテキストが何度も重複するため、ここでは
+・直近の仮説で変化しなくなった先頭部分を「安定」とみなして確定テキストに追加し
+・is_final=True の結果を発話区間（タイムスタンプ付き）として確定させる
+ことで、新しく確定した部分だけを要約などの後段に渡す。
+"""
+import os
+from collections import deque, namedtuple
+
+# 確定した発話区間（start/end は音声の先頭からの秒数）
+Segment = namedtuple('Segment', ['start', 'end', 'text'])
+
+
+class TranscriptState:
+    """
+    途中結果と確定結果から文字起こしの状態を管理する
+    ・update(): 途中結果の仮説を渡す。直近 stability 回の仮説に共通する先頭部分を確定扱いにする
+    ・finalize(): is_final=True の結果を渡し、発話区間として確定させる
+    ・take_new(): 前回の呼び出し以降に確定したテキストだけを返す
+    ・一度確定扱いにしたテキストは、後で仮説が変わっても取り消さない
+    """
+
+    def __init__(self, stability=3):
+        self.segments = []
+        self.partial = ""
+        self._history = deque(maxlen=max(1, stability))
+        # 現在の発話のうち確定扱いにしたテキスト
+        self._committed = ""
+        # take_new() でまだ返していない確定テキスト
+        self._new = []
+        self._segment_start = None
+        self._last_time = 0.0
+
+    def _commit(self, text):
+        if text:
+            self._committed += text
+            self._new.append(text)
+
+    def update(self, text, time):
+        """
+        途中結果の仮説を反映する
+        ・time はこのチャンクの末尾の時刻（秒）
+        """
+        if text and self._segment_start is None:
+            self._segment_start = self._last_time
+        self._last_time = time
+        self.partial = text
+        self._history.append(text)
+        if len(self._history) < self._history.maxlen:
+            return
+        stable = os.path.commonprefix(list(self._history))
+        if len(stable) > len(self._committed) and stable.startswith(self._committed):
+            self._commit(stable[len(self._committed):])
+
+    def finalize(self, text, time):
+        """
+        is_final=True の結果で現在の発話を確定させ、確定した区間を返す（空の場合は None）
+        """
+        start = self._segment_start if self._segment_start is not None else self._last_time
+        # 確定扱いにした部分と食い違う場合は、共通部分より後ろだけを追加する
+        self._commit(text[len(os.path.commonprefix([text, self._committed])):])
+        segment = Segment(start, time, text) if text else None
+        if segment is not None:
+            self.segments.append(segment)
+        self.partial = ""
+        self._history.clear()
+        self._committed = ""
+        self._segment_start = None
+        self._last_time = time
+        return segment
+
+    def take_new(self):
+        """前回の呼び出し以降に確定したテキストを返す"""
+        if not self._new:
+            return ""
+        text = "".join(self._new)
+        self._new.clear()
+        return text
+
+    @property
+    def finalized_text(self):
+        """確定した発話区間のテキストを連結したもの"""
+        return "".join(segment.text for segment in self.segments)
+
+    @property
+    def text(self):
+        """確定した区間と現在の途中結果を連結したもの"""
+        return self.finalized_text + self.partial
+
+    def restore(self, segments, time=None):
+        """
+        チェックポイントなどから確定済みの区間を復元する
+        ・segments は Segment または (start, end, text) の列
+        """
+        self.segments = [Segment(*segment) for segment in segments]
+        if time is None:
+            time = self.segments[-1].end if self.segments else 0.0
+        self._last_time = time
+
+
+def format_time(seconds):
+    """秒数を hh:mm:ss.ss 形式にする"""
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:05.2f}"
@@ -0,0 +1,198 @@
+"""
+エネルギーベースの簡易な音声区間検出（VAD）
+
+Speech2TextStreaming の前段に置き、無音のチャンクはデコーダに渡さずに読み飛ばす。
+発話が終わった（無音が一定時間続いた）ところで is_final=True を指示し、
+デコーダの状態を発話ごとにリセットさせる。
+
+話し続けて無音が来ない場合でも、デコーダの状態（エンコーダ出力とビームの仮説）が
+際限なく伸びないように、発話の長さが max_utterance 秒を超えたら短い息継ぎで区切り、
+その 1.5 倍を超えたら発話の途中でも区切る（環境変数 ASR_MAX_UTTERANCE で変更、0 で無効）。
+VAD を使わない場合は Endpointer で同じ長さの制限だけをかける。
+"""
+import os
+from collections import deque
+import numpy as np
+
+# 1つの発話の長さの上限（秒）。0 以下なら制限しない
+MAX_UTTERANCE = float(os.environ.get('ASR_MAX_UTTERANCE', '20'))
+# 発話の途中でも区切る長さ（max_utterance に対する比）
+HARD_LIMIT_RATIO = 1.5
+
+
+class EnergyVAD:
+    """
+    チャンクごとの短時間エネルギーと、無音区間で追従する雑音レベルから発話を判定する
+    ・エネルギーが 雑音レベル + threshold_db を超え、かつ min_speech_db 以上なら発話とみなす
+    ・発話後も hangover 秒は発話が続いているものとして扱い、語尾が切れないようにする
+    ・発話の開始時には直前 preroll 秒分のチャンクもまとめて渡し、語頭が欠けないようにする
+    ・発話が max_utterance 秒を超えたら、hangover を待たずに次の無音のチャンクで区切る
+    """
+
+    def __init__(self, rate=16000, threshold_db=9.0, min_speech_db=-50.0, hangover=0.5, preroll=0.2,
+                 noise_adapt=0.05, max_utterance=MAX_UTTERANCE):
+        self.rate = rate
+        self.threshold_db = threshold_db
+        self.min_speech_db = min_speech_db
+        self.hangover = hangover
+        self.preroll = preroll
+        self.noise_adapt = noise_adapt
+        self.max_utterance = max_utterance
+        self.noise_db = None
+        self.in_speech = False
+        self._silence = 0.0
+        self._utterance = 0.0
+        self._preroll = deque()
+        self._preroll_len = 0
+        # 統計情報
+        self.total_samples = 0
+        self.skipped_samples = 0
+        self.utterances = 0
+        self.forced_endpoints = 0
+
+    @staticmethod
+    def energy_db(chunk):
+        """チャンクの平均パワー（dB）"""
+        x = np.asarray(chunk, dtype=np.float32)
+        return 10.0 * np.log10(float(np.dot(x, x)) / len(x) + 1e-10)
+
+    def is_speech(self, chunk):
+        """
+        チャンクが発話かどうかを判定し、無音なら雑音レベルを更新する
+        """
+        energy = self.energy_db(chunk)
+        if self.noise_db is None:
+            self.noise_db = min(energy, self.min_speech_db)
+        speech = energy >= self.min_speech_db and energy > self.noise_db + self.threshold_db
+        if not speech:
+            # 雑音レベルは下がる方向にはすぐ、上がる方向にはゆっくり追従する
+            if energy < self.noise_db:
+                self.noise_db = energy
+            else:
+                self.noise_db += (energy - self.noise_db) * self.noise_adapt
+        return speech
+
+    def reset(self):
+        """発話の途中状態を破棄する（雑音レベルは保持する）"""
+        self.in_speech = False
+        self._silence = 0.0
+        self._utterance = 0.0
+        self._preroll.clear()
+        self._preroll_len = 0
+
+    def gate(self, chunk, is_last=False):
+        """
+        チャンクをデコーダに渡すかどうかを決める
+        ・(デコーダに渡す音声, is_final) を返す。音声が None の場合はデコードを省略する
+        ・is_last=True（入力の終わりや区切り）の場合、発話中なら is_final=True を返す
+        """
+        n = len(chunk)
+        if n == 0:
+            return None, False
+        self.total_samples += n
+        duration = n / self.rate
+
+        speech = self.is_speech(chunk)
+        if self.in_speech:
+            self._utterance += duration
+            if self.max_utterance > 0 and not is_last and (
+                    (not speech and self._utterance >= self.max_utterance)
+                    or self._utterance >= self.max_utterance * HARD_LIMIT_RATIO):
+                # 長すぎる発話: 息継ぎ（または上限）の位置で区切り、デコーダの状態を伸ばし続けない
+                self.forced_endpoints += 1
+                self.reset()
+                return chunk, True
+
+        if speech:
+            self._silence = 0.0
+            if not self.in_speech:
+                # 発話の開始: 直前の無音チャンクも一緒に渡す
+                self.in_speech = True
+                self.utterances += 1
+                if self._preroll:
+                    self.skipped_samples -= self._preroll_len
+                    chunk = np.concatenate(list(self._preroll) + [chunk])
+                    self._preroll.clear()
+                    self._preroll_len = 0
+            if is_last:
+                self.reset()
+            return chunk, is_last
+
+        if self.in_speech:
+            self._silence += duration
+            # 無音が hangover 秒続いたら発話の終わりとする
+            if self._silence >= self.hangover or is_last:
+                self.reset()
+                return chunk, True
+            return chunk, False
+
+        # 発話外の無音: デコードせず、語頭用に直近の分だけ保持する
+        self.skipped_samples += n
+        # 呼び出し側がバッファを使い回しても壊れないようにコピーして保持する
+        self._preroll.append(np.array(chunk))
+        self._preroll_len += n
+        while self._preroll and self._preroll_len - len(self._preroll[0]) >= self.preroll * self.rate:
+            self._preroll_len -= len(self._preroll.popleft())
+        return None, False
+
+    def report(self):
+        """読み飛ばした音声の割合を表示用の文字列にする"""
+        total = self.total_samples / self.rate
+        skipped = self.skipped_samples / self.rate
+        ratio = skipped / total * 100 if total else 0.0
+        return (f"VAD: 発話 {self.utterances}区間 (長さの上限で区切った数 {self.forced_endpoints}),"
+                f" 無音としてデコードを省略 {skipped:.1f}秒 / {total:.1f}秒 ({ratio:.1f}%)")
+
+
+class Endpointer:
+    """
+    VAD を使わない場合に、発話の長さだけで区切りを決める（EnergyVAD と同じ gate() の呼び出し方）
+    ・すべてのチャンクをデコーダに渡し、max_utterance 秒を超えたら、その発話の中で最も静かなチャンクに
+      近い（threshold_db 以内の）チャンクで is_final=True を返す
+    ・静かなチャンクが来なくても max_utterance の 1.5 倍で区切る
+    """
+
+    def __init__(self, rate=16000, max_utterance=MAX_UTTERANCE, threshold_db=6.0):
+        self.rate = rate
+        self.max_utterance = max_utterance
+        self.threshold_db = threshold_db
+        self.in_speech = False
+        self._utterance = 0.0
+        self._quietest = None
+        # 統計情報
+        self.total_samples = 0
+        self.skipped_samples = 0
+        self.utterances = 0
+
+    def reset(self):
+        """発話の途中状態を破棄する"""
+        self.in_speech = False
+        self._utterance = 0.0
+        self._quietest = None
+
+    def gate(self, chunk, is_last=False):
+        """
+        チャンクをそのまま返し、発話を区切る位置では is_final=True を返す
+        """
+        n = len(chunk)
+        if n == 0:
+            return None, False
+        self.total_samples += n
+        if not self.in_speech:
+            self.in_speech = True
+            self.utterances += 1
+        self._utterance += n / self.rate
+        energy = EnergyVAD.energy_db(chunk)
+        quiet = self._quietest is not None and energy <= self._quietest + self.threshold_db
+        self._quietest = energy if self._quietest is None else min(self._quietest, energy)
+        if is_last or (self.max_utterance > 0 and (
+                (quiet and self._utterance >= self.max_utterance)
+                or self._utterance >= self.max_utterance * HARD_LIMIT_RATIO)):
+            self.reset()
+            return chunk, True
+        return chunk, False
+
+    def report(self):
+        """区切った発話の数を表示用の文字列にする"""
+        return (f"発話の区切り: {self.utterances}区間 (上限 {self.max_utterance:g}秒),"
+                f" 音声 {self.total_samples / self.rate:.1f}秒")